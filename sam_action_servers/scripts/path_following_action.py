@@ -0,0 +1,287 @@
+#! /usr/bin/env python
+
+# Follows a whole path of waypoints in one goal, instead of one goal per waypoint.
+# The path is read from a nav_msgs/Path topic (x,y in the path frame, z as travel depth)
+# and the GotoWaypoint goal gives the last waypoint of the path along with
+# the speed/rpm and tolerance to use for all of it.
+# The path and the goal are matched by their stamps, a goal whose path has not
+# arrived yet waits for it for a while and is aborted if it never comes.
+# The index of the waypoint being followed is published with the stamp of the
+# path, so the client can tell it apart from the indices of an earlier path.
+
+from __future__ import division, print_function
+
+import math
+import time
+
+import rospy
+import tf
+from nav_msgs.msg import Path
+from smarc_msgs.msg import GotoWaypointResult, FloatStamped
+
+from wp_depth_action_planner import WPDepthPlanner
+
+
+class LOSGuidance(object):
+    '''
+    Line-of-sight guidance along a list of (x, y, depth) waypoints.
+    Fossen, Page 261 eq 10.73,10.74 applied to each leg of the path.
+    The target waypoint is switched when the vehicle is inside the circle of acceptance
+    or has passed the perpendicular line at the end of the current leg.
+    '''
+    def __init__(self, waypoints, start_x, start_y, lookahead, acceptance_radius):
+        self.waypoints = waypoints
+        self.start = (start_x, start_y)
+        self.lookahead = lookahead
+        self.acceptance_radius = acceptance_radius
+        self.index = 0
+
+        # remaining_lengths[i] = length of the path from waypoint i to the end
+        self.remaining_lengths = [0.] * len(waypoints)
+        for i in range(len(waypoints)-2, -1, -1):
+            x0, y0, _ = waypoints[i]
+            x1, y1, _ = waypoints[i+1]
+            self.remaining_lengths[i] = self.remaining_lengths[i+1] + math.hypot(x1-x0, y1-y0)
+
+    def is_done(self):
+        return self.index >= len(self.waypoints)
+
+    def leg(self):
+        if self.index == 0:
+            prev_x, prev_y = self.start
+        else:
+            prev_x, prev_y, _ = self.waypoints[self.index-1]
+        target_x, target_y, _ = self.waypoints[self.index]
+        return prev_x, prev_y, target_x, target_y
+
+    def update(self, x, y):
+        '''
+        Switch to the next waypoints as long as the current one is reached.
+        returns True if the index changed.
+        '''
+        start_index = self.index
+        while not self.is_done():
+            prev_x, prev_y, target_x, target_y = self.leg()
+            dist = math.hypot(target_x - x, target_y - y)
+            leg_len = math.hypot(target_x - prev_x, target_y - prev_y)
+            if leg_len > 0:
+                along = ((x - prev_x)*(target_x - prev_x) + (y - prev_y)*(target_y - prev_y)) / leg_len
+            else:
+                along = 0
+
+            if dist < self.acceptance_radius or (leg_len > 0 and along >= leg_len):
+                self.index += 1
+            else:
+                break
+        return self.index != start_index
+
+    def yaw_setpoint(self, x, y):
+        prev_x, prev_y, target_x, target_y = self.leg()
+        path_angle = math.atan2(target_y - prev_y, target_x - prev_x)
+        crosstrack = -(x - prev_x)*math.sin(path_angle) + (y - prev_y)*math.cos(path_angle)
+        return path_angle + math.atan2(-crosstrack, self.lookahead)
+
+    def depth_setpoint(self):
+        return self.waypoints[self.index][2]
+
+    def distance_to_target(self, x, y):
+        target_x, target_y, _ = self.waypoints[self.index]
+        return math.hypot(target_x - x, target_y - y)
+
+    def remaining_distance(self, x, y):
+        if self.is_done():
+            return 0.
+        return self.distance_to_target(x, y) + self.remaining_lengths[self.index]
+
+
+
+class PathFollowingPlanner(WPDepthPlanner):
+
+    def path_cb(self, path_msg):
+        self.path = path_msg
+
+    def get_position(self, frame):
+        try:
+            (trans, rot) = self.listener.lookupTransform(frame, self.base_frame, rospy.Time(0))
+        except (tf.LookupException, tf.ConnectivityException, tf.ExtrapolationException):
+            rospy.loginfo_throttle(5, "Error with tf:"+str(frame) + " to "+str(self.base_frame))
+            return None
+
+        trans[0] = self.x # Use GPS instead of DR (quickfix)
+        trans[1] = self.y # Use GPS instead of DR (quickfix)
+        return trans
+
+    def wait_for_path(self, goal_wp):
+        '''
+        The path that was sent for this goal, the one with the same stamp as the goal pose.
+        A goal without a stamp takes the latest path.
+        returns None if it did not come within path_wait_timeout or the goal was preempted.
+        '''
+        stamp = goal_wp.pose.header.stamp
+        if stamp.is_zero():
+            return self.path
+
+        start_time = time.time()
+        r = rospy.Rate(20.)
+        while not rospy.is_shutdown():
+            path = self.path
+            if path is not None and path.header.stamp == stamp:
+                return path
+            if self._as.is_preempt_requested() or time.time() - start_time > self.path_wait_timeout:
+                return None
+            rospy.loginfo_throttle(1, "Waiting for the path of the goal")
+            r.sleep()
+        return None
+
+    def path_waypoints(self, path, goal_wp, frame):
+        '''
+        The waypoints of the path up to the last one that matches the goal.
+        returns None if the path can not be followed to the goal.
+        '''
+        goal_x = goal_wp.pose.pose.position.x
+        goal_y = goal_wp.pose.pose.position.y
+
+        if path is None or len(path.poses) == 0:
+            rospy.logwarn("No path received for the goal")
+            return None
+
+        path_frame = path.header.frame_id
+        if path_frame != '' and path_frame != frame:
+            rospy.logwarn("Path is in {} but the goal is in {}".format(path_frame, frame))
+            return None
+
+        waypoints = [(ps.pose.position.x, ps.pose.position.y, ps.pose.position.z) for ps in path.poses]
+        # from the end, a path that passes near its end before does not stop there
+        for i in range(len(waypoints)-1, -1, -1):
+            x, y, _ = waypoints[i]
+            if math.hypot(x - goal_x, y - goal_y) < self.wp_tolerance:
+                return waypoints[:i+1]
+
+        rospy.logwarn("Goal waypoint is not on the path")
+        return None
+
+    def publish_index(self, path, index):
+        msg = FloatStamped()
+        msg.header.stamp = path.header.stamp
+        msg.header.frame_id = path.header.frame_id
+        msg.data = index
+        self.index_pub.publish(msg)
+
+    def execute_cb(self, goal):
+        rospy.loginfo("Path goal received")
+        self.cancel_disengage()
+        result = GotoWaypointResult()
+
+        frame = goal.waypoint.pose.header.frame_id
+        if frame is None or frame == '':
+            rospy.logwarn("Goal has no frame id! Using utm by default")
+            frame = 'utm'
+
+        if goal.waypoint.speed_control_mode == 2:
+            self.vel_ctrl_flag = True
+        elif goal.waypoint.speed_control_mode == 1:
+            self.vel_ctrl_flag = False
+            self.forward_rpm = goal.waypoint.travel_rpm
+
+        if goal.waypoint.goal_tolerance:
+            self.wp_tolerance = goal.waypoint.goal_tolerance
+
+        if self.use_constant_rpm:
+            self.vel_ctrl_flag = False
+
+        trans = self.get_position(frame)
+        while trans is None and not rospy.is_shutdown():
+            if self._as.is_preempt_requested():
+                self._as.set_preempted(result, "Preempted path action")
+                return
+            rospy.sleep(0.1)
+            trans = self.get_position(frame)
+
+        if trans is None:
+            return
+
+        path = self.wait_for_path(goal.waypoint)
+        if self._as.is_preempt_requested():
+            self._as.set_preempted(result, "Preempted path action")
+            return
+        waypoints = self.path_waypoints(path, goal.waypoint, frame)
+        if waypoints is None:
+            rospy.logwarn('%s: Aborted, no matching path for the goal' % self._action_name)
+            self.disengage_actuators()
+            self._as.set_aborted(result, "No matching path for the goal")
+            return
+
+        guidance = LOSGuidance(waypoints,
+                               trans[0], trans[1],
+                               self.lookahead_dist,
+                               self.wp_tolerance)
+        rospy.loginfo("Following a path of {} waypoints, {:.1f}m long".format(len(waypoints),
+                                                                             guidance.remaining_distance(trans[0], trans[1])))
+        self.publish_index(path, guidance.index)
+
+        leg_start_time = time.time()
+        r = rospy.Rate(10.)
+        while not rospy.is_shutdown():
+            if self._as.is_preempt_requested():
+                rospy.loginfo('%s: Preempted' % self._action_name)
+                self.disengage_actuators()
+                self._as.set_preempted(result, "Preempted path action")
+                return
+
+            pos = self.get_position(frame)
+            if pos is not None:
+                trans = pos
+
+            x, y = trans[0], trans[1]
+            switched = guidance.update(x, y)
+            if not switched and not guidance.is_done() and self.timeout_flag and \
+               time.time() - leg_start_time > self.timeout_limit and \
+               guidance.distance_to_target(x, y) < 20:
+                rospy.loginfo("Timeout, going to next WP!")
+                guidance.index += 1
+                switched = True
+
+            if switched:
+                leg_start_time = time.time()
+                self.publish_index(path, guidance.index)
+
+            if guidance.is_done():
+                break
+
+            yaw_setpoint = guidance.yaw_setpoint(x, y)
+            self.publish_depth_setpoint(guidance.depth_setpoint())
+            if self.vel_ctrl_flag:
+                self.vel_wp_following(goal.waypoint.travel_speed, yaw_setpoint)
+            else:
+                self.rpm_wp_following(self.forward_rpm, yaw_setpoint)
+
+            rospy.loginfo_throttle(5, "Path wp:{}/{}, remaining:{:.1f}m".format(guidance.index,
+                                                                                len(waypoints),
+                                                                                guidance.remaining_distance(x, y)))
+            r.sleep()
+
+        self.disengage_later()
+        result.reached_waypoint = True
+        rospy.loginfo('%s: Succeeded' % self._action_name)
+        self._as.set_succeeded(result, "Path completed")
+
+
+    def __init__(self, name):
+        path_topic = rospy.get_param('~path_topic', '/sam/ctrl/path_following/path')
+        index_topic = rospy.get_param('~index_topic', '/sam/ctrl/path_following/current_index')
+        #seconds to wait for the path of a goal to arrive
+        self.path_wait_timeout = rospy.get_param('~path_wait_timeout', 2.0)
+
+        self.path = None
+        rospy.Subscriber(path_topic, Path, self.path_cb)
+        # the index of the waypoint in the path that we are going towards
+        self.index_pub = rospy.Publisher(index_topic, FloatStamped, queue_size=10)
+
+        super(PathFollowingPlanner, self).__init__(name)
+
+
+if __name__ == '__main__':
+
+    rospy.init_node('path_following_action')
+    planner = PathFollowingPlanner(rospy.get_name())
+    rospy.spin()
@@ -1,7 +1,10 @@
 #! /usr/bin/env python
 
-#Wrapper node to read control inputs and republish at above 10hz 
+#Wrapper node to read control inputs and republish at above 10hz
+#New commands are forwarded as they come, the loop only keeps the last ones alive.
+#If no new command comes within command_timeout, the thrusters are sent 0 rpm.
 
+import threading
 import rospy
 from smarc_msgs.msg import ThrusterRPM
 from std_msgs.msg import Bool
@@ -9,22 +12,62 @@ from std_msgs.msg import Bool
 class RPMRepub(object):
 
     def rpm1_cb(self,rpm):
-        self.rpm1.rpm= rpm.rpm
+        self.new_command(0, rpm.rpm)
 
     def rpm2_cb(self,rpm):
-        self.rpm2.rpm= rpm.rpm
+        self.new_command(1, rpm.rpm)
+
+    def new_command(self, i, rpm):
+        with self.lock:
+            self.rpms[i].rpm = rpm
+            self.last_cmd_time[i] = rospy.get_time()
+            self.timed_out[i] = False
+            if self.enable_flag and self.forward_immediately:
+                self.publish(i)
+                self.num_forwarded += 1
+
+    def publish(self, i):
+        #call with the lock held
+        self.pubs[i].publish(self.rpms[i])
+        self.last_pub_time[i] = rospy.get_time()
 
     # Callback function to check for enable flag
     def enable_cb(self,enable_msg):
         #print('Enable:', enable_msg.data)
         if (not enable_msg.data):
-            self.enable_flag = False 
+            self.enable_flag = False
             rospy.loginfo_throttle(5,'rpm ctrl disabled')
 
         else:
             self.enable_flag = True
             rospy.loginfo_throttle(5,'rpm ctrl enabled')
 
+    def keep_alive(self):
+        now = rospy.get_time()
+        with self.lock:
+            for i in range(2):
+                # watchdog, the producer might be dead
+                if now - self.last_cmd_time[i] > self.command_timeout:
+                    if not self.timed_out[i]:
+                        self.timed_out[i] = True
+                        self.num_timeouts += 1
+                        rospy.logwarn("No rpm{} command for {}s, stopping the thruster".format(i+1, self.command_timeout))
+                    self.rpms[i].rpm = 0
+                    self.publish(i)
+                    continue
+
+                # a command that was just forwarded does not need to be sent again
+                if now - self.last_pub_time[i] < self.loop_period:
+                    continue
+                staleness = now - self.last_cmd_time[i]
+                self.max_staleness = max(self.max_staleness, staleness)
+                self.num_repeated += 1
+                self.publish(i)
+
+    def log_stats(self):
+        rospy.loginfo_throttle(30, "rpm_repub: forwarded:{} repeated:{} timeouts:{} max command age when repeated:{:.3f}s".format(
+            self.num_forwarded, self.num_repeated, self.num_timeouts, self.max_staleness))
+
     def __init__(self, name):
         as_rpm1_topic = rospy.get_param('~as_rpm1_topic', '/sam/ctrl/goto_waypoint/rpm1')
         as_rpm2_topic = rospy.get_param('~as_rpm2_topic', '/sam/ctrl/goto_waypoint/rpm2')
@@ -34,36 +77,50 @@ class RPMRepub(object):
 
 
         self.loop_freq = rospy.get_param("~loop_freq", 21)
+        self.loop_period = 1./self.loop_freq
+        #if false, commands are only sent by the loop, like before
+        self.forward_immediately = rospy.get_param("~forward_immediately", True)
+        #seconds without a new command before the thrusters are stopped,
+        #longer than the continue_grace_period of the action servers
+        self.command_timeout = rospy.get_param("~command_timeout", 2.0)
 
-        self.rpm1_sub = rospy.Subscriber(as_rpm1_topic, ThrusterRPM, self.rpm1_cb)
-        self.rpm2_sub = rospy.Subscriber(as_rpm2_topic, ThrusterRPM, self.rpm2_cb)
+        #initialize actuator commands
+        self.rpms = [ThrusterRPM(), ThrusterRPM()]
+        self.last_cmd_time = [0., 0.]
+        self.last_pub_time = [0., 0.]
+        self.timed_out = [True, True]
+        self.lock = threading.Lock()
 
-        rospy.Subscriber(enable_topic, Bool, self.enable_cb)
+        self.num_forwarded = 0
+        self.num_repeated = 0
+        self.num_timeouts = 0
+        self.max_staleness = 0.
+
+        self.enable_flag = False
 
         self.rpm1_pub = rospy.Publisher(rpm1_cmd_topic, ThrusterRPM , queue_size=10)
         self.rpm2_pub = rospy.Publisher(rpm2_cmd_topic, ThrusterRPM , queue_size=10)
-        
+        self.pubs = [self.rpm1_pub, self.rpm2_pub]
 
-        self.rate = rospy.Rate(self.loop_freq) 
+        self.rpm1_sub = rospy.Subscriber(as_rpm1_topic, ThrusterRPM, self.rpm1_cb)
+        self.rpm2_sub = rospy.Subscriber(as_rpm2_topic, ThrusterRPM, self.rpm2_cb)
+
+        rospy.Subscriber(enable_topic, Bool, self.enable_cb)
 
-        #initialize actuator commands
-        self.rpm1 = ThrusterRPM()
-        self.rpm2 = ThrusterRPM()
-        
-        self.enable_flag = False
+
+        self.rate = rospy.Rate(self.loop_freq)
 
         while not rospy.is_shutdown():
 
             if self.enable_flag:
-            
+
                 #publish to actuators
-                self.rpm1_pub.publish(self.rpm1)
-                self.rpm2_pub.publish(self.rpm2)
-                
+                self.keep_alive()
+                self.log_stats()
+
             self.rate.sleep()
 
 
 if __name__ == "__main__":
     rospy.init_node("rpm_repub")
     rpm_repub_obj = RPMRepub(rospy.get_name())
-
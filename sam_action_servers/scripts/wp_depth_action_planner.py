@@ -21,7 +21,7 @@ from mpl_toolkits.mplot3d import Axes3D
 from nav_msgs.msg import Path
 from geometry_msgs.msg import PoseStamped, PointStamped
 #from move_base_msgs.msg import MoveBaseFeedback, MoveBaseResult, MoveBaseAction
-from smarc_msgs.msg import GotoWaypointActionFeedback, GotoWaypointResult, GotoWaypointAction, GotoWaypointGoal
+from smarc_msgs.msg import GotoWaypointActionFeedback, GotoWaypointResult, GotoWaypointAction, GotoWaypointGoal, GotoWaypoint
 from sensor_msgs.msg import NavSatFix
 import actionlib
 import rospy
@@ -247,54 +247,92 @@ class WPDepthPlanner(object):
         self.rpm1_pub.publish(rpm1)
         self.rpm2_pub.publish(rpm2)
         self.rpm_enable_pub.publish(False)
-        
+
+    def disengage_later(self):
+        #Keep the actuators going for a little while after a goal is done, so that
+        #a next waypoint sent right away continues without stopping the vehicle
+        if self.continue_grace_period <= 0:
+            self.disengage_actuators()
+            return
+        self.disengage_timer = rospy.Timer(rospy.Duration(self.continue_grace_period),
+                                           self.disengage_timer_cb,
+                                           oneshot=True)
+
+    def disengage_timer_cb(self, event):
+        self.disengage_timer = None
+        if not self._as.is_active():
+            rospy.loginfo("No new goal received, disengaging actuators")
+            self.disengage_actuators()
+
+    def cancel_disengage(self):
+        if self.disengage_timer is not None:
+            self.disengage_timer.shutdown()
+            self.disengage_timer = None
         
     
-    def execute_cb(self, goal):
-
-        rospy.loginfo("Goal received")
-        rospy.loginfo(goal)
-        self.start_time = time.time()
-
-        #success = True
-        self.nav_goal = goal.waypoint.pose.pose
-        self.nav_goal_frame = goal.waypoint.pose.header.frame_id
-        if self.nav_goal_frame is None or self.nav_goal_frame == '':
+    def set_nav_goal(self, waypoint):
+        #Set the goal pose and travel settings from a GotoWaypoint
+        nav_goal = waypoint.pose.pose
+        nav_goal_frame = waypoint.pose.header.frame_id
+        if nav_goal_frame is None or nav_goal_frame == '':
             rospy.logwarn("Goal has no frame id! Using utm by default")
-            self.nav_goal_frame = 'utm' #'utm'
+            nav_goal_frame = 'utm' #'utm'
 
-        self.nav_goal.position.z = goal.waypoint.travel_depth # assign waypoint depth from neptus, goal.z is 0.
-        if goal.waypoint.speed_control_mode == 2: #GotoWaypointGoal.SPEED_CONTROL_SPEED: #2:
+        nav_goal.position.z = waypoint.travel_depth # assign waypoint depth from neptus, goal.z is 0.
+        self.travel_speed = waypoint.travel_speed
+        if waypoint.speed_control_mode == 2: #GotoWaypointGoal.SPEED_CONTROL_SPEED: #2:
             self.vel_ctrl_flag = True # check if NEPTUS sets a velocity
-        elif goal.waypoint.speed_control_mode == 1: #GotoWaypointGoal.SPEED_CONTROL_RPM: # 1: 
+        elif waypoint.speed_control_mode == 1: #GotoWaypointGoal.SPEED_CONTROL_RPM: # 1: 
             self.vel_ctrl_flag = False # use RPM ctrl
-            self.forward_rpm = goal.waypoint.travel_rpm #take rpm from NEPTUS
+            self.forward_rpm = waypoint.travel_rpm #take rpm from NEPTUS
 
         #get wp goal tolerance from Neptus
-        if goal.waypoint.goal_tolerance:
-            self.wp_tolerance = goal.waypoint.goal_tolerance #take the goal tolerance from Neptus if it exists!
-            rospy.loginfo_throttle(5,'Using Goal tolerance from neptus:'+ str(goal.waypoint.goal_tolerance))
+        if waypoint.goal_tolerance:
+            self.wp_tolerance = waypoint.goal_tolerance #take the goal tolerance from Neptus if it exists!
+            rospy.loginfo_throttle(5,'Using Goal tolerance from neptus:'+ str(waypoint.goal_tolerance))
 
         if self.use_constant_rpm: #overriding neptus values
             self.vel_ctrl_flag = False #use constant rpm
 
 
         goal_point = PointStamped()
-        goal_point.header.frame_id = self.nav_goal_frame
+        goal_point.header.frame_id = nav_goal_frame
         goal_point.header.stamp = rospy.Time(0)
-        goal_point.point.x = self.nav_goal.position.x
-        goal_point.point.y = self.nav_goal.position.y
-        goal_point.point.z = self.nav_goal.position.z
+        goal_point.point.x = nav_goal.position.x
+        goal_point.point.y = nav_goal.position.y
+        goal_point.point.z = nav_goal.position.z
 
         try:
-            goal_point_local = self.listener.transformPoint(self.nav_goal_frame, goal_point)
-            self.nav_goal.position.x = goal_point_local.point.x
-            self.nav_goal.position.y = goal_point_local.point.y
-            self.nav_goal.position.z = goal_point_local.point.z
+            goal_point_local = self.listener.transformPoint(nav_goal_frame, goal_point)
+            nav_goal.position.x = goal_point_local.point.x
+            nav_goal.position.y = goal_point_local.point.y
+            nav_goal.position.z = goal_point_local.point.z
         except (tf.LookupException, tf.ConnectivityException, tf.ExtrapolationException):
             print ("Not transforming point to world local")
             pass
 
+        #the loop reads these, so they are only swapped in when complete
+        self.nav_goal_frame = nav_goal_frame
+        self.nav_goal = nav_goal
+
+    def goal_update_cb(self, waypoint):
+        #Move the goal of the running action without preempting it,
+        #so the actuators are not stopped for every update of a live waypoint
+        if not self._as.is_active() or self.nav_goal is None:
+            return
+        self.set_nav_goal(waypoint)
+        rospy.loginfo_throttle(5, 'Goal updated to %s, %s' % (self.nav_goal.position.x, self.nav_goal.position.y))
+
+    def execute_cb(self, goal):
+
+        rospy.loginfo("Goal received")
+        rospy.loginfo(goal)
+        self.cancel_disengage()
+        self.start_time = time.time()
+
+        #success = True
+        self.set_nav_goal(goal.waypoint)
+
         rospy.loginfo('Nav goal in local %s ' % self.nav_goal.position.x)
 
         r = rospy.Rate(20.) # 10hz
@@ -306,7 +344,11 @@ class WPDepthPlanner(object):
                 rospy.loginfo('%s: Preempted' % self._action_name)
                 #success = False
                 self.nav_goal = None
-                self.disengage_actuators()
+                if self._as.is_new_goal_available():
+                    #the next goal starts right after this, no need to stop in between
+                    self.disengage_later()
+                else:
+                    self.disengage_actuators()
 
                 print('wp depth action planner: stopped thrusters')
                 self._as.set_preempted(self._result, "Preempted WP action")
@@ -427,13 +469,13 @@ class WPDepthPlanner(object):
                 else:
                 #if it is outside the turboturning range
                     if self.vel_ctrl_flag:
-                        self.vel_wp_following(goal.waypoint.travel_speed, yaw_setpoint)
+                        self.vel_wp_following(self.travel_speed, yaw_setpoint)
                     else:
                         self.rpm_wp_following(self.forward_rpm, yaw_setpoint)
             else:
                 #if it is not turboturning
                 if self.vel_ctrl_flag:
-                    self.vel_wp_following(goal.waypoint.travel_speed, yaw_setpoint)
+                    self.vel_wp_following(self.travel_speed, yaw_setpoint)
                 else:
                     self.rpm_wp_following(self.forward_rpm, yaw_setpoint)
 
@@ -444,7 +486,7 @@ class WPDepthPlanner(object):
             counter += 1
             r.sleep()
 
-        self.disengage_actuators()
+        self.disengage_later()
         #self.x_prev = self.nav_goal.position.x
         #self.y_prev = self.nav_goal.position.y
         #self._result.reached_waypoint= True
@@ -479,6 +521,9 @@ class WPDepthPlanner(object):
         self.wp_overshoot_flag =  rospy.get_param('~wp_overshoot_flag', True)
         self.timeout_flag = rospy.get_param('~timeout_flag', True)
         self.timeout_limit = rospy.get_param('~timeout_limit', 500)
+        #seconds to wait for a next goal before stopping the actuators after a goal is reached
+        self.continue_grace_period = rospy.get_param('~continue_grace_period', 1.0)
+        self.disengage_timer = None
 
         #related to turbo turn
         self.turbo_turn_flag = rospy.get_param('~turbo_turn_flag', False)
@@ -518,6 +563,8 @@ class WPDepthPlanner(object):
 
         #initializing some global variables
         self.nav_goal = None
+        self.nav_goal_frame = 'utm'
+        self.travel_speed = 0.
         self.x_prev = 0
         self.y_prev = 0
         self.prev_xydiff_norm = 0
@@ -554,12 +601,14 @@ class WPDepthPlanner(object):
         self._as.start()
         rospy.loginfo("Announced action server with name: %s", self._action_name)
 
-        reconfig = ReconfigServer(self)
+        #live waypoints move the goal through here instead of sending new goals
+        rospy.Subscriber(self._action_name + '/goal_update', GotoWaypoint, self.goal_update_cb, queue_size=1)
 
-        rospy.spin()
+        reconfig = ReconfigServer(self)
 
 if __name__ == '__main__':
 
     rospy.init_node('wp_depth_action_planner')
     planner = WPDepthPlanner(rospy.get_name())
+    rospy.spin()
     
@@ -14,8 +14,8 @@ class AUVConfig(object):
     """
     Base config object, with default values for SAM.
     """
-    def __init__(self):
-        self.robot_name = 'sam'
+    def __init__(self, robot_name='sam'):
+        self.robot_name = robot_name
 
         # topics
         self.DVL_TOPIC = 'core/dvl'
@@ -26,6 +26,7 @@ class AUVConfig(object):
         self.PLAN_PATH_TOPIC = 'ctrl/mission_waypoints'
         self.LATLON_TOPIC = 'dr/lat_lon'
         self.GPS_TOPIC = 'core/gps'
+        self.BATTERY_TOPIC = 'core/battery'
         self.ROLL_TOPIC = '/'+self.robot_name+'/dr/roll'
         self.PITCH_TOPIC = '/'+self.robot_name+'/dr/pitch'
         self.YAW_TOPIC = '/'+self.robot_name+'/dr/yaw'
@@ -53,6 +54,7 @@ class AUVConfig(object):
         self.START_STOP_DVL_NAMESPACE = 'core/toggle_dvl'
         self.INSPECTION_ACTION_NAMESPACE = 'ctrl/panoramic_inspection_action'
         self.PLANNED_SURFACE_ACTION_NAMESPACE = 'ctrl/planned_surface_action'
+        self.PATH_FOLLOWING_ACTION_NAMESPACE = 'ctrl/path_following_action'
 
 
         self.LATLONTOUTM_SERVICE = '/'+self.robot_name+'/dr/lat_lon_to_utm'
@@ -80,14 +82,64 @@ class AUVConfig(object):
         self.GPSFIX_TOPIC = 'imc/gps_fix'
         self.GPS_NAV_DATA_TOPIC = 'imc/gps_nav_data'
 
+        # imc telemetry rates, in seconds
+        # messages are only sent when they change, but never more often
+        # than their period and at least once every heartbeat period
+        self.IMC_ESTIMATED_STATE_PERIOD = 0.3
+        self.IMC_PLAN_CONTROL_STATE_PERIOD = 1
+        self.IMC_VEHICLE_STATE_PERIOD = 1
+        self.IMC_PLANDB_SUCCESS_PERIOD = 5
+        self.IMC_GPS_FIX_PERIOD = 1
+        self.IMC_HEARTBEAT_PERIOD = 10
+
         # mqtt related stuff
         self.LAST_WP_TOPIC = 'smarc_bt/last_wp'
         self.MISSION_CONTROL_TOPIC = 'smarc_bt/mission_control'
+        self.MISSION_PROGRESS_TOPIC = 'smarc_bt/mission_progress'
+        # seconds between periodic mission control feedback messages
+        self.NODERED_FEEDBACK_PERIOD = 1
+        # if True, the waypoints of a plan are only sent once per plan and
+        # when requested, periodic feedback carries only the state
+        self.NODERED_COMPACT_FEEDBACK = True
 
         # hard values
         self.MAX_DEPTH = 20
         self.MIN_ALTITUDE = 1
         self.ABSOLUTE_MIN_ALTITUDE = -1
+        # if True, the tree fails its safety checks when a sensor has not sent
+        # anything for longer than its max age, in seconds. 0 to not check a sensor.
+        # the dvl is only checked while it is switched on
+        self.ENABLE_SENSOR_WATCHDOG = False
+        self.SENSOR_MAX_AGE_TF = 1
+        self.SENSOR_MAX_AGE_DVL = 2
+        self.SENSOR_MAX_AGE_LEAK = 0
+        # arrival gaps, stamp delays and ages of the sensors, as json
+        self.SENSOR_DIAGNOSTICS_TOPIC = 'smarc_bt/sensor_diagnostics'
+        # if True, lines are fit to the recent depth and altitude readings.
+        # a limit that will be crossed within the horizon, in seconds, skips the
+        # current waypoint, a crossed one is an emergency. the altitude limit then
+        # needs this many bad checks in a row, as does going back to normal.
+        # losing the altitude for as long while deeper than DVL_RUNNING_DEPTH is crossing it
+        self.ENABLE_ENVELOPE_CHECK = False
+        self.ENVELOPE_WINDOW = 20
+        self.ENVELOPE_HORIZON = 5
+        self.ENVELOPE_HYSTERESIS = 3
+        # live waypoints are smoothed and sent to the goto server at most once
+        # per interval, in seconds. alpha, beta are the weights of a new position
+        # in the smoothed position and speed of the waypoint, 1 and 0 to turn it off.
+        # if the server supports it, live changes update the running goal
+        # instead of preempting it with a new one
+        self.LIVE_WP_MIN_RESEND_INTERVAL = 1
+        self.LIVE_WP_SMOOTHING_ALPHA = 0.5
+        self.LIVE_WP_SMOOTHING_BETA = 0.1
+        self.ENABLE_LIVE_WP_GOAL_UPDATES = False
+        # if True, leak, abort, depth and altitude are also checked outside
+        # the tree, as they come in, and the emergency is published right away
+        self.ENABLE_SAFETY_MONITOR = False
+        # Hz, for depth which comes from TF
+        self.SAFETY_MONITOR_RATE = 20
+        # seconds from a reading to the emergency being published
+        self.SAFETY_LATENCY_TOPIC = 'smarc_bt/safety_latency'
         # how many ticks to run emergency action before we give up
         # on the current wp and skip it
         # in ticks
@@ -102,18 +154,84 @@ class AUVConfig(object):
         # in meters
         self.WAYPOINT_TOLERANCE = 1.5
 
+        # if True, the goal for the next goto waypoint is sent in the same tick
+        # the current one is reached, instead of waiting for the tree to advance the plan
+        self.PIPELINE_GOTO_WAYPOINTS = False
+
+        # if True, consecutive goto waypoints of the plan are sent as one path
+        # to the path following action instead of one goal per waypoint
+        self.ENABLE_PATH_FOLLOWING = False
+        self.PATH_FOLLOWING_PATH_TOPIC = 'ctrl/path_following/path'
+        self.PATH_FOLLOWING_INDEX_TOPIC = 'ctrl/path_following/current_index'
+        # max number of waypoints sent in one path
+        self.PATH_FOLLOWING_WINDOW = 20
+
+        # if True, the waypoints of a received plan are re-ordered to shorten the path
+        # first and last waypoints and maneuvers with the tag in their id stay in place
+        self.ENABLE_PLAN_OPTIMIZATION = False
+        self.PLAN_OPTIMIZATION_ORDERED_TAG = 'fixed'
+        # if True, a plan that is uploaded again with the same id is patched into
+        # the running one, waypoints are matched by name and the visited ones
+        # that did not change are not visited again
+        self.ENABLE_PLAN_PATCHING = False
+
         # coverage planning variables
         # total width of sensor footprint, perpendicular to movement
         self.SWATH = 20
         # function of distance traveled. 0.01 means 1 meter error per 100m travel
         self.LOCALIZATION_ERROR_GROWTH = 0.02
+        # if True, LOCALIZATION_ERROR_GROWTH is replaced by the growth measured
+        # from the gps fixes at the surface once there are enough of them
+        self.ENABLE_ERROR_GROWTH_ESTIMATION = False
+        self.ERROR_GROWTH_MIN_SAMPLES = 3
+        # water current used to orient the coverage legs and plan their speeds
+        # either a text file of "x y u v" rows on a regular utm grid
+        # or a constant u(east), v(north) in m/s. No current if all are empty/0.
+        self.COVERAGE_CURRENT_FILE = ''
+        self.COVERAGE_CURRENT_U = 0
+        self.COVERAGE_CURRENT_V = 0
+        # coverage legs against the current are not planned faster than this, m/s
+        self.COVERAGE_MAX_SPEED = 1.5
+        # grid of the swath coverage of the current plan, published for the operators
+        self.COVERAGE_MAP_TOPIC = 'smarc_bt/coverage_map'
+        # meters per cell
+        self.COVERAGE_MAP_RESOLUTION = 1
+        # m2, smaller uncovered areas are not reported as gaps
+        self.COVERAGE_MAP_MIN_GAP_AREA = 4
+        # latencies, failures and circuit states of the services the BT calls, as json
+        self.SERVICE_STATS_TOPIC = 'smarc_bt/service_stats'
+        # if True, a completed plan gets mower patterns over its coverage gaps
+        # added to its end, this many times at most
+        self.ENABLE_GAP_FILLING = False
+        self.GAP_FILLING_MAX_ROUNDS = 1
+
+        # battery and endurance
+        # energy use is learned from the mission logs, these are the
+        # values used until there are logs to learn from
+        self.BATTERY_CAPACITY_WH = 1000
+        self.DEFAULT_WH_PER_METER = 0.1
+        # never plan to use this last bit of the battery
+        self.BATTERY_RESERVE_PERCENT = 20
+        # if True, a plan is not started if the battery is not enough to
+        # finish it. once started, a plan is continued and only warned about
+        self.ENABLE_BATTERY_CHECK = False
+        # only the latest this many mission logs are learned from, in the
+        # background after start. until then the battery is not checked
+        self.ENDURANCE_MAX_LOGS = 50
 
         # Algae farm
         self.BUOY_TOPIC = 'sim/marked_positions'
+        # buoys closer than this across the farm are on the same line, meters
+        self.BUOY_MIN_LINE_SEPARATION = 2
 
         # Mission logging file location
         self.MISSION_LOG_FOLDER = '~/MissionLogs/'
         self.ENABLE_MANUAL_MISSION_LOG = False
+        # if True, the progress of the plan is written to MISSION_LOG_FOLDER/checkpoints
+        # at every waypoint and a restarted BT loads the plan back where it was
+        self.ENABLE_MISSION_CHECKPOINT = False
+        # if True, a resumed plan that was running continues without waiting for a start
+        self.CHECKPOINT_RESUME_GO = False
 
         # lolo-specific
         self.LOLO_ELEVATOR_TOPIC = '/lolo/core/elevator'
@@ -186,10 +304,13 @@ class AUVConfig(object):
         print("You might need to restart the launch script (mission.launch) to read the new launch file")
 
 
-    def read_rosparams(self):
+    def read_rosparams(self, prefix='~'):
+        """
+        prefix is prepended to the lowercase names of the non-global params
+        """
         for k,v in vars(self).items():
             if v is not None:
-                param_name = '~'+k.lower()
+                param_name = prefix+k.lower()
             else:
                 param_name = k.lower()
 
@@ -202,8 +323,14 @@ class AUVConfig(object):
             assert not (v is None and rosparam_v is None), "A required global rosparam ({}) is not set!".format(param_name)
 
 
-
-
-
-
-
+    def make_names_absolute(self):
+        """
+        prefix the relative topic, action and service names with /robot_name/
+        so that they do not depend on the namespace of the node.
+        used when many vehicles are run in one node.
+        """
+        for k,v in vars(self).items():
+            if type(v) != str or v.startswith('/'):
+                continue
+            if 'TOPIC' in k or 'NAMESPACE' in k or 'SERVICE' in k or k.endswith('_WP'):
+                self.__dict__[k] = '/'+self.robot_name+'/'+v
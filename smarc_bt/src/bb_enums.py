@@ -10,12 +10,24 @@ VEHICLE_STATE = 'vehicle_state'
 ABORT = 'abort'
 MAX_DEPTH = 'max_depth'
 MIN_ALTITUDE = 'min_altitude'
+# (reason, detection time) from the SafetyMonitor, None if there was no violation
+SAFETY_VIOLATION = 'safety_violation'
+# predicted depth and altitude limits, an EnvelopeChecker object
+ENVELOPE_CHECKER = 'envelope_checker'
 
 MISSION_PLAN_OBJ = 'misison_plan'
+# distance based progress and ETA of the plan, a MissionProgress object
+MISSION_PROGRESS = 'mission_progress'
+# swath coverage of the plan so far, a CoverageMap object
+COVERAGE_MAP = 'coverage_map'
+# dead reckoning error growth learned from gps fixes, a DriftEstimator object
+DRIFT_ESTIMATOR = 'drift_estimator'
 MANEUVER_ACTIONS = 'maneuver_actions'
 
 BASE_LINK = 'base_link'
 POI_POINT_STAMPED = 'poi_ps'
+# all the POIs seen during the mission, a POIRegistry object
+POI_REGISTRY = 'poi_registry'
 
 IMC_STATE = 'imc_state'
 
@@ -54,6 +66,11 @@ LIVE_WP = 'live_wp'
 GUI_WP_ENABLE = 'gui_wp_enable'
 GUI_WP = 'gui_wp'
 
+# Energy model, an EnduranceModel object
+ENDURANCE_MODEL = 'endurance_model'
+# the last feasibility report of the plan, a dict
+ENDURANCE_REPORT = 'endurance_report'
+
 # Goto action
 WAYPOINT_TOLERANCE = 'wp_tolerance'
 
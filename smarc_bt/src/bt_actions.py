@@ -8,10 +8,11 @@ import py_trees_ros as ptr
 
 import time
 import math
+import copy
+import threading
 import numpy as np
 
 import rospy
-import tf
 import actionlib
 
 from smarc_msgs.msg import GotoWaypointAction, GotoWaypointGoal, FloatStamped, GotoWaypoint
@@ -31,9 +32,14 @@ from std_srvs.srv import SetBool
 import bb_enums
 import imc_enums
 import common_globals
+from bt_common import LRUCache
+from service_client import get_client, run_async, ServiceCall
 
 from mission_plan import MissionPlan, Waypoint
 from mission_log import MissionLog
+from buoy_lines import BuoyLineModel
+from coverage_map import plan_gap_fill
+from live_wp import LiveWaypointCoalescer
 
 
 class A_ReadWaypoint(pt.behaviour.Behaviour):
@@ -42,15 +48,23 @@ class A_ReadWaypoint(pt.behaviour.Behaviour):
                  bb_key,
                  utm_to_lat_lon_service_name,
                  lat_lon_to_utm_service_name,
-                 reset = False):
+                 reset = False,
+                 cache_size = 32,
+                 retry_period = 2.):
         """
         subs to a GotoWaypoint topic and read it into the given bb variable
+
+        The waypoint is converted between utm and latlon once, in the subscriber
+        callback when it is received, so the tick does not wait for the services.
+        Conversions are cached by their (lat,lon) or (x,y), a waypoint that is
+        re-sent without changes does not call the services again.
+        A waypoint that could not be converted is tried again in the worker pool
+        every retry_period seconds until it works or a new one is received.
         """
         super(A_ReadWaypoint, self).__init__(name="A_ReadWaypoint")
 
         self.bb = pt.blackboard.Blackboard()
         self.ps_topic = ps_topic
-        self.last_read_wp = None
         self.last_read_time = None
         self.bb_key = bb_key
         self.utm_to_lat_lon_service_name = utm_to_lat_lon_service_name
@@ -59,12 +73,30 @@ class A_ReadWaypoint(pt.behaviour.Behaviour):
         self.got_latlon_service = False
         self.reset = reset
 
+        # made once in setup, shared with everyone else calling these services
+        self.utm_to_lat_lon_client = None
+        self.lat_lon_to_utm_client = None
+        # ('latlon', lat, lon) -> (x,y) and ('utm', x, y) -> (lat,lon)
+        self.conversions = LRUCache(cache_size)
+
+        # (converted waypoint, reason it could not be converted or None)
+        # of the latest message, one object so the callback can replace it in one go
+        self.last_read_wp = None
+        # the retry should not put back a message that the callback replaced meanwhile
+        self._wp_lock = threading.Lock()
+
+        self.retry_period = retry_period
+        self._retry_job = None
+        self._retry_entry = None
+        self._retry_time = 0
+
 
     def setup(self, timeout):
         self.ps_sub = rospy.Subscriber(self.ps_topic, GotoWaypoint, self.cb)
         try:
             rospy.loginfo("Waiting for utm to latlon service")
             rospy.wait_for_service(self.utm_to_lat_lon_service_name, timeout=timeout)
+            self.utm_to_lat_lon_client = get_client(self.utm_to_lat_lon_service_name, UTMToLatLon, persistent=True)
             self.got_utm_service = True
         except:
             rospy.logwarn("Could not connect to {}, live WPs wont be updated in the map".format(self.utm_to_lat_lon_service_name))
@@ -72,66 +104,117 @@ class A_ReadWaypoint(pt.behaviour.Behaviour):
         try:
             rospy.loginfo("Waiting for latlon to utm service")
             rospy.wait_for_service(self.lat_lon_to_utm_service_name, timeout=timeout)
+            self.lat_lon_to_utm_client = get_client(self.lat_lon_to_utm_service_name, LatLonToUTM, persistent=True)
             self.got_latlon_service = True
         except:
             rospy.logwarn("Could not connect to {}, we cant read WPs from a GUI".format(self.lat_lon_to_utm_service_name))
         return True
 
-    def cb(self, msg):
-        self.last_read_wp = msg
-        self.last_read_time = time.time()
-
-    def update(self):
-        if self.last_read_time is not None:
-            time_since = time.time() - self.last_read_time
-            self.feedback_message = "Last read:{:.2f}s ago".format(time_since)
-        else:
-            self.feedback_message = "No msg rcvd"
-
-        if self.last_read_wp is None:
-            return pt.Status.SUCCESS
-
-        wp = Waypoint(goto_waypoint = self.last_read_wp,
-                      imc_man_id = imc_enums.MANEUVER_GOTO)
-
 
-        frame_id = self.last_read_wp.pose.header.frame_id
+    def convert(self, wp):
+        """
+        fills in the utm or latlon of the waypoint, whichever is missing
+        returns None if it worked, the reason otherwise
+        """
+        frame_id = wp.frame_id
 
         # given a latlon point, convert to utm for the controllers
         if frame_id == "latlon":
             if not self.got_latlon_service:
-                self.feedback_message = "Given a latlon point but got no service!"
-                return pt.Status.FAILURE
-            try:
-                serv = rospy.ServiceProxy(self.lat_lon_to_utm_service_name, LatLonToUTM)
-                wp.set_utm_from_latlon(serv)
-            except Exception as e:
-                print(e)
-                return pt.Status.FAILURE
-
+                return "Given a latlon point but got no service!"
+            key = ('latlon', wp.wp.lat, wp.wp.lon)
+            utm = self.conversions.get(key)
+            if utm is None:
+                try:
+                    # blocking is fine, this is not the tick thread
+                    wp.set_utm_from_latlon(self.lat_lon_to_utm_client.call)
+                except Exception as e:
+                    print(e)
+                    return "Latlon to utm failed"
+                self.conversions.put(key, (wp.x, wp.y))
+            else:
+                wp.wp.pose.pose.position.x, wp.wp.pose.pose.position.y = utm
 
         # given a utm point, convert to latlon for any guis
-        if frame_id == 'utm':
-            if self.got_utm_service:
+        if frame_id == 'utm' and self.got_utm_service:
+            key = ('utm', wp.x, wp.y)
+            latlon = self.conversions.get(key)
+            if latlon is None:
                 try:
-                    serv = rospy.ServiceProxy(self.utm_to_lat_lon_service_name, UTMToLatLon)
-                    wp.set_latlon_from_utm(serv)
+                    wp.set_latlon_from_utm(self.utm_to_lat_lon_client.call)
+                    self.conversions.put(key, (wp.wp.lat, wp.wp.lon))
                 except Exception as e:
                     print(e)
+            else:
+                wp.wp.lat, wp.wp.lon = latlon
 
         wp.wp.pose.header.frame_id = 'utm'
+        return None
+
+
+    def cb(self, msg):
+        # every message is a new object, it is ours to modify
+        wp = Waypoint(goto_waypoint = msg,
+                      imc_man_id = imc_enums.MANEUVER_GOTO)
+        error = self.convert(wp)
+        with self._wp_lock:
+            self.last_read_wp = (wp, error)
+        self.last_read_time = time.time()
+
+    def check_retry(self):
+        """
+        puts the result of a finished retry in place of the entry it was for
+        """
+        if self._retry_job is None or not self._retry_job.done():
+            return
+        entry = self._retry_entry
+        try:
+            error = self._retry_job.get()
+        except Exception as e:
+            error = str(e)
+        self._retry_job = None
+        self._retry_entry = None
+        with self._wp_lock:
+            if self.last_read_wp is entry:
+                self.last_read_wp = (entry[0], error)
+
+    def start_retry(self, entry):
+        if self._retry_job is not None or time.time() - self._retry_time < self.retry_period:
+            return
+        self._retry_time = time.time()
+        self._retry_entry = entry
+        self._retry_job = run_async(self.convert, entry[0])
 
+    def update(self):
+        if self.last_read_time is not None:
+            time_since = time.time() - self.last_read_time
+            self.feedback_message = "Last read:{:.2f}s ago".format(time_since)
+        else:
+            self.feedback_message = "No msg rcvd"
+
+        self.check_retry()
+        entry = self.last_read_wp
+        if entry is None:
+            return pt.Status.SUCCESS
+
+        wp, error = entry
+
+        if error is not None:
+            self.feedback_message = error
+            self.start_retry(entry)
+            return pt.Status.FAILURE
 
         if not wp.is_actionable:
             self.feedback_message = "Empty wp!"
             return pt.Status.SUCCESS
 
-
         self.bb.set(self.bb_key, wp)
 
 
         if self.reset:
-            self.last_read_wp = None
+            with self._wp_lock:
+                if self.last_read_wp is entry:
+                    self.last_read_wp = None
             self.bb.set(self.bb_key, None)
 
         return pt.Status.SUCCESS
@@ -312,7 +395,7 @@ class A_ManualMissionLog(pt.behaviour.Behaviour):
             # and set it to None, so next time we are
             # disabled we dont do anything
             if log is not None:
-                log.save()
+                log.save_async()
                 self.bb.set(bb_enums.MANUAL_MISSION_LOG_OBJ, None)
                 self.num_saved_logs += 1
 
@@ -352,7 +435,8 @@ class A_SaveMissionLog(pt.behaviour.Behaviour):
     def update(self):
         log = self.bb.get(bb_enums.MISSION_LOG_OBJ)
         if log is not None:
-            log.save()
+            # written in a worker thread, a long log takes a while
+            log.save_async()
             self.num_saved_logs += 1
             self.bb.set(bb_enums.MISSION_LOG_OBJ, None)
             self.feedback_message = "Saved log #{}!".format(self.num_saved_logs)
@@ -376,6 +460,10 @@ class A_UpdateMissionLog(pt.behaviour.Behaviour):
                          save_location = save_location)
         self.bb.set(bb_enums.MISSION_LOG_OBJ, log)
         rospy.loginfo("Started new mission log {}".format(log.data_full_path))
+        # POIs are per-mission
+        poi_registry = self.bb.get(bb_enums.POI_REGISTRY)
+        if poi_registry is not None:
+            poi_registry.clear()
         self.started_logs += 1
         return log
 
@@ -420,11 +508,116 @@ class A_UpdateMissionLog(pt.behaviour.Behaviour):
 
 
 
+class A_FillCoverageGaps(pt.behaviour.Behaviour):
+    def __init__(self,
+                 utm_to_lat_lon_service_name,
+                 max_rounds = 1):
+        """
+        When the plan is complete, look at the gaps in the coverage map and
+        append short mower patterns over them to the plan, so the plan
+        continues instead of being finalized.
+        At most max_rounds times per plan.
+        Always returns SUCCESS.
+        """
+        super(A_FillCoverageGaps, self).__init__(name="A_FillCoverageGaps")
+        self.bb = pt.blackboard.Blackboard()
+        self.utm_to_lat_lon_service_name = utm_to_lat_lon_service_name
+        self.max_rounds = max_rounds
+        # (plan_id, creation_time) -> rounds done
+        self.rounds = {}
+        # the latlons of the new waypoints are only for the guis, they are
+        # filled in the background and this is checked on the next ticks
+        self.latlon_job = None
+
+
+    def set_latlons(self, wps):
+        client = get_client(self.utm_to_lat_lon_service_name, UTMToLatLon, persistent=True)
+        for wp in wps:
+            wp.set_latlon_from_utm(client.call)
+
+
+    def check_latlon_job(self):
+        if self.latlon_job is None or not self.latlon_job.done():
+            return
+        try:
+            self.latlon_job.get()
+        except Exception as e:
+            rospy.logwarn("Could not set the latlon of gap fill waypoints:{}".format(e))
+        self.latlon_job = None
+
+
+    def make_waypoint(self, template, x, y, name):
+        wp = Waypoint(goto_waypoint = copy.deepcopy(template.wp),
+                      imc_man_id = imc_enums.MANEUVER_GOTO)
+        wp.wp.pose.pose.position.x = x
+        wp.wp.pose.pose.position.y = y
+        wp.wp.name = name
+        wp.ordered = True
+        return wp
+
+
+    def update(self):
+        self.check_latlon_job()
+        mplan = self.bb.get(bb_enums.MISSION_PLAN_OBJ)
+        coverage_map = self.bb.get(bb_enums.COVERAGE_MAP)
+        if mplan is None or coverage_map is None or not mplan.is_complete() or len(mplan.waypoints) == 0:
+            self.feedback_message = "Plan not complete"
+            return pt.Status.SUCCESS
+
+        key = (mplan.plan_id, mplan.creation_time)
+        rounds = self.rounds.get(key, 0)
+        if rounds >= self.max_rounds:
+            self.feedback_message = "Filled gaps {} times".format(rounds)
+            return pt.Status.SUCCESS
+
+        # the gaps as they are now, not as they were a few seconds ago
+        gaps = coverage_map.find_gaps(max_age=0)
+        self.rounds[key] = rounds + 1
+        if len(gaps) == 0:
+            self.feedback_message = "No gaps, {:.1f}% covered".format(coverage_map.percent_covered)
+            return pt.Status.SUCCESS
+
+        last_wp = mplan.waypoints[-1]
+        paths = plan_gap_fill(gaps,
+                              start = (last_wp.x, last_wp.y),
+                              swath = self.bb.get(bb_enums.SWATH),
+                              error_growth = self.bb.get(bb_enums.LOCALIZATION_ERROR_GROWTH),
+                              padding = coverage_map.resolution)
+
+        new_wps = []
+        for gap_i, path in enumerate(paths):
+            for point_i, point in enumerate(path):
+                name = "gapfill{}_{}_{}/{}".format(rounds+1, gap_i+1, point_i+1, len(path))
+                new_wps.append(self.make_waypoint(last_wp, point[0], point[1], name))
+
+        mplan.append_waypoints(new_wps)
+        self.latlon_job = run_async(self.set_latlons, new_wps)
+
+        log = self.bb.get(bb_enums.MISSION_LOG_OBJ)
+        if log is not None:
+            for wp in new_wps:
+                log.mission_plan_wps.append((wp.x, wp.y, -wp.wp.travel_depth))
+
+        msg = "Added {} waypoints to fill {} gaps ({:.0f}m2), {:.1f}% covered".format(len(new_wps),
+                                                                                    len(gaps),
+                                                                                    sum(g['area'] for g in gaps),
+                                                                                    coverage_map.percent_covered)
+        rospy.loginfo(msg)
+        self.feedback_message = msg
+        return pt.Status.SUCCESS
+
+
 class A_SetDVLRunning(pt.behaviour.Behaviour):
-    def __init__(self, dvl_on_off_service_name, running, cooldown):
+    def __init__(self, dvl_on_off_service_name, running, cooldown, timeout=2.):
+        """
+        the service is called in the background, RUNNING while waiting for it
+        """
         super(A_SetDVLRunning, self).__init__(name="A_SetDVLRunning")
-        self.switcher_service = rospy.ServiceProxy(dvl_on_off_service_name,
-                                                   SetBool)
+        self.switcher_service = get_client(dvl_on_off_service_name,
+                                           SetBool,
+                                           timeout = timeout)
+        # the call that was made and not answered yet
+        self.pending_call = None
         self.bb = pt.blackboard.Blackboard()
 
         self.sb = SetBool()
@@ -444,19 +637,28 @@ class A_SetDVLRunning(pt.behaviour.Behaviour):
                 rospy.loginfo_throttle_identical(20, "DVL is already running:"+str(self.sb.data))
                 return pt.Status.SUCCESS
 
-        # check if enough time has passed since last call
-        t = time.time()
-        if t - self.last_toggle < self.cooldown:
-            # nope, return running while we wait
-            rospy.loginfo_throttle_identical(5, "Waiting on DVL toggle cooldown")
+        if self.pending_call is None:
+            # check if enough time has passed since last call
+            t = time.time()
+            if t - self.last_toggle < self.cooldown:
+                # nope, return running while we wait
+                rospy.loginfo_throttle_identical(5, "Waiting on DVL toggle cooldown")
+                return pt.Status.RUNNING
+
+            self.pending_call = self.switcher_service.call_async(self.running)
+
+        if not self.pending_call.done():
+            self.feedback_message = "Waiting for the DVL service"
             return pt.Status.RUNNING
 
-        try:
-            ret = self.switcher_service(self.running)
-        except rospy.service.ServiceException:
-            rospy.logwarn_throttle_identical(60, "DVL Start/stop service not found! Succeeding by default namespace:{}".format(self.service_name))
+        call = self.pending_call
+        self.pending_call = None
+        if call.state != ServiceCall.SUCCEEDED:
+            rospy.logwarn_throttle_identical(60, "DVL Start/stop service not found! Succeeding by default namespace:{}, {}".format(self.service_name, call.error))
             return pt.Status.SUCCESS
 
+        ret = call.result
+
         if ret.success:
             rospy.loginfo_throttle_identical(5, "DVL TOGGLED:"+str(self.sb.data))
             self.last_toggle = time.time()
@@ -468,6 +670,43 @@ class A_SetDVLRunning(pt.behaviour.Behaviour):
 
 
 
+class A_AvoidPredictedViolation(pt.behaviour.Behaviour):
+    def __init__(self):
+        """
+        The soft reaction to the envelope checker predicting that the depth or
+        altitude limit will be crossed soon: the current waypoint of the plan is
+        skipped, once per prediction, instead of the emergency that a crossed
+        limit gets from the safety tree.
+        Always returns SUCCESS.
+        """
+        self.bb = pt.blackboard.Blackboard()
+        super(A_AvoidPredictedViolation, self).__init__(name="A_AvoidPredictedViolation")
+        self.skipped = False
+
+    def update(self):
+        envelope = self.bb.get(bb_enums.ENVELOPE_CHECKER)
+        if envelope is None or not envelope.predicted:
+            self.skipped = False
+            self.feedback_message = "Nothing predicted"
+            return pt.Status.SUCCESS
+
+        if self.skipped:
+            self.feedback_message = "Skipped a waypoint, {}".format(envelope)
+            return pt.Status.SUCCESS
+
+        mission_plan = self.bb.get(bb_enums.MISSION_PLAN_OBJ)
+        if mission_plan is None or not mission_plan.is_in_progress():
+            return pt.Status.SUCCESS
+
+        rospy.logwarn("Envelope predicts a violation, skipping waypoint {}: {}".format(mission_plan.current_wp_index,
+                                                                                      envelope))
+        mission_plan.skip_current_wp()
+        self.bb.set(bb_enums.CURRENT_PLAN_ACTION, mission_plan.get_current_wp())
+        self.skipped = True
+        self.feedback_message = "Skipped a waypoint, {}".format(envelope)
+        return pt.Status.SUCCESS
+
+
 class A_SetNextPlanAction(pt.behaviour.Behaviour):
     def __init__(self, do_not_visit=False):
         """
@@ -513,7 +752,8 @@ class A_GotoWaypoint(ptr.actions.ActionClient):
                  node_name = "A_GotoWaypoint",
                  wp_from_bb = None,
                  live_mode_enabled = False,
-                 goalless = False):
+                 goalless = False,
+                 pipelined = False):
         """
         Runs an action server that will move the robot to the given waypoint
 
@@ -522,6 +762,8 @@ class A_GotoWaypoint(ptr.actions.ActionClient):
         wp_from_bb -> if given, the waypoint will be taken from the given bb variable
         live_mode_enabled -> if True, the waypoint will be re-submitted every tick to the server, wp_from_bb must be given
         goalless -> if True, only an empty goal will be sent to the sever, useful as a "signal to start"
+        pipelined -> if True, when a plan waypoint is reached the plan is advanced and the goal for the
+        next waypoint of the same type is sent in the same tick, so the server can continue without stopping
         """
 
         self.bb = pt.blackboard.Blackboard()
@@ -562,6 +804,16 @@ class A_GotoWaypoint(ptr.actions.ActionClient):
         # without stopping the action
         self.live_mode_enabled = live_mode_enabled
         self.last_live_update_time = -1
+        self.live_coalescer = None
+        # if set, live changes are published to the server as goal updates
+        # instead of new goals that preempt the running one
+        self.live_update_pub = None
+        if self.live_mode_enabled:
+            self.live_coalescer = LiveWaypointCoalescer(min_interval = auv_config.LIVE_WP_MIN_RESEND_INTERVAL,
+                                                        alpha = auv_config.LIVE_WP_SMOOTHING_ALPHA,
+                                                        beta = auv_config.LIVE_WP_SMOOTHING_BETA)
+            if auv_config.ENABLE_LIVE_WP_GOAL_UPDATES:
+                self.live_update_pub = rospy.Publisher(action_namespace + '/goal_update', GotoWaypoint, queue_size=1)
 
         # every X seconds, try to reconnect to the action server
         # if the server wasnt up and ready when the BT was started
@@ -576,6 +828,13 @@ class A_GotoWaypoint(ptr.actions.ActionClient):
         # if True, will not attempt to fill in a goal, will submit empty goal objects
         self.goalless = goalless
 
+        # only makes sense when following the mission plan
+        self.pipelined = pipelined and wp_from_bb is None and not goalless
+        # (plan, index, goal) of the waypoint after the current one
+        self.next_goal = None
+        # (plan, plan revision) that the sent goal was made from
+        self.sent_plan_revision = None
+
 
     def setup(self, timeout):
         """
@@ -610,6 +869,71 @@ class A_GotoWaypoint(ptr.actions.ActionClient):
         self.action_goal_handle = self.action_client.send_goal(self.action_goal, feedback_cb=self.feedback_cb)
         self.sent_goal = True
         self.vehicle.last_goto_wp = self.action_goal.waypoint
+        if self.live_coalescer is not None:
+            self.live_coalescer.sent()
+        mission_plan = self.bb.get(bb_enums.MISSION_PLAN_OBJ)
+        if self.wp_from_bb is None and not self.goalless and mission_plan is not None:
+            self.sent_plan_revision = (mission_plan, mission_plan.revision)
+        else:
+            self.sent_plan_revision = None
+        if self.pipelined:
+            self.prepare_next_goal()
+
+
+    def plan_was_patched(self):
+        """
+        True if the plan that the sent goal was made from was patched
+        since then and the waypoints still to be visited are different
+        """
+        if self.sent_plan_revision is None:
+            return False
+        mission_plan, revision = self.sent_plan_revision
+        return mission_plan is self.bb.get(bb_enums.MISSION_PLAN_OBJ) and mission_plan.revision != revision
+
+
+    def prepare_next_goal(self):
+        """
+        make the goal for the waypoint after the current one in advance,
+        if it is of the same type as the current one
+        """
+        self.next_goal = None
+        mission_plan = self.bb.get(bb_enums.MISSION_PLAN_OBJ)
+        if mission_plan is None or not mission_plan.is_in_progress():
+            return
+
+        next_index = mission_plan.current_wp_index + 1
+        if next_index >= len(mission_plan.waypoints):
+            return
+
+        current_wp = mission_plan.waypoints[mission_plan.current_wp_index]
+        next_wp = mission_plan.waypoints[next_index]
+        if next_wp.imc_man_id != current_wp.imc_man_id or next_wp.frame_id != self.goal_tf_frame:
+            return
+
+        self.next_goal = (mission_plan, next_index, self.make_goal_from_wp(next_wp))
+
+
+    def send_next_goal(self):
+        """
+        advance the plan and send the prepared goal
+        returns True if it was sent
+        """
+        if self.next_goal is None:
+            return False
+
+        mission_plan, next_index, goal = self.next_goal
+        self.next_goal = None
+        # the plan might have changed or moved on since the goal was made
+        if mission_plan is not self.bb.get(bb_enums.MISSION_PLAN_OBJ) or \
+           mission_plan.current_wp_index + 1 != next_index or \
+           self.plan_was_patched():
+            return False
+
+        mission_plan.visit_wp()
+        self.bb.set(bb_enums.CURRENT_PLAN_ACTION, mission_plan.get_current_wp())
+        self.action_goal = goal
+        self.send_goal()
+        return True
 
 
     def initialise(self):
@@ -701,6 +1025,13 @@ class A_GotoWaypoint(ptr.actions.ActionClient):
             self.feedback_message = "Goal sent"
             return pt.Status.RUNNING
 
+        # the rest of the plan changed under us, the goal is made again
+        # from the patched plan when this is initialised again
+        if self.plan_was_patched():
+            self.feedback_message = "Plan was patched, dropping the goal"
+            rospy.loginfo(self.feedback_message)
+            return pt.Status.FAILURE
+
         # if the goal was aborted or preempted
         if self.action_client.get_state() in [actionlib_msgs.GoalStatus.ABORTED,
                                               actionlib_msgs.GoalStatus.PREEMPTED]:
@@ -712,6 +1043,11 @@ class A_GotoWaypoint(ptr.actions.ActionClient):
 
         # if the goal was accomplished
         if result is not None and result.reached_waypoint:
+            if self.pipelined and self.send_next_goal():
+                self.feedback_message = "Completed goal, sent the next one"
+                rospy.loginfo(self.feedback_message)
+                return pt.Status.RUNNING
+
             self.feedback_message = "Completed goal"
             rospy.loginfo(self.feedback_message)
             return pt.Status.SUCCESS
@@ -725,18 +1061,30 @@ class A_GotoWaypoint(ptr.actions.ActionClient):
                 rospy.loginfo_throttle(3, self.feedback_message)
                 return pt.Status.FAILURE
 
+            # smoothed and moved to where it should be by the next update
+            self.live_coalescer.add(wp)
+            wp = self.live_coalescer.predicted(wp)
+
             # make sure it is not the exact same wp
             # before making and sending a goal
             if wp.is_too_similar_to_other(self.action_goal.waypoint):
-                if self.last_live_update_time < 5:
+                if time.time() - self.last_live_update_time < 1:
                     self.feedback_message = "Live updated just now"
                 else:
                     self.feedback_message = "Live updated {:.2f}s ago".format(time.time() - self.last_live_update_time)
+            elif not self.live_coalescer.can_send():
+                self.feedback_message = "Live wp changed, waiting to update"
             else:
                 self.action_goal = self.make_goal_from_wp(wp)
-                self.send_goal()
+                if self.live_update_pub is not None:
+                    self.live_update_pub.publish(self.action_goal.waypoint)
+                    self.vehicle.last_goto_wp = self.action_goal.waypoint
+                    self.live_coalescer.sent()
+                    self.feedback_message = "Updated goal just now"
+                else:
+                    self.send_goal()
+                    self.feedback_message = "Sent goal just now"
                 self.last_live_update_time = time.time()
-                self.feedback_message = "Sent goal just now"
 
         else:
             if self.goalless:
@@ -763,6 +1111,165 @@ class A_GotoWaypoint(ptr.actions.ActionClient):
 
 
 
+class A_FollowPath(A_GotoWaypoint):
+    def __init__(self,
+                 auv_config,
+                 node_name = "A_FollowPath"):
+        """
+        Sends the upcoming goto waypoints of the mission plan as one path
+        to the path following action, so the vehicle does not stop at every waypoint.
+        The path is published on a topic and the goal is the last waypoint of it,
+        with the stamp of the path so the server can tell which path is the goal's.
+
+        The mission plan is advanced as the action server reports the index
+        of the waypoint it is going towards, stamped with the stamp of the path
+        it is following. Indices of other paths are ignored. When the action succeeds, the
+        plan is at the last waypoint of the path, A_SetNextPlanAction takes it from there.
+        """
+        super(A_FollowPath, self).__init__(auv_config = auv_config,
+                                           action_namespace = auv_config.PATH_FOLLOWING_ACTION_NAMESPACE,
+                                           node_name = node_name)
+
+        self.path_topic = auv_config.PATH_FOLLOWING_PATH_TOPIC
+        self.index_topic = auv_config.PATH_FOLLOWING_INDEX_TOPIC
+        self.window_size = auv_config.PATH_FOLLOWING_WINDOW
+
+        self.path_pub = None
+        # the plan and the plan indices that the current path covers
+        self.window_plan = None
+        self.window_start = None
+        self.window_end = None
+        # (path stamp, index) as last reported by the server
+        self.last_index = None
+
+
+    def setup(self, timeout):
+        # setup is called again when re-connecting to the action server
+        if self.path_pub is None:
+            self.path_pub = rospy.Publisher(self.path_topic, Path, queue_size=1, latch=True)
+            self.index_sub = rospy.Subscriber(self.index_topic, FloatStamped, self.index_cb)
+        return super(A_FollowPath, self).setup(timeout)
+
+
+    def index_cb(self, msg):
+        self.last_index = (msg.header.stamp, int(msg.data))
+
+
+    def path_index(self):
+        """
+        the index the server reported for the path of the current goal, 0 if none yet
+        """
+        last_index = self.last_index
+        if last_index is None or self.action_goal is None:
+            return 0
+        stamp, index = last_index
+        # the last index of the previous path can come after the goal is sent
+        if stamp != self.action_goal.waypoint.pose.header.stamp:
+            return 0
+        return index
+
+
+    def plan_window(self, mission_plan):
+        """
+        the waypoints from the current one onwards that can be followed
+        in one go: same maneuver type and speed settings as the current one
+        """
+        first = mission_plan.get_current_wp()
+        if first is None:
+            return []
+
+        window = [first]
+        for wp in mission_plan.waypoints[mission_plan.current_wp_index+1:]:
+            if len(window) >= self.window_size:
+                break
+
+            if wp.imc_man_id != first.imc_man_id or \
+               wp.frame_id != first.frame_id or \
+               wp.wp.speed_control_mode != first.wp.speed_control_mode or \
+               wp.wp.travel_rpm != first.wp.travel_rpm or \
+               wp.wp.travel_speed != first.wp.travel_speed:
+                break
+
+            window.append(wp)
+
+        return window
+
+
+    def make_path(self, window):
+        path = Path()
+        path.header.frame_id = self.goal_tf_frame
+        path.header.stamp = rospy.Time.now()
+        for wp in window:
+            ps = PoseStamped()
+            ps.header.frame_id = self.goal_tf_frame
+            ps.pose.position.x = wp.x
+            ps.pose.position.y = wp.y
+            ps.pose.position.z = wp.depth
+            path.poses.append(ps)
+        return path
+
+
+    def initialise(self):
+        self.action_goal = None
+        self.window_plan = None
+
+        if not self.action_server_ok:
+            self.feedback_message = "No action server found for A_FollowPath!"
+            rospy.logwarn_throttle(5, self.feedback_message)
+            return
+
+        mission_plan = self.bb.get(bb_enums.MISSION_PLAN_OBJ)
+        if mission_plan is None:
+            self.feedback_message = "No mission plan found!"
+            rospy.logwarn(self.feedback_message)
+            return
+
+        window = self.plan_window(mission_plan)
+        if len(window) == 0:
+            self.feedback_message = "No wp found to execute! Does the plan have any waypoints that we understand?"
+            rospy.loginfo_throttle(3, self.feedback_message)
+            return
+
+        if window[0].frame_id != self.goal_tf_frame:
+            self.feedback_message = 'The frame of the waypoint({0}) does not match the expected frame({1}) of the action client!'.format(window[0].frame_id, self.goal_tf_frame)
+            rospy.logerr_throttle(5, self.feedback_message)
+            return
+
+        self.window_plan = mission_plan
+        self.window_start = mission_plan.current_wp_index
+        self.window_end = self.window_start + len(window) - 1
+
+        path = self.make_path(window)
+        self.path_pub.publish(path)
+        self.action_goal = self.make_goal_from_wp(window[-1])
+        # a copy, the waypoint in the plan keeps its own stamp
+        self.action_goal.waypoint = copy.deepcopy(self.action_goal.waypoint)
+        self.action_goal.waypoint.pose.header.stamp = path.header.stamp
+        rospy.loginfo("Path goal initialized with {} waypoints".format(len(window)))
+        self.sent_goal = False
+
+
+    def update(self):
+        status = super(A_FollowPath, self).update()
+
+        # keep the plan in sync with the waypoint the server is going towards
+        # as long as it is still the same plan and was not patched
+        mission_plan = self.bb.get(bb_enums.MISSION_PLAN_OBJ)
+        if self.window_plan is not None and mission_plan is self.window_plan and \
+           not self.plan_was_patched():
+            if status == pt.Status.SUCCESS:
+                index = self.window_end
+            else:
+                index = min(self.window_start + self.path_index(), self.window_end)
+
+            if index > mission_plan.current_wp_index:
+                mission_plan.current_wp_index = index
+                self.bb.set(bb_enums.CURRENT_PLAN_ACTION, mission_plan.get_current_wp())
+
+        return status
+
+
+
 class A_PublishMissionPlan(pt.behaviour.Behaviour):
     """
     Publishes the current plans waypoints as a PoseArray
@@ -928,7 +1435,8 @@ class A_ReadBuoys(pt.behaviour.Behaviour):
 
     '''
     This action reads the uncertain positions
-    (mean and covariance) of buoys from the rostopic.
+    (mean and covariance) of buoys from the rostopic
+    and groups them into the lines of the farm.
     '''
 
     def __init__(
@@ -937,18 +1445,22 @@ class A_ReadBuoys(pt.behaviour.Behaviour):
         buoy_link,
         utm_link,
         latlon_utm_serv,
+        min_line_separation=2.
     ):
 
         # rostopic name and type (e.g. marker array)
         self.topic_name = topic_name
 
-        # frame IDs for TF
+        # frame IDs
         self.buoy_link = buoy_link
         self.utm_link = utm_link
 
         # lat/lon to utm service
         self.latlon_utm_serv = latlon_utm_serv
 
+        # re-fits the lines only when the markers change
+        self.line_model = BuoyLineModel(min_line_separation=min_line_separation)
+
         # blackboard for info
         self.bb = pt.blackboard.Blackboard()
 
@@ -958,29 +1470,7 @@ class A_ReadBuoys(pt.behaviour.Behaviour):
             name="A_ReadBuoys"
         )
 
-        # for coordinate frame transformations
-        self.tf_listener = tf.TransformListener()
-
     def setup(self, timeout):
-
-        # wait for TF transformation
-        try:
-            rospy.loginfo('Waiting for transform from {} to {}.'.format(
-                self.buoy_link,
-                self.utm_link
-            ))
-            self.tf_listener.waitForTransform(
-                self.buoy_link,
-                self.utm_link,
-                rospy.Time(),
-                rospy.Duration(timeout)
-            )
-        except:
-            rospy.loginfo('Transform from {} to {} not found.'.format(
-                self.buoy_link,
-                self.utm_link
-            ))
-
         # subscribe to buoy positions
         self.sub = rospy.Subscriber(
             self.topic_name,
@@ -988,7 +1478,6 @@ class A_ReadBuoys(pt.behaviour.Behaviour):
             callback=self.cb,
             queue_size=10
         )
-        # self.bb.set(bb_enums.BUOYS, None)
         self.buoys = None
         return True
 
@@ -1000,45 +1489,19 @@ class A_ReadBuoys(pt.behaviour.Behaviour):
         But, for now, it just read the simulator buoys.
         The buoys here are assumed to be in the map frame.
         '''
+        if len(msg.markers) == 0:
+            return
 
-        # space for bouy positions
-        # rospy.loginfo('hello')
-        self.buoys = list()
-
-        # loop through visualization markers
-        for marker in msg.markers:
-
-            # convert their pose to pose stamped
-            pose = PoseStamped(
-                header=marker.header,
-                pose=marker.pose
-            )
-
-            # # transform it from local to UTM frame
-            # pose = self.tf_listener.transformPose(
-            #     self.utm_link,
-            #     pose
-            # )
-
-            # add it to the list
-            self.buoys.append([
-                pose.pose.position.x,
-                pose.pose.position.y,
-                pose.pose.position.z
-            ])
-
-        # make it into a numpy array because why not
-        self.buoys = np.array(self.buoys)
-        self.buoys = self.buoys[np.argsort(self.buoys[:,0])]
-        self.buoys = self.buoys.reshape((-1, 3, 3))
-        self.buoys = np.sort(self.buoys, axis=1)
-        self.buoys = dict(
-            front=self.buoys[:,0,:],
-            left=self.buoys[0,:,:],
-            back=self.buoys[:,-1,:],
-            right=self.buoys[-1,:,:],
-            all=self.buoys
-        )
+        # a marker array has no header of its own
+        stamp = msg.markers[0].header.stamp
+        if stamp == self.line_model.stamp and self.buoys is not None:
+            return
+
+        positions = np.array([(m.pose.position.x,
+                               m.pose.position.y,
+                               m.pose.position.z) for m in msg.markers])
+
+        self.buoys = self.line_model.update(positions, stamp)
 
     def update(self):
 
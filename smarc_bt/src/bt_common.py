@@ -9,8 +9,9 @@ import py_trees as pt
 import py_trees_ros as ptr
 import rospy
 
-import copy # used in ReadTopic
 import time
+from operator import attrgetter # used in ReadTopic
+from collections import OrderedDict
 
 import common_globals
 
@@ -99,47 +100,78 @@ class A_SimplePublisher(pt.behaviour.Behaviour):
 
 
 
-class ReadTopic(pt.behaviour.Behaviour):
+class LRUCache(object):
     """
-    A simple subscriber that returns SUCCESS all the time,
-    even if there is no data in the topic.
-    Puts the data into BB if there is any data
-    Same usage as ptr.subscribers.ToBlackboard, except it doesnt return RUNNING when
-    there is no data.
+    A dict that forgets the least recently used keys past max_size
+    """
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self._d = OrderedDict()
 
-    mostly copied from the "ToBlackboard" behaviour of ptr
+    def get(self, key):
+        value = self._d.pop(key, None)
+        if value is not None:
+            # move to the end, most recent
+            self._d[key] = value
+        return value
+
+    def put(self, key, value):
+        self._d.pop(key, None)
+        self._d[key] = value
+        while len(self._d) > self.max_size:
+            self._d.popitem(last=False)
+
+    def __len__(self):
+        return len(self._d)
+
+
+class TopicReader(object):
+    """
+    The subscriber and the blackboard writing part of ReadTopic, so that
+    one behaviour can read many topics.
+
+    blackboard_variables is a dict of bb_key:field, field is a dotted path into
+    the message like 'pose.position.x' or None for the whole message.
+    The getters for the fields are made once here and the messages are not copied,
+    rospy gives a new message object to every callback.
     """
     def __init__(self,
-                 name,
                  topic_name,
                  topic_type,
                  blackboard_variables,
                  max_period = None,
                  allow_silence = True):
-        self.bb = pt.blackboard.Blackboard()
+        self.topic_name = topic_name
+        self.topic_type = topic_type
         self.blackboard_variables = blackboard_variables
-        self.last_read_value = None
-        self.last_read_time = None
-
         self.max_period = max_period
         self.allow_silence = allow_silence
 
-        self.topic_name = topic_name
-        self.topic_type = topic_type
+        self.accessors = []
+        for k,v in blackboard_variables.items():
+            if v is None:
+                self.accessors.append((k, None))
+            else:
+                self.accessors.append((k, attrgetter(v)))
+
         self.subs = None
         self.msg = None
+        self.last_read_value = None
+        self.last_read_time = None
 
-        super(ReadTopic, self).__init__(name)
-
-    def setup(self, timeout):
+    def setup(self):
         self.subs = rospy.Subscriber(self.topic_name, self.topic_type, self._cb, queue_size=2)
-        return True
 
     def _cb(self, msg):
         self.last_read_time = time.time()
         self.msg = msg
 
-    def update(self):
+    def read(self, bb):
+        """
+        put the latest message, if there is a new one, into the bb
+        returns (status, feedback message)
+        """
+        feedback_message = ""
         if self.last_read_time is not None:
             time_since = time.time() - self.last_read_time
 
@@ -149,34 +181,109 @@ class ReadTopic(pt.behaviour.Behaviour):
                 time_unit = 'm'
 
             if self.max_period is None:
-                self.feedback_message = "Last read:{:.2f}{} ago".format(time_since, time_unit)
+                feedback_message = "Last read:{:.2f}{} ago".format(time_since, time_unit)
             else:
-                self.feedback_message = "Last read:{:.2f}{} ago, max={}s before fail".format(time_since, time_unit, self.max_period)
+                feedback_message = "Last read:{:.2f}{} ago, max={}s before fail".format(time_since, time_unit, self.max_period)
                 if time_since > self.max_period:
-                    return pt.Status.FAILURE
+                    return pt.Status.FAILURE, feedback_message
 
-        if self.msg is None:
+        # take it before the callback can replace it
+        msg = self.msg
+        self.msg = None
+        if msg is None:
             if self.last_read_time is None:
                 if self.allow_silence:
-                    self.feedback_message = "No msg received ever"
+                    feedback_message = "No msg received ever"
                 else:
-                    self.feedback_message = "No message in topic! Silence not allowed!"
+                    feedback_message = "No message in topic! Silence not allowed!"
                     rospy.logwarn_throttle(2, "Waiting for the first message({})".format(self.topic_name))
-                    return pt.Status.FAILURE
-            return pt.Status.SUCCESS
+                    return pt.Status.FAILURE, feedback_message
+            return pt.Status.SUCCESS, feedback_message
 
-        self.last_read_value = copy.copy(self.msg)
-        for k,v in self.blackboard_variables.items():
-            if v is None:
-                self.bb.set(k, self.msg, overwrite=True)
+        self.last_read_value = msg
+        for k, getter in self.accessors:
+            if getter is None:
+                bb.set(k, msg, overwrite=True)
             else:
-                fields = v.split(".")
-                value = copy.copy(self.msg)
-                for field in fields:
-                    value = getattr(value, field)
-                    self.bb.set(k, value, overwrite=True)
+                bb.set(k, getter(msg), overwrite=True)
 
-        self.msg = None
+        return pt.Status.SUCCESS, feedback_message
+
+
+class ReadTopic(pt.behaviour.Behaviour):
+    """
+    A simple subscriber that returns SUCCESS all the time,
+    even if there is no data in the topic.
+    Puts the data into BB if there is any data
+    Same usage as ptr.subscribers.ToBlackboard, except it doesnt return RUNNING when
+    there is no data.
+
+    mostly copied from the "ToBlackboard" behaviour of ptr
+    """
+    def __init__(self,
+                 name,
+                 topic_name,
+                 topic_type,
+                 blackboard_variables,
+                 max_period = None,
+                 allow_silence = True):
+        self.bb = pt.blackboard.Blackboard()
+        self.reader = TopicReader(topic_name,
+                                  topic_type,
+                                  blackboard_variables,
+                                  max_period,
+                                  allow_silence)
+
+        super(ReadTopic, self).__init__(name)
+
+    @property
+    def last_read_value(self):
+        return self.reader.last_read_value
+
+    @property
+    def last_read_time(self):
+        return self.reader.last_read_time
+
+    def setup(self, timeout):
+        self.reader.setup()
+        return True
+
+    def update(self):
+        status, self.feedback_message = self.reader.read(self.bb)
+        return status
+
+
+class ReadTopics(pt.behaviour.Behaviour):
+    """
+    ReadTopic for many topics in one behaviour.
+    topics is a list of dicts with the arguments of ReadTopic, except the name.
+    FAILURE if any of the topics fails, SUCCESS otherwise.
+    """
+    def __init__(self,
+                 name,
+                 topics):
+        self.bb = pt.blackboard.Blackboard()
+        self.readers = [TopicReader(**t) for t in topics]
+
+        super(ReadTopics, self).__init__(name)
+
+    def setup(self, timeout):
+        for reader in self.readers:
+            reader.setup()
+        return True
+
+    def update(self):
+        failed = []
+        for reader in self.readers:
+            status, _ = reader.read(self.bb)
+            if status == pt.Status.FAILURE:
+                failed.append(reader.topic_name)
+
+        if len(failed) > 0:
+            self.feedback_message = "Failed:{}".format(failed)
+            return pt.Status.FAILURE
+
+        self.feedback_message = "Read {} topics".format(len(self.readers))
         return pt.Status.SUCCESS
 
 
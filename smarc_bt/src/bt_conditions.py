@@ -4,7 +4,7 @@
 # Ozer Ozkahraman (ozero@kth.se)
 
 
-import math
+import time
 import rospy
 import py_trees as pt
 import tf
@@ -13,6 +13,8 @@ import numpy as np
 import imc_enums
 import bb_enums
 
+from poi_registry import POIRegistry
+
 class C_CheckWaypointType(pt.behaviour.Behaviour):
     """
     Checks if the type of the current WP corresponds to the given
@@ -122,6 +124,92 @@ class C_LeakOK(pt.behaviour.Behaviour):
             return pt.Status.SUCCESS
 
 
+class C_SafetyMonitorOK(pt.behaviour.Behaviour):
+    """
+    FAILURE if the safety monitor caught something between the ticks,
+    it has already published the emergency by then.
+    Like C_NoAbortReceived, returns FAILURE forever after it returns it once,
+    the reading being fine again does not undo the emergency
+    """
+    def __init__(self):
+        self.bb = pt.blackboard.Blackboard()
+        self.violation = None
+        super(C_SafetyMonitorOK, self).__init__(name="C_SafetyMonitorOK")
+
+    def update(self):
+        if self.violation is None:
+            self.violation = self.bb.get(bb_enums.SAFETY_VIOLATION)
+        if self.violation is None:
+            return pt.Status.SUCCESS
+
+        reason, detection_time = self.violation
+        self.feedback_message = "{}, {:.2f}s ago".format(reason, time.time() - detection_time)
+        return pt.Status.FAILURE
+
+
+class C_EnvelopeOK(pt.behaviour.Behaviour):
+    """
+    FAILURE if the depth or altitude limit is crossed, according to the
+    envelope checker, which is ticked outside the tree.
+    A limit that will be crossed within the horizon is not an emergency,
+    A_AvoidPredictedViolation reacts to that
+    """
+    def __init__(self):
+        self.bb = pt.blackboard.Blackboard()
+        super(C_EnvelopeOK, self).__init__(name="C_EnvelopeOK")
+
+    def update(self):
+        envelope = self.bb.get(bb_enums.ENVELOPE_CHECKER)
+        if envelope is None:
+            return pt.Status.SUCCESS
+
+        self.feedback_message = str(envelope)
+        if envelope.ok:
+            return pt.Status.SUCCESS
+
+        rospy.logwarn_throttle(5, "Envelope: "+str(envelope))
+        if envelope.violated:
+            return pt.Status.FAILURE
+        return pt.Status.SUCCESS
+
+
+class C_SensorsFresh(pt.behaviour.Behaviour):
+    """
+    FAILURE if a sensor has not sent anything for longer than its max age.
+    The dvl is only expected while it is switched on, after it had max age
+    seconds to start
+    """
+    def __init__(self, max_ages):
+        """
+        max_ages -> {source name:seconds}, see Vehicle.freshness for the names
+        """
+        self.bb = pt.blackboard.Blackboard()
+        self.vehicle = self.bb.get(bb_enums.VEHICLE_STATE)
+        self.max_ages = max_ages
+        self._dvl_on_time = None
+        super(C_SensorsFresh, self).__init__(name="C_SensorsFresh")
+
+    def update(self):
+        max_ages = dict(self.max_ages)
+        if 'dvl' in max_ages:
+            if not self.bb.get(bb_enums.DVL_IS_RUNNING):
+                self._dvl_on_time = None
+            elif self._dvl_on_time is None:
+                self._dvl_on_time = time.time()
+            if self._dvl_on_time is None or time.time() - self._dvl_on_time < max_ages['dvl']:
+                del max_ages['dvl']
+
+        stale = self.vehicle.freshness.stale(max_ages)
+        if len(stale) == 0:
+            self.feedback_message = "All fresh"
+            return pt.Status.SUCCESS
+
+        self.feedback_message = ", ".join("{}:{}".format(name, "never" if age is None else "{:.2f}s".format(age))
+                                          for name, age in stale)
+        rospy.logwarn_throttle(5, "Stale sensors! "+self.feedback_message)
+        return pt.Status.FAILURE
+
+
 class C_DepthOK(pt.behaviour.Behaviour):
     def __init__(self):
         self.bb = pt.blackboard.Blackboard()
@@ -244,6 +332,8 @@ class C_PlanIsNotChanged(pt.behaviour.Behaviour):
     """
     Use this condition to stop a running action when a plan with a different
     plan_id or bigger time stamp is seen in the tree.
+    A re-upload that was patched into the running plan keeps the plan object
+    and its time stamp, so it is not seen as a change.
     """
     def __init__(self):
         super(C_PlanIsNotChanged, self).__init__(name="C_PlanIsNotChanged")
@@ -296,14 +386,20 @@ class C_PlanIsNotChanged(pt.behaviour.Behaviour):
 class C_NoNewPOIDetected(pt.behaviour.Behaviour):
     """
     returns SUCCESS until there is a POI detected that is sufficiently further
-    away than the last known one. or if its the first one.
-    This distance is governed by new_pos_distance
+    away than all the known ones. or if its the first one.
+    This distance is governed by new_poi_distance.
+    Every detection is put in the POI registry in the BB, close ones are
+    merged into the known POI.
     """
     def __init__(self, new_poi_distance):
         super(C_NoNewPOIDetected, self).__init__(name="C_NoNewPOIDetected")
         self.bb = pt.blackboard.Blackboard()
         self.new_poi_distance = new_poi_distance
-        self._last_known_poi = None
+        # stamp, frame and position of the last detection that was processed
+        self._last_processed_key = None
+
+        if self.bb.get(bb_enums.POI_REGISTRY) is None:
+            self.bb.set(bb_enums.POI_REGISTRY, POIRegistry(self.new_poi_distance))
 
     def update(self):
         poi = self.bb.get(bb_enums.POI_POINT_STAMPED)
@@ -311,27 +407,100 @@ class C_NoNewPOIDetected(pt.behaviour.Behaviour):
             rospy.loginfo_throttle_identical(10,"No POI :(")
             return pt.Status.SUCCESS
 
-        if self._last_known_poi is None:
-            # a poi exists but we didnt know any beforehand, new poi!
-            self._last_known_poi = poi
-            rospy.logwarn_throttle_identical(10,"Our first POI!")
-            return pt.Status.FAILURE
+        # the same message stays in the bb until a new one comes
+        # it might be a copy of it, so compare what is in it
+        key = (poi.header.stamp.to_sec(),
+               poi.header.frame_id,
+               poi.point.x,
+               poi.point.y,
+               poi.point.z)
+        if key == self._last_processed_key:
+            return pt.Status.SUCCESS
+        self._last_processed_key = key
+
+        registry = self.bb.get(bb_enums.POI_REGISTRY)
+        if registry is None:
+            registry = POIRegistry(self.new_poi_distance)
+            self.bb.set(bb_enums.POI_REGISTRY, registry)
+
+        t = poi.header.stamp.to_sec()
+        if t == 0:
+            t = rospy.get_time()
 
-        # we knew a poi, there is a poi we see, far enough?
-        xdiff = poi.point.x-self._last_known_poi.point.x
-        ydiff = poi.point.y-self._last_known_poi.point.y
-        zdiff = poi.point.z-self._last_known_poi.point.z
-        dist = math.sqrt( xdiff**2 + ydiff**2 + zdiff**2 )
+        known_poi, is_new = registry.add_point_stamped(poi, t)
+        self.feedback_message = "{}, {} known".format(known_poi, len(registry))
 
-        # its far enough!
-        if dist > self.new_poi_distance:
-            self._last_known_poi = poi
-            rospy.logwarn_throttle_identical(10,"A new POI that is far enough!"+str(dist))
+        if is_new:
+            rospy.logwarn_throttle_identical(10,"A new POI that is far enough! "+str(known_poi))
             return pt.Status.FAILURE
 
-        # aww, not far enough
-        self._last_known_poi = poi
-        rospy.loginfo_throttle_identical(10,"Probably the same POI as before...")
+        rospy.loginfo_throttle_identical(10,"Probably the same POI as before... "+str(known_poi))
+        return pt.Status.SUCCESS
+
+
+class C_EnoughBattery(pt.behaviour.Behaviour):
+    """
+    SUCCESS if the energy left in the battery is enough to finish
+    the rest of the mission plan, according to the endurance model in the BB.
+    If the battery state is not known, it is assumed to be enough.
+
+    A feasibility report is put in the BB every tick and logged
+    once for every new plan. The energy the rest of the plan needs is
+    only computed again when the plan or its current waypoint changed.
+    Only the start of a plan is held back, once a plan passed the check
+    it is continued and only warned about, failing here in the middle of
+    a mission would leave the vehicle idle where it is.
+    if enforce=False, only reports and always returns SUCCESS.
+    """
+    def __init__(self, enforce=True):
+        super(C_EnoughBattery, self).__init__(name="C_EnoughBattery")
+        self.bb = pt.blackboard.Blackboard()
+        self.enforce = enforce
+        self._reported_plan = None
+        self._started_plan = None
+        # ((plan, current_wp_index, num_patches, model), required Wh)
+        self._required = None
+
+    def update(self):
+        model = self.bb.get(bb_enums.ENDURANCE_MODEL)
+        mission_plan = self.bb.get(bb_enums.MISSION_PLAN_OBJ)
+        vehicle = self.bb.get(bb_enums.VEHICLE_STATE)
+        if model is None or mission_plan is None or vehicle is None:
+            self.feedback_message = "No endurance model or plan"
+            return pt.Status.SUCCESS
+
+        position = vehicle.position_utm
+        if None in position:
+            position = None
+
+        key = (mission_plan, mission_plan.current_wp_index, mission_plan.num_patches, model)
+        if self._required is None or self._required[0] != key:
+            from_index = max(mission_plan.current_wp_index, 0)
+            self._required = (key, model.plan_energy(mission_plan, position, from_index))
+
+        report = model.feasibility_report(mission_plan,
+                                          vehicle.battery_msg,
+                                          position,
+                                          required = self._required[1])
+        self.bb.set(bb_enums.ENDURANCE_REPORT, report)
+
+        if report['available_wh'] is None:
+            self.feedback_message = "Battery unknown, need {:.1f}Wh".format(report['required_wh'])
+        else:
+            self.feedback_message = "Need {:.1f}Wh, have {:.1f}Wh".format(report['required_wh'], report['available_wh'])
+
+        if mission_plan is not self._reported_plan:
+            self._reported_plan = mission_plan
+            rospy.loginfo("Plan {} energy report: {}".format(mission_plan.plan_id, report))
+            if not report['feasible']:
+                rospy.logwarn("The battery is not enough to finish plan {}!".format(mission_plan.plan_id))
+
+        if not report['feasible']:
+            rospy.logwarn_throttle(10, "Not enough battery for the rest of the plan! "+self.feedback_message)
+            if self.enforce and mission_plan is not self._started_plan:
+                return pt.Status.FAILURE
+
+        self._started_plan = mission_plan
         return pt.Status.SUCCESS
 
 
@@ -0,0 +1,204 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Groups the buoys of an algae farm into lines.
+The farm is assumed to be a set of parallel lines, with any number
+of buoys on each line and in any orientation.
+
+The principal axis of the buoys is not always along the lines, it says
+nothing about them when the buoys are spread about as much in every direction,
+like in a square farm. Then, or when the split along the principal axis has
+lines that overlap, the axes of the grid the buoys are on are tried as well
+and the one that splits them cleanly into the fewest lines is used.
+"""
+
+import numpy as np
+
+
+def split_on_gaps(coords, min_gap):
+    """
+    coords is a 1D array
+    returns an array of labels, points that are separated by
+    more than min_gap in coords get different labels.
+    labels increase with coords.
+    """
+    order = np.argsort(coords)
+    gaps = np.diff(coords[order])
+    new_group = np.concatenate([[0], (gaps > min_gap).astype(int)])
+    labels = np.empty(len(coords), dtype=int)
+    labels[order] = np.cumsum(new_group)
+    return labels
+
+
+def grid_axes(xy):
+    """
+    xy is an (N,2) array, N>1.
+    returns the two perpendicular directions the buoys are lined up on,
+    from the directions to the nearest neighbour of each buoy.
+    """
+    diffs = xy[:,None,:] - xy[None,:,:]
+    dists = np.hypot(diffs[:,:,0], diffs[:,:,1])
+    np.fill_diagonal(dists, np.inf)
+    nearest = diffs[np.arange(len(xy)), np.argmin(dists, axis=1)]
+    angles = np.arctan2(nearest[:,1], nearest[:,0])
+    # 4 times the angle so that the 4 directions of a grid add up
+    angle = np.angle(np.exp(4j*angles).sum()) / 4.
+    direction = np.array([np.cos(angle), np.sin(angle)])
+    return direction, np.array([-direction[1], direction[0]])
+
+
+def split_quality(across, labels):
+    """
+    meters between the closest two lines minus the widest line, across the lines.
+    larger is a cleaner split, None if it is not a split into lines at all.
+    """
+    num_lines = labels.max()+1
+    if num_lines < 2 or num_lines == len(across):
+        return None
+    lows = np.full(num_lines, np.inf)
+    highs = np.full(num_lines, -np.inf)
+    np.minimum.at(lows, labels, across)
+    np.maximum.at(highs, labels, across)
+    separation = np.min(lows[1:] - highs[:-1])
+    width = np.max(highs - lows)
+    return separation - width
+
+
+def fit_buoy_lines(points, min_line_separation, isotropy_ratio=0.5):
+    """
+    points is an (N,3) array of buoy positions.
+    the direction of the lines is found with PCA over all the buoys,
+    then the buoys are split into lines by the gaps perpendicular to that
+    direction.
+    if the smaller spread is more than isotropy_ratio of the larger one or
+    that split is not clean, the axes of the grid are tried too. the clean
+    split with the fewest lines is used, then the cleanest one, then the
+    one with the lines closest to the y axis.
+
+    returns a dict with:
+        lines -> list of (M,3) arrays, each sorted along the line direction
+        direction, normal -> 2D unit vectors of the lines and across them
+        offsets -> mean position of each line along the normal
+        front, back -> first and last buoy of each line
+        left, right -> first and last line
+        all -> (L,M,3) array if all lines have the same number of buoys, list of lines otherwise
+    """
+    points = np.asarray(points, dtype=float)
+    if len(points) == 0:
+        return None
+
+    xy = points[:,:2]
+    center = xy.mean(axis=0)
+    centered = xy - center
+
+    isotropic = False
+    if len(points) > 1:
+        # eigh gives ascending eigenvalues, last one is the principal axis
+        vals, vecs = np.linalg.eigh(np.cov(centered.T))
+        direction = vecs[:,1]
+        isotropic = len(points) > 2 and vals[0] > isotropy_ratio*vals[1]
+    else:
+        direction = np.array([1., 0.])
+
+    def pointing(direction):
+        # keep the direction pointing the same way between fits
+        if direction[0] < 0 or (direction[0] == 0 and direction[1] < 0):
+            direction = -direction
+        return direction, np.array([-direction[1], direction[0]])
+
+    direction, normal = pointing(direction)
+
+    def split(direction, normal):
+        across = centered.dot(normal)
+        gaps = np.diff(np.sort(across))
+        min_gap = min_line_separation
+        if len(gaps) > 0:
+            min_gap = max(min_line_separation, 0.5*gaps.max())
+        return split_on_gaps(across, min_gap), across
+
+    labels, across = split(direction, normal)
+    quality = split_quality(across, labels)
+    if len(points) > 2 and (isotropic or quality is None or quality <= 0):
+        best = None
+        candidates = [direction, normal]
+        candidates.extend(grid_axes(centered))
+        for candidate in candidates:
+            c_direction, c_normal = pointing(candidate)
+            c_labels, c_across = split(c_direction, c_normal)
+            quality = split_quality(c_across, c_labels)
+            if quality is None:
+                continue
+            # rounded to the cm so that the same split from a slightly
+            # different axis is a tie
+            key = (quality > 0, -(c_labels.max()+1), round(quality, 2), round(abs(c_direction[1]), 2))
+            if best is None or key > best[0]:
+                best = (key, c_direction, c_normal, c_labels, c_across)
+        if best is not None:
+            _, direction, normal, labels, across = best
+    num_lines = labels.max()+1
+    # every buoy on its own line means the lines were across the principal axis
+    # (a farm that is wider than it is long)
+    if num_lines == len(points) and len(points) > 1:
+        direction, normal = normal, -direction
+        labels, across = split(direction, normal)
+        num_lines = labels.max()+1
+
+    along = centered.dot(direction)
+    # sort by line first, then along the line
+    order = np.lexsort((along, labels))
+    sorted_points = points[order]
+    counts = np.bincount(labels, minlength=num_lines)
+    bounds = np.cumsum(counts)[:-1]
+    lines = np.split(sorted_points, bounds)
+
+    offsets = np.bincount(labels, weights=across) / counts
+
+    if np.all(counts == counts[0]):
+        all_buoys = sorted_points.reshape((num_lines, counts[0], 3))
+    else:
+        all_buoys = lines
+
+    return dict(
+        lines=lines,
+        direction=direction,
+        normal=normal,
+        offsets=offsets,
+        front=np.array([l[0] for l in lines]),
+        back=np.array([l[-1] for l in lines]),
+        left=lines[0],
+        right=lines[-1],
+        all=all_buoys
+    )
+
+
+class BuoyLineModel(object):
+    """
+    Caches the fitted lines, only re-fits when the buoys have
+    a new stamp _and_ have moved more than move_tolerance.
+    """
+    def __init__(self, min_line_separation=2., move_tolerance=0.05):
+        self.min_line_separation = min_line_separation
+        self.move_tolerance = move_tolerance
+
+        self.stamp = None
+        self.points = None
+        self.model = None
+        self.num_fits = 0
+
+    def update(self, points, stamp=None):
+        if stamp is not None and stamp == self.stamp and self.model is not None:
+            return self.model
+
+        points = np.asarray(points, dtype=float)
+        self.stamp = stamp
+        if self.points is not None and \
+           self.points.shape == points.shape and \
+           np.max(np.abs(self.points - points)) <= self.move_tolerance:
+            return self.model
+
+        self.points = points
+        self.model = fit_buoy_lines(points, self.min_line_separation)
+        self.num_fits += 1
+        return self.model
@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Keeps the progress of the current plan on disk so that a restarted BT
+can continue the plan where it was left.
+The waypoints of a plan are written once, to a file named by their md5.
+The checkpoint itself is small: the md5, the waypoint index, the go state and
+how long the mission log was. It is written whenever one of those changes,
+to a temporary file that is then renamed over the old one, so a crash in the
+middle of a write leaves the previous checkpoint in place.
+On a tick only the copies of what is written are made, the writing is done in
+a worker thread, the log first and then the checkpoint that points into it.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+from service_client import run_async
+
+
+def plan_digest(waypoint_dicts):
+    s = json.dumps(waypoint_dicts, sort_keys=True)
+    return hashlib.md5(s.encode('utf-8')).hexdigest()
+
+
+def write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, path)
+
+
+class CheckpointStore(object):
+    def __init__(self, folder):
+        """
+        folder -> where the checkpoint and the plans are written, created if needed
+        """
+        self.folder = os.path.expanduser(folder)
+        self.checkpoint_path = os.path.join(self.folder, 'checkpoint.json')
+        self.disabled = False
+        try:
+            if not os.path.exists(self.folder):
+                os.makedirs(self.folder)
+        except:
+            print("Checkpoint folder({}) could not be created!".format(self.folder))
+            self.disabled = True
+
+        # what was written last, to only write when something changed
+        self._last_state = None
+        # writes are done one at a time and in the order they were made
+        self._write_lock = threading.Lock()
+        self._num_writes = 0
+        self._written = 0
+        self._job = None
+
+    def _plan_path(self, digest):
+        return os.path.join(self.folder, 'plan_{}.json'.format(digest))
+
+    def _prepare(self, mission_plan, mission_log=None):
+        """
+        everything a write needs, copied from the plan and the log so that
+        the write does not have to touch them.
+        returns (number, plan dict, checkpoint dict, log, log snapshot),
+        plan dict and checkpoint dict are None to clear the checkpoint
+        """
+        self._num_writes += 1
+        if mission_plan is None:
+            return self._num_writes, None, None, None, None
+
+        waypoint_dicts = [wp.to_dict() for wp in mission_plan.waypoints]
+        digest = plan_digest(waypoint_dicts)
+        plan = {'plan_id':mission_plan.plan_id,
+                'plan_md5':digest,
+                'waypoints':waypoint_dicts}
+
+        checkpoint = {'plan_id':mission_plan.plan_id,
+                      'plan_md5':digest,
+                      'creation_time':mission_plan.creation_time,
+                      'current_wp_index':mission_plan.current_wp_index,
+                      'plan_is_go':mission_plan.plan_is_go,
+                      'log_path':None,
+                      'log_length':0,
+                      'time':time.time()}
+
+        # the log on disk is brought up to the checkpoint too
+        log_snapshot = None
+        if mission_log is not None and not mission_log.disabled and \
+           mission_log.creation_time == mission_plan.creation_time:
+            log_snapshot = mission_log.snapshot()
+            checkpoint['log_path'] = mission_log.data_full_path
+            checkpoint['log_length'] = len(log_snapshot[1]['time_trace'])
+        else:
+            mission_log = None
+
+        return self._num_writes, plan, checkpoint, mission_log, log_snapshot
+
+    def _write(self, prepared):
+        number, plan, checkpoint, mission_log, log_snapshot = prepared
+        with self._write_lock:
+            if number <= self._written:
+                return
+            self._written = number
+
+            if checkpoint is None:
+                self.clear()
+                return
+
+            plan_path = self._plan_path(plan['plan_md5'])
+            if not os.path.exists(plan_path):
+                write_atomic(plan_path, {'plan_id':plan['plan_id'],
+                                         'waypoints':plan['waypoints']})
+            if mission_log is not None:
+                mission_log.write(log_snapshot)
+            write_atomic(self.checkpoint_path, checkpoint)
+
+    def save(self, mission_plan, mission_log=None):
+        """
+        writes the checkpoint right away.
+        returns the checkpoint dict that was written, None if nothing was
+        """
+        if self.disabled:
+            return None
+
+        prepared = self._prepare(mission_plan, mission_log)
+        self._write(prepared)
+        return prepared[2]
+
+    def clear(self):
+        """
+        nothing to resume anymore, the plan files are kept
+        """
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def tick(self, mission_plan, mission_log=None):
+        """
+        writes a checkpoint if the plan, its waypoint index or go state changed.
+        a finished or removed plan clears the checkpoint.
+        returns True if something was written or cleared
+        """
+        if self.disabled:
+            return False
+
+        if mission_plan is None or mission_plan.is_complete():
+            state = None
+        else:
+            state = (id(mission_plan),
+                     len(mission_plan.waypoints),
+                     mission_plan.num_patches,
+                     mission_plan.current_wp_index,
+                     mission_plan.plan_is_go)
+
+        if self._job is not None and self._job.done():
+            try:
+                self._job.get()
+            except Exception as e:
+                print("Checkpoint could not be written: {}".format(e))
+            self._job = None
+
+        if state == self._last_state:
+            return False
+        self._last_state = state
+
+        prepared = self._prepare(None if state is None else mission_plan, mission_log)
+        self._job = run_async(self._write, prepared)
+        return True
+
+    def wait(self, timeout=5.):
+        """
+        waits for the last write that tick started, returns True if it is done
+        """
+        start_time = time.time()
+        while self._job is not None and not self._job.done():
+            if time.time() - start_time > timeout:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def load(self):
+        """
+        returns (checkpoint dict, list of waypoint dicts) or None if there is
+        nothing to resume
+        """
+        if self.disabled or not os.path.exists(self.checkpoint_path):
+            return None
+
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+            with open(self._plan_path(checkpoint['plan_md5']), 'r') as f:
+                plan = json.load(f)
+        except Exception as e:
+            print("Checkpoint could not be read: {}".format(e))
+            return None
+
+        # the plan file is named by its md5, but better safe than sorry
+        if plan_digest(plan['waypoints']) != checkpoint['plan_md5']:
+            print("Checkpoint plan does not match its md5!")
+            return None
+
+        return checkpoint, plan['waypoints']
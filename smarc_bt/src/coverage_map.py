@@ -0,0 +1,331 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+A grid in utm that counts how many times each cell was inside the swath of the vehicle.
+The grid covers the waypoints of the current plan. Every update rasterizes the
+swath between the previous and current position, a rectangle of swath width
+perpendicular to the movement, in one go with numpy.
+The cells within a swath of the legs of the plan are the target of the coverage.
+Target cells that are not covered on legs the vehicle has already finished are gaps.
+The gaps are found again when a leg is finished, new coverage only changes
+them once every gaps_period seconds.
+"""
+
+import math
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from nav_msgs.msg import OccupancyGrid
+
+from coverage_planner import create_coverage_path
+
+
+# values in the published OccupancyGrid
+CELL_COVERED = 0
+CELL_GAP = 100
+CELL_UNKNOWN = -1
+
+
+def rect_mask(xs, ys, p0, p1, half_width):
+    """
+    xs, ys are cell center coordinates, broadcastable to each other.
+    True for the cells inside the rectangle from p0 to p1 that is 2*half_width wide.
+    The end at p1 is excluded so that consecutive rectangles do not count twice.
+    """
+    dx = p1[0] - p0[0]
+    dy = p1[1] - p0[1]
+    length = math.hypot(dx, dy)
+    rx = xs - p0[0]
+    ry = ys - p0[1]
+    if length == 0:
+        return np.zeros(np.broadcast(rx, ry).shape, dtype=bool)
+    ux = dx / length
+    uy = dy / length
+    along = rx*ux + ry*uy
+    across = -rx*uy + ry*ux
+    return (along >= 0) & (along < length) & (np.abs(across) <= half_width)
+
+
+def label_cells(mask, min_cells=1):
+    """
+    4-connected groups of the True cells of mask with at least min_cells cells.
+    returns a list of (N,2) arrays of (row, col) indices, one per group
+    """
+    # the default structure of label is 4-connected
+    labels, num_labels = ndimage.label(mask)
+    if num_labels == 0:
+        return []
+    rows, cols = np.nonzero(labels)
+    cell_labels = labels[rows, cols]
+    order = np.argsort(cell_labels, kind='mergesort')
+    sizes = np.bincount(cell_labels, minlength=num_labels+1)[1:]
+    groups = np.split(np.stack([rows[order], cols[order]], axis=-1), np.cumsum(sizes)[:-1])
+    return [g for g in groups if len(g) >= min_cells]
+
+
+class CoverageMap(object):
+    def __init__(self,
+                 resolution = 1.,
+                 min_gap_area = 4.,
+                 max_step = 50.,
+                 max_cells = 4000000,
+                 gaps_period = 5.):
+        """
+        resolution -> meters per cell
+        min_gap_area -> m2, smaller groups of uncovered cells are not reported as gaps
+        max_step -> meters, a jump in position larger than this is not counted as covered
+        max_cells -> plans that need a larger grid than this are not mapped
+        gaps_period -> seconds, found gaps are kept this long if only the coverage changed
+        """
+        self.resolution = float(resolution)
+        self.min_gap_area = min_gap_area
+        self.max_step = max_step
+        self.max_cells = max_cells
+        self.gaps_period = gaps_period
+
+        self._last_position = None
+        self._reset(None, None)
+
+    def _reset(self, mission_plan, swath):
+        self._plan = mission_plan
+        self._num_patches = 0 if mission_plan is None else mission_plan.num_patches
+        self._swath = swath
+        self._last_position = None
+        self.origin = None
+        self.counts = None
+        self.target = None
+        # target cells of the legs that are finished
+        self.passed = None
+        self._passed_index = 0
+        self._num_waypoints = 0
+        self._last_change_time = time.time()
+        self._gaps = None
+        self._gaps_time = 0
+        # covered cells changed since the gaps were found
+        self._gaps_outdated = False
+
+        if mission_plan is None or swath is None or len(mission_plan.waypoints) == 0:
+            return
+
+        points = np.array([(wp.x, wp.y) for wp in mission_plan.waypoints])
+        margin = swath
+        mins = points.min(axis=0) - margin
+        maxs = points.max(axis=0) + margin
+        shape = np.ceil((maxs - mins) / self.resolution).astype(int) + 1
+        if shape[0] * shape[1] > self.max_cells:
+            return
+
+        self.origin = mins
+        # rows are y, cols are x, same as OccupancyGrid
+        self.counts = np.zeros((shape[1], shape[0]), dtype=np.int32)
+        self.target = np.zeros_like(self.counts, dtype=bool)
+        self.passed = np.zeros_like(self.target)
+        self._add_target_legs(points)
+
+    def _add_target_legs(self, points):
+        for p0, p1 in zip(points[:-1], points[1:]):
+            window = self._window(p0, p1, self._swath/2.)
+            if window is None:
+                continue
+            rows, cols, xs, ys = window
+            self.target[rows, cols] |= rect_mask(xs, ys, p0, p1, self._swath/2.)
+        self._num_waypoints = len(points)
+
+    def _window(self, p0, p1, half_width):
+        """
+        the part of the grid that can be touched by the rectangle p0->p1
+        returns (row slice, col slice, cell center xs, cell center ys) or None if outside
+        """
+        lo = (np.minimum(p0, p1) - half_width - self.origin) / self.resolution
+        hi = (np.maximum(p0, p1) + half_width - self.origin) / self.resolution
+        c0, r0 = np.maximum(np.floor(lo).astype(int), 0)
+        c1, r1 = np.minimum(np.ceil(hi).astype(int) + 1, (self.counts.shape[1], self.counts.shape[0]))
+        if c0 >= c1 or r0 >= r1:
+            return None
+        xs = self.origin[0] + (np.arange(c0, c1) + 0.5) * self.resolution
+        ys = self.origin[1] + (np.arange(r0, r1) + 0.5) * self.resolution
+        return slice(r0, r1), slice(c0, c1), xs[np.newaxis, :], ys[:, np.newaxis]
+
+    def add_swath(self, p0, p1):
+        if self.counts is None:
+            return
+        window = self._window(p0, p1, self._swath/2.)
+        if window is None:
+            return
+        rows, cols, xs, ys = window
+        self.counts[rows, cols] += rect_mask(xs, ys, p0, p1, self._swath/2.)
+        self._last_change_time = time.time()
+        self._gaps_outdated = True
+
+    def _update_passed(self, mission_plan):
+        # legs that end before the current waypoint are done
+        index = mission_plan.current_wp_index
+        if mission_plan.is_complete():
+            index = len(mission_plan.waypoints)
+        points = [(wp.x, wp.y) for wp in mission_plan.waypoints]
+        while self._passed_index + 1 < min(index, len(points)):
+            p0 = np.array(points[self._passed_index])
+            p1 = np.array(points[self._passed_index + 1])
+            window = self._window(p0, p1, self._swath/2.)
+            if window is not None:
+                rows, cols, xs, ys = window
+                self.passed[rows, cols] |= rect_mask(xs, ys, p0, p1, self._swath/2.)
+            self._passed_index += 1
+            self._gaps = None
+
+    def update(self, mission_plan, position, swath):
+        """
+        position -> (x,y) in utm, can be None
+        """
+        if mission_plan is not self._plan or swath != self._swath or \
+           (mission_plan is not None and mission_plan.num_patches != self._num_patches):
+            self._reset(mission_plan, swath)
+
+        if self.counts is None:
+            return
+
+        # waypoints added to the end of the plan, like gap fills
+        if len(mission_plan.waypoints) > self._num_waypoints:
+            points = np.array([(wp.x, wp.y) for wp in mission_plan.waypoints[self._num_waypoints-1:]])
+            self._add_target_legs(points)
+            self._num_waypoints = len(mission_plan.waypoints)
+            self._gaps = None
+
+        if position is not None and None in position:
+            position = None
+
+        if position is not None:
+            position = np.array(position, dtype=float)
+            if self._last_position is not None:
+                step = np.linalg.norm(position - self._last_position)
+                if step <= self.max_step:
+                    self.add_swath(self._last_position, position)
+            self._last_position = position
+
+        self._update_passed(mission_plan)
+
+    def tick(self, vehicle, mission_plan, swath):
+        self.update(mission_plan, vehicle.position_utm, swath)
+
+    @property
+    def percent_covered(self):
+        if self.target is None or not self.target.any():
+            return 0.
+        return 100. * np.count_nonzero(self.target & (self.counts > 0)) / float(np.count_nonzero(self.target))
+
+    def gap_mask(self):
+        if self.target is None:
+            return None
+        return self.target & self.passed & (self.counts == 0)
+
+    def find_gaps(self, max_age=None):
+        """
+        groups of uncovered target cells on the finished legs.
+        max_age -> seconds, the gaps found this recently are returned as they were
+        even if there is new coverage, gaps_period if None
+        returns a list of dicts with the utm cell centers, area and center of each gap
+        """
+        if max_age is None:
+            max_age = self.gaps_period
+        if self._gaps is not None and \
+           (not self._gaps_outdated or time.time() - self._gaps_time < max_age):
+            return self._gaps
+
+        mask = self.gap_mask()
+        if mask is None:
+            return []
+
+        cell_area = self.resolution**2
+        gaps = []
+        for cells in label_cells(mask, int(math.ceil(round(self.min_gap_area / cell_area, 6)))):
+            area = len(cells) * cell_area
+            xs = self.origin[0] + (cells[:,1] + 0.5) * self.resolution
+            ys = self.origin[1] + (cells[:,0] + 0.5) * self.resolution
+            points = np.stack([xs, ys], axis=-1)
+            gaps.append({'points': points,
+                         'area': area,
+                         'center': points.mean(axis=0)})
+        self._gaps = gaps
+        self._gaps_time = time.time()
+        self._gaps_outdated = False
+        return gaps
+
+    def to_occupancy_grid(self, frame_id):
+        """
+        covered cells are free(0), gaps are occupied(100), everything else unknown(-1)
+        """
+        if self.counts is None:
+            return None
+
+        data = np.full(self.counts.shape, CELL_UNKNOWN, dtype=np.int8)
+        data[self.counts > 0] = CELL_COVERED
+        data[self.gap_mask()] = CELL_GAP
+
+        grid = OccupancyGrid()
+        grid.header.frame_id = frame_id
+        grid.info.resolution = self.resolution
+        grid.info.height, grid.info.width = self.counts.shape
+        grid.info.origin.position.x = self.origin[0]
+        grid.info.origin.position.y = self.origin[1]
+        grid.info.origin.orientation.w = 1.
+        grid.data = data.ravel().tolist()
+        return grid
+
+    @property
+    def last_change_time(self):
+        return self._last_change_time
+
+    def to_dict(self):
+        gaps = self.find_gaps()
+        return {'coverage_percent': float(self.percent_covered),
+                'coverage_gaps': len(gaps),
+                'coverage_gap_area': float(sum(g['area'] for g in gaps))}
+
+    def __str__(self):
+        return "Coverage:{:.1f}% gaps:{}".format(self.percent_covered, len(self.find_gaps()))
+
+
+def gap_polygon(points, padding):
+    """
+    the corners of a rectangle along the principal axis of the points,
+    grown by padding on all sides
+    """
+    center = points.mean(axis=0)
+    centered = points - center
+    if len(points) > 1:
+        _, _, vt = np.linalg.svd(centered, full_matrices=False)
+        axis = vt[0]
+    else:
+        axis = np.array([1., 0.])
+    normal = np.array([-axis[1], axis[0]])
+    along = centered.dot(axis)
+    across = centered.dot(normal)
+    a0, a1 = along.min() - padding, along.max() + padding
+    n0, n1 = across.min() - padding, across.max() + padding
+    return np.array([center + a*axis + n*normal for a, n in ((a0, n0), (a1, n0), (a1, n1), (a0, n1))])
+
+
+def plan_gap_fill(gaps, start, swath, error_growth, padding):
+    """
+    a short mower pattern over each gap, visiting the gaps nearest first from start.
+    gaps is the list from CoverageMap.find_gaps
+    returns a list of (N,2) arrays of points, one per gap
+    """
+    remaining = list(gaps)
+    position = np.asarray(start, dtype=float)
+    paths = []
+    while remaining:
+        dists = [np.linalg.norm(g['center'] - position) for g in remaining]
+        gap = remaining.pop(int(np.argmin(dists)))
+        polygon = gap_polygon(gap['points'], padding)
+        # the pattern starts close to the first corner
+        first = int(np.argmin(np.linalg.norm(polygon - position, axis=1)))
+        polygon = np.roll(polygon, -first, axis=0)
+        path = create_coverage_path(polygon, swath, error_growth)
+        paths.append(path)
+        position = path[-1]
+    return paths
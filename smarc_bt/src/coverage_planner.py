@@ -4,6 +4,7 @@
 # Ozer Ozkahraman (ozero@kth.se)
 
 
+import math
 import numpy as np
 from numpy import *
 
@@ -236,20 +237,234 @@ def rotate_vec_vec(v1s, rads):
 
 
 
-def create_coverage_path(polygon, swath, error_growth):
+class CurrentField(object):
+    """
+    Water current, either constant or sampled on a regular grid.
+    The grid file is a text file with x y u v columns, one row per grid point,
+    in the same (utm) frame as the plan. Lookups give the closest grid point.
+    """
+    def __init__(self, xs, ys, u, v):
+        # xs, ys are the sorted unique grid coordinates
+        # u, v are (len(ys), len(xs)) arrays
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        self.u = np.asarray(u, dtype=float)
+        self.v = np.asarray(v, dtype=float)
+
+    @staticmethod
+    def constant(u, v):
+        return CurrentField([0.], [0.], [[u]], [[v]])
+
+    @staticmethod
+    def from_file(path):
+        data = np.loadtxt(path, ndmin=2)
+        xs = np.unique(data[:,0])
+        ys = np.unique(data[:,1])
+        u = np.zeros((len(ys), len(xs)))
+        v = np.zeros((len(ys), len(xs)))
+        xi = np.searchsorted(xs, data[:,0])
+        yi = np.searchsorted(ys, data[:,1])
+        u[yi, xi] = data[:,2]
+        v[yi, xi] = data[:,3]
+        return CurrentField(xs, ys, u, v)
+
+    @staticmethod
+    def _closest(grid, values):
+        if len(grid) == 1:
+            return np.zeros(len(values), dtype=int)
+        i = np.clip(np.searchsorted(grid, values), 1, len(grid)-1)
+        left = grid[i-1]
+        right = grid[i]
+        return np.where(values - left < right - values, i-1, i)
+
+    def at(self, points):
+        """
+        points is (N,2), returns the (N,2) current at those points
+        """
+        points = np.atleast_2d(points)
+        xi = CurrentField._closest(self.xs, points[:,0])
+        yi = CurrentField._closest(self.ys, points[:,1])
+        return np.stack([self.u[yi, xi], self.v[yi, xi]], axis=-1)
+
+
+def ground_speeds(headings, water_speed, current):
+    """
+    speed over ground along the given headings when the vehicle
+    moves with water_speed through the water and crabs against the current.
+    headings is an array, current is (2,).
+    0 where the current can not be beaten.
+    """
+    along = current[0]*np.cos(headings) + current[1]*np.sin(headings)
+    cross = -current[0]*np.sin(headings) + current[1]*np.cos(headings)
+    margin = water_speed**2 - cross**2
+    speed = along + np.sqrt(np.clip(margin, 0, None))
+    return np.where((margin > 0) & (speed > 0), speed, 0.)
+
+
+def leg_water_speeds(path, current_field, travel_speed, max_speed):
+    """
+    the speed through the water for each leg of the path that keeps
+    the speed over ground at travel_speed, as long as max_speed allows.
+    legs with the current go slower, legs against it go faster.
+    returns an array of len(path)-1
+    """
+    path = np.asarray(path, dtype=float)
+    deltas = np.diff(path, axis=0)
+    headings = np.arctan2(deltas[:,1], deltas[:,0])
+    currents = current_field.at((path[:-1] + path[1:]) / 2.)
+
+    along = currents[:,0]*np.cos(headings) + currents[:,1]*np.sin(headings)
+    cross = -currents[:,0]*np.sin(headings) + currents[:,1]*np.cos(headings)
+    # |ground*dir - current| = needed water speed
+    needed = np.sqrt((travel_speed - along)**2 + cross**2)
+    return np.clip(needed, 0, max_speed)
+
+
+def mower_pattern_segments(rect_width_d, rect_height_h, sweep_width_w, error_growth_k):
+    """
+    the segments of create_mower_pattern for many rectangles at once.
+    rect_width_d, rect_height_h are (N,) arrays, the pattern of every
+    rectangle is followed step by step in the same arrays.
+    returns (deltas, valid), (N,S,2) segment vectors in the frame of the
+    pattern and the (N,S) mask of the segments each pattern has
+    """
+    d = np.atleast_1d(np.asarray(rect_width_d, dtype=float))
+    h = np.atleast_1d(np.asarray(rect_height_h, dtype=float))
+    w = float(sweep_width_w)
+    k = float(error_growth_k)
+    zeros = np.zeros_like(d)
+
+    b = w / (1.0 + k)
+    def s_next(s):
+        return (1.0 + k) * s / (1.0 - k) + 2.0 * k * b / (1.0 - k)
+
+    s_old = (d + b * k) / (1.0 - k)
+    deltas = [np.stack([s_old, -s_old * k], axis=-1)]
+    valid = [np.ones(len(d), dtype=bool)]
+    path_length = np.hypot(s_old, s_old * k)
+    # y of the last two points
+    y_2 = np.full(len(d), w / 2.0)
+    y_1 = y_2 - s_old * k
+    active = np.ones(len(d), dtype=bool)
+
+    for i in range(23):
+        y_a = y_1 + b
+        s_new = s_next(s_old)
+        c_i = w - k * (s_new + s_old + b)
+        # the pattern ends before this point
+        active = active & (c_i > 0)
+        y_b = y_2 + c_i
+        deltas += [np.stack([zeros, zeros + b], axis=-1),
+                   np.stack([-s_new, y_b - y_a], axis=-1)]
+        valid += [active, active]
+        path_length = path_length + b + np.hypot(s_new, y_b - y_a)
+        active = active & ~(h < y_b + w / 2.0 - path_length * k)
+
+        y_c = y_b + b
+        s_old = s_new
+        s_new = s_next(s_old)
+        c_i = w - k * (s_new + s_old + b)
+        y_d = y_a + c_i
+        deltas += [np.stack([zeros, zeros + b], axis=-1),
+                   np.stack([s_new, y_d - y_c], axis=-1)]
+        valid += [active, active]
+        path_length = path_length + b + np.hypot(s_new, y_d - y_c)
+        s_old = s_new
+        active = active & ~(h < y_d + w / 2.0 - path_length * k)
+
+        y_2, y_1 = y_c, y_d
+        if not np.any(active):
+            break
+
+    return np.stack(deltas, axis=1), np.stack(valid, axis=1)
+
+
+def best_leg_heading(polygon, swath, current_field, travel_speed, max_speed, error_growth=0., num_headings=36):
+    """
+    predicted time to cover the polygon with legs along each of num_headings
+    directions in [0, pi), along either side of the polygon.
+    The time is that of the mower pattern that would be made for the heading,
+    so the legs that grow with the error growth and the extra leg it might
+    add are counted. All the headings are evaluated together.
+    returns (heading, predicted time in seconds), time is inf if no heading works
+    """
+    polygon = np.asarray(polygon, dtype=float)
+    current = current_field.at(polygon).mean(axis=0)
+    headings = np.linspace(0, np.pi, num_headings, endpoint=False)
+
+    # extent of the polygon along and across every heading
+    cos = np.cos(headings)[:,np.newaxis]
+    sin = np.sin(headings)[:,np.newaxis]
+    along_proj = polygon[:,0]*cos + polygon[:,1]*sin
+    across_proj = -polygon[:,0]*sin + polygon[:,1]*cos
+    leg_length = along_proj.max(axis=1) - along_proj.min(axis=1)
+    width = across_proj.max(axis=1) - across_proj.min(axis=1)
+
+    # (num_headings, segments) of every pattern
+    deltas, valid = mower_pattern_segments(leg_length, width, swath, error_growth)
+    lengths = np.hypot(deltas[...,0], deltas[...,1])
+    moving = valid & (lengths > 0)
+    segment_headings = headings[:,np.newaxis] + np.arctan2(deltas[...,1], deltas[...,0])
+    gs = np.minimum(ground_speeds(segment_headings, max_speed, current), travel_speed)
+
+    times = np.where(moving, lengths / np.where(gs > 0, gs, 1.), 0.)
+    total = times.sum(axis=1)
+    # a segment that can not be done
+    total[np.any(moving & (gs <= 0), axis=1)] = np.inf
+
+    best = int(np.argmin(total))
+    return headings[best], total[best]
+
+
+def _rect_at_heading(polygon, heading):
+    """
+    bounding rectangle of the polygon with its x axis along heading
+    returns width (along heading), height, center
+    """
+    c, s = math.cos(heading), math.sin(heading)
+    along = polygon[:,0]*c + polygon[:,1]*s
+    across = -polygon[:,0]*s + polygon[:,1]*c
+    mid_along = (along.max() + along.min()) / 2.
+    mid_across = (across.max() + across.min()) / 2.
+    center = np.array([mid_along*c - mid_across*s, mid_along*s + mid_across*c])
+    return along.max() - along.min(), across.max() - across.min(), center
+
+
+def create_coverage_path(polygon,
+                         swath,
+                         error_growth,
+                         current_field = None,
+                         travel_speed = None,
+                         max_speed = None):
+    """
+    if a current_field is given along with the travel and max speeds,
+    the legs are oriented to minimize the predicted time with that current
+    instead of along the longest side of the polygon.
+    """
     polygon = np.array(polygon)
     # the poly needs to be closed -> first and last elements need to be identical
     if not all(polygon[0] == polygon[-1]):
         polygon = np.vstack([polygon, polygon[0]])
 
-    rot_angle, area, w, h, center, corners = minBoundingRect(polygon)
+    use_current = current_field is not None and travel_speed and max_speed
+    if use_current:
+        rot_angle, predicted_time = best_leg_heading(polygon, swath, current_field, travel_speed, max_speed, error_growth)
+        # no heading beats the current, plan as if there was none
+        use_current = not np.isinf(predicted_time)
 
-    # we want to do rows in the longest direction
-    # so if the box is higher than its wider, turn it around
-    flip = False
-    if h>w:
-        w,h = h,w
-        flip = True
+    if use_current:
+        # the legs are along the chosen heading, whichever side that is
+        w, h, center = _rect_at_heading(polygon, rot_angle)
+        flip = False
+    else:
+        rot_angle, area, w, h, center, corners = minBoundingRect(polygon)
+
+        # we want to do rows in the longest direction
+        # so if the box is higher than its wider, turn it around
+        flip = False
+        if h>w:
+            w,h = h,w
+            flip = True
 
     # this is starting at 0,0 and going +y always
     coverage_xs, coverage_ys = create_mower_pattern(w, h, swath, error_growth)
@@ -257,6 +472,13 @@ def create_coverage_path(polygon, swath, error_growth):
     # first, center this path on 0,0
     coverage_path[:,0] -= np.mean(coverage_path[:,0])
     coverage_path[:,1] -= np.mean(coverage_path[:,1])
+
+    if use_current:
+        # mirror before rotating, so the legs stay along the chosen heading
+        versions = [rotate_vec_vec(coverage_path * m, rot_angle) + center for m in ([1,1], [-1,1], [1,-1], [-1,-1])]
+        dists = [np.sum(np.abs(v[0]-polygon[0])) for v in versions]
+        return versions[int(np.argmin(dists))]
+
     # then rotate it to match the rotation of the bounding rect
     coverage_path = rotate_vec_vec(coverage_path, rot_angle)
     # rotate it a further 90 deg if we need to flip
@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Estimates how fast the dead reckoning error grows per meter travelled.
+The distance travelled since the previous gps fix is integrated every tick.
+When a new fix comes in at the surface after enough distance, the distance
+between the fix and the DR position is one sample of the error.
+The growth is the least squares fit of error = growth * distance,
+kept as two running sums.
+"""
+
+import math
+
+
+class DriftEstimator(object):
+    def __init__(self,
+                 min_distance = 20.,
+                 surface_depth = 0.5,
+                 max_growth = 0.1):
+        """
+        min_distance -> meters, fixes after travelling less than this are not used as samples
+        surface_depth -> meters, fixes deeper than this are ignored
+        max_growth -> estimates are clamped to [0, max_growth]
+        """
+        self.min_distance = min_distance
+        self.surface_depth = surface_depth
+        self.max_growth = max_growth
+
+        # error = growth*distance, least squares through the origin
+        self._sum_dd = 0.
+        self._sum_ed = 0.
+        self.num_samples = 0
+        # (time, distance, error) of each sample
+        self.samples = []
+
+        self.distance_since_fix = 0.
+        self._last_position = None
+        # (stamp, x, y) of the latest fix in utm
+        self.last_fix = None
+
+    @property
+    def error_growth(self):
+        if self._sum_dd <= 0:
+            return None
+        return min(max(self._sum_ed / self._sum_dd, 0.), self.max_growth)
+
+    def add_sample(self, distance, error, t):
+        self._sum_dd += distance * distance
+        self._sum_ed += error * distance
+        self.num_samples += 1
+        self.samples.append((t, distance, error))
+
+    def update(self, position, depth, fix_stamp=None, fix_utm=None):
+        """
+        position -> (x,y) of DR in utm, can be None
+        fix_stamp, fix_utm -> stamp and (x,y) in utm of the latest gps fix, None if no fix
+        returns True if a new sample was added
+        """
+        if position is not None and None in position:
+            position = None
+
+        if position is not None:
+            if self._last_position is not None:
+                self.distance_since_fix += math.hypot(position[0] - self._last_position[0],
+                                                      position[1] - self._last_position[1])
+            self._last_position = position
+
+        if fix_stamp is None or fix_utm is None or None in fix_utm:
+            return False
+        if self.last_fix is not None and self.last_fix[0] == fix_stamp:
+            return False
+        self.last_fix = (fix_stamp, fix_utm[0], fix_utm[1])
+
+        # a fix while diving is not to be trusted
+        if position is None or depth is None or depth > self.surface_depth:
+            return False
+
+        sampled = False
+        if self.distance_since_fix >= self.min_distance:
+            error = math.hypot(fix_utm[0] - position[0], fix_utm[1] - position[1])
+            self.add_sample(self.distance_since_fix, error, fix_stamp)
+            sampled = True
+
+        # DR is corrected with the fix at the surface
+        self.distance_since_fix = 0.
+        return sampled
+
+    def tick(self, vehicle, latlon_to_utm):
+        """
+        latlon_to_utm(lat, lon) -> (x,y), only called for new fixes.
+        it should not block, None if the fix is not converted yet and it
+        is called again on the next tick
+        """
+        gps = vehicle.raw_gps_obj
+        fix_stamp = None
+        fix_utm = None
+        if gps is not None and gps.status.status != -1:
+            fix_stamp = gps.header.stamp.to_sec()
+            if self.last_fix is None or self.last_fix[0] != fix_stamp:
+                try:
+                    fix_utm = latlon_to_utm(gps.latitude, gps.longitude)
+                except Exception:
+                    fix_utm = None
+
+        return self.update(vehicle.position_utm, vehicle.depth, fix_stamp, fix_utm)
+
+    def __str__(self):
+        growth = self.error_growth
+        if growth is None:
+            return "Drift: no samples, {:.1f}m since fix".format(self.distance_since_fix)
+        return "Drift: {:.4f}m/m from {} samples, {:.1f}m since fix".format(growth,
+                                                                          self.num_samples,
+                                                                          self.distance_since_fix)
@@ -0,0 +1,190 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+A simple energy model of the vehicle.
+Energy use per meter is learned from the battery and navigation traces
+of previous mission logs, grouped by the average speed of the mission.
+The logs are read through the .npz caches of log_analysis where there are
+some, and only the latest few of them, so that this stays quick with a full
+log folder. The vehicle does not write caches, only reads them.
+A mission plan is then checked against the energy left in the battery.
+"""
+
+import os
+import math
+
+import numpy as np
+
+from log_analysis import parse_log_data, load_log
+
+
+def _is_nan(v):
+    return v is None or v != v
+
+
+class EnduranceModel(object):
+    def __init__(self,
+                 battery_capacity_wh,
+                 default_wh_per_meter,
+                 reserve_percent = 20.,
+                 speed_bin_size = 0.25,
+                 min_log_distance = 50.):
+        """
+        battery_capacity_wh -> energy in a full battery
+        default_wh_per_meter -> used when no logs could be learned from
+        reserve_percent -> this much of the battery is never planned to be used
+        speed_bin_size -> m/s, missions with average speeds in the same bin are learned together
+        min_log_distance -> meters, logs that travelled less than this are not learned from
+        """
+        self.battery_capacity_wh = float(battery_capacity_wh)
+        self.default_wh_per_meter = float(default_wh_per_meter)
+        self.reserve_percent = float(reserve_percent)
+        self.speed_bin_size = float(speed_bin_size)
+        self.min_log_distance = min_log_distance
+
+        # speed bin -> [total energy Wh, total distance m]
+        self._bins = {}
+        self.num_learned_logs = 0
+
+    def _speed_bin(self, speed):
+        return int(round(speed / self.speed_bin_size))
+
+    def add_sample(self, energy_wh, distance, speed):
+        if distance <= 0 or energy_wh <= 0:
+            return
+        b = self._bins.setdefault(self._speed_bin(speed), [0., 0.])
+        b[0] += energy_wh
+        b[1] += distance
+
+    def learn_from_arrays(self, arrays):
+        """
+        arrays is a parsed log from log_analysis.
+        returns True if the log was used.
+        """
+        battery = arrays.get('battery')
+        nav = arrays.get('nav')
+        times = arrays.get('time')
+        if battery is None or nav is None or times is None:
+            return False
+
+        n = min(len(battery), len(nav), len(times))
+        percent = battery[:n,0]
+        xy = nav[:n,:2]
+        times = times[:n]
+        valid = ~(np.isnan(percent) | np.isnan(xy[:,0]) | np.isnan(xy[:,1]) | np.isnan(times))
+        if valid.sum() < 2:
+            return False
+        percent = percent[valid]
+        xy = xy[valid]
+        times = times[valid]
+
+        distance = float(np.hypot(np.diff(xy[:,0]), np.diff(xy[:,1])).sum())
+        duration = times[-1] - times[0]
+        if distance < self.min_log_distance or duration <= 0:
+            return False
+
+        energy = (percent[0] - percent[-1]) * self.battery_capacity_wh
+        if energy <= 0:
+            return False
+
+        self.add_sample(energy, distance, distance / duration)
+        self.num_learned_logs += 1
+        return True
+
+    def learn_from_log_data(self, data):
+        """
+        data is the dict saved by MissionLog.
+        returns True if the log was used.
+        """
+        return self.learn_from_arrays(parse_log_data(data))
+
+    def learn_from_folder(self, folder, max_logs=50):
+        """
+        learns from the latest max_logs logs in the folder,
+        the log names start with their date so the latest sort last.
+        the folder is only read from
+        """
+        folder = os.path.expanduser(folder)
+        if not os.path.isdir(folder):
+            return 0
+
+        filenames = sorted(f for f in os.listdir(folder) if f.endswith('.json'))
+        for filename in filenames[-max_logs:] if max_logs > 0 else []:
+            try:
+                self.learn_from_arrays(load_log(os.path.join(folder, filename), write_cache=False))
+            except Exception:
+                continue
+        return self.num_learned_logs
+
+    def wh_per_meter(self, speed=None):
+        """
+        the learned energy use at the closest known speed,
+        average of all known speeds if speed is None
+        """
+        if len(self._bins) == 0:
+            return self.default_wh_per_meter
+
+        if speed is None:
+            energy = sum(e for e,d in self._bins.values())
+            distance = sum(d for e,d in self._bins.values())
+            return energy / distance
+
+        target = self._speed_bin(speed)
+        closest = min(self._bins.keys(), key=lambda b: abs(b - target))
+        energy, distance = self._bins[closest]
+        return energy / distance
+
+    def plan_energy(self, mission_plan, position=None, from_index=0):
+        """
+        Wh needed to go through the waypoints of the plan starting at from_index,
+        from position if given.
+        """
+        energy = 0.
+        prev = position
+        for wp in mission_plan.waypoints[max(from_index, 0):]:
+            if prev is not None:
+                speed = None
+                # 2 = SPEED_CONTROL_SPEED
+                if wp.wp.speed_control_mode == 2:
+                    speed = wp.wp.travel_speed
+                distance = math.hypot(wp.x - prev[0], wp.y - prev[1])
+                energy += distance * self.wh_per_meter(speed)
+            prev = (wp.x, wp.y)
+        return energy
+
+    def available_energy(self, battery_msg):
+        """
+        Wh that can be used from the battery before hitting the reserve.
+        None if the battery state is unknown
+        """
+        if battery_msg is None or not battery_msg.present or _is_nan(battery_msg.percentage):
+            return None
+        usable = battery_msg.percentage - self.reserve_percent / 100.
+        return max(usable, 0.) * self.battery_capacity_wh
+
+    def feasibility_report(self, mission_plan, battery_msg, position=None, required=None):
+        """
+        required -> Wh for the rest of the plan, from plan_energy if None
+        """
+        if mission_plan is None:
+            return None
+
+        from_index = max(mission_plan.current_wp_index, 0)
+        if required is None:
+            required = self.plan_energy(mission_plan, position, from_index)
+        available = self.available_energy(battery_msg)
+        return {'plan_id': mission_plan.plan_id,
+                'from_wp_index': from_index,
+                'required_wh': required,
+                'available_wh': available,
+                'feasible': available is None or required <= available,
+                'wh_per_meter': self.wh_per_meter(),
+                'learned_logs': self.num_learned_logs}
+
+    def __str__(self):
+        return "Endurance: {:.3f}Wh/m from {} logs, capacity:{}Wh reserve:{}%".format(self.wh_per_meter(),
+                                                                                    self.num_learned_logs,
+                                                                                    self.battery_capacity_wh,
+                                                                                    self.reserve_percent)
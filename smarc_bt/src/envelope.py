@@ -0,0 +1,206 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Predicts when the depth or altitude limits will be crossed.
+A line is fit to the last few readings of each, the slope is the vertical
+speed and the time to violation is how long it takes that speed to reach
+the limit. Readings far from the first fit are dropped before fitting again,
+and the readings the DVL gives when it loses the bottom are never used.
+
+A limit only counts as violated, or about to be, after a few checks in a row
+say so, and it is only fine again after as many checks in a row say that.
+One bad reading does not surface the vehicle, but the altitude readings
+stopping altogether while the vehicle is deep counts as a violation.
+"""
+
+import time
+from collections import deque
+
+import numpy as np
+
+
+def fit_line(times, values, max_residual):
+    """
+    least squares value = a + b*(t - times[-1]) through the readings,
+    then again without the ones further than max_residual from it.
+    returns (a, b), a is the value now and b the rate, None if there are
+    less than 3 readings left
+    """
+    t = np.asarray(times, dtype=float)
+    v = np.asarray(values, dtype=float)
+    t = t - t[-1]
+    keep = np.ones(len(t), dtype=bool)
+    for _ in range(2):
+        if keep.sum() < 3 or np.ptp(t[keep]) == 0:
+            return None
+        b, a = np.polyfit(t[keep], v[keep], 1)
+        keep = np.abs(v - (a + b*t)) <= max_residual
+    return a, b
+
+
+class Limit(object):
+    """
+    one limit with the readings it is checked against
+    """
+    OK = 'OK'
+    PREDICTED = 'PREDICTED'
+    VIOLATED = 'VIOLATED'
+
+    def __init__(self, name, below, window, max_age, max_residual):
+        """
+        below -> True if the values should stay below the limit, like depth
+        """
+        self.name = name
+        self.below = below
+        self.max_age = max_age
+        self.max_residual = max_residual
+        self.readings = deque(maxlen=window)
+
+        self.value = None
+        self.rate = None
+        self.time_to_violation = None
+        self.state = Limit.OK
+        self._raw_state = Limit.OK
+        self._count = 0
+        # there was a fit since the dropouts were last not counted
+        self._had_fit = False
+        self.dropout = False
+
+    def add(self, t, value):
+        self.readings.append((t, value))
+
+    def _margin(self, value, limit):
+        # positive on the safe side
+        if self.below:
+            return limit - value
+        return value - limit
+
+    def update(self, limit, horizon, hysteresis, now, count_dropout=False):
+        """
+        count_dropout -> True if having had a fit and then none is a violation
+        """
+        while len(self.readings) > 0 and now - self.readings[0][0] > self.max_age:
+            self.readings.popleft()
+
+        fit = None
+        if len(self.readings) > 0:
+            times, values = zip(*self.readings)
+            fit = fit_line(times, values, self.max_residual)
+
+        self.dropout = fit is None and self._had_fit and count_dropout
+        if fit is None:
+            self.value = None
+            self.rate = None
+            self.time_to_violation = None
+            raw_state = Limit.VIOLATED if self.dropout else Limit.OK
+            if not count_dropout:
+                self._had_fit = False
+        else:
+            self._had_fit = True
+            self.value, self.rate = fit
+            margin = self._margin(self.value, limit)
+            # the margin shrinks this fast
+            closing = self.rate if self.below else -self.rate
+            if margin <= 0:
+                self.time_to_violation = 0.
+                raw_state = Limit.VIOLATED
+            elif closing > 0:
+                self.time_to_violation = margin / closing
+                raw_state = Limit.PREDICTED if self.time_to_violation < horizon else Limit.OK
+            else:
+                self.time_to_violation = None
+                raw_state = Limit.OK
+
+        # a new state has to be seen hysteresis times in a row
+        if raw_state == self._raw_state:
+            self._count += 1
+        else:
+            self._raw_state = raw_state
+            self._count = 1
+        if self._count >= hysteresis:
+            self.state = raw_state
+
+        return self.state
+
+    def __str__(self):
+        if self.value is None:
+            if self.dropout:
+                return "{}: dropout, {}".format(self.name, self.state)
+            return "{}: no fit, {}".format(self.name, self.state)
+        ttv = "-" if self.time_to_violation is None else "{:.1f}s".format(self.time_to_violation)
+        return "{}:{:.2f} rate:{:.2f} ttv:{} {}".format(self.name, self.value, self.rate, ttv, self.state)
+
+
+class EnvelopeChecker(object):
+    def __init__(self,
+                 window = 20,
+                 horizon = 5.,
+                 hysteresis = 3,
+                 max_age = 10.,
+                 max_residual = 0.5,
+                 dropout_depth = None):
+        """
+        window -> number of readings the lines are fit to
+        horizon -> seconds, a limit that is reached sooner than this is PREDICTED
+        hysteresis -> how many checks in a row it takes to change state
+        max_age -> seconds, older readings are not used
+        max_residual -> meters, readings further than this from the fit are dropped
+        dropout_depth -> meters, deeper than this losing the altitude is a violation,
+        None to never count it
+        """
+        self.horizon = horizon
+        self.dropout_depth = dropout_depth
+        self.hysteresis = hysteresis
+        self.depth = Limit('depth', True, window, max_age, max_residual)
+        self.altitude = Limit('altitude', False, window, max_age, max_residual)
+        self._last_altitude_time = 0
+
+    def add_depth(self, depth, t=None):
+        if depth is None:
+            return
+        self.depth.add(time.time() if t is None else t, depth)
+
+    def add_altitude(self, altitude, t=None):
+        # the dvl gives 0 or negative when it does not see the bottom
+        if altitude is None or altitude <= 0:
+            return
+        self.altitude.add(time.time() if t is None else t, altitude)
+
+    def tick(self, vehicle, max_depth, min_altitude):
+        """
+        reads the depth of this tick and the altitudes the dvl gave since the last one
+        returns True if both limits are OK
+        """
+        now = time.time()
+        self.add_depth(vehicle.depth, now)
+        for t, altitude in list(vehicle.altitude_readings):
+            if t > self._last_altitude_time:
+                self.add_altitude(altitude, t)
+                self._last_altitude_time = t
+
+        count_dropout = self.dropout_depth is not None and \
+                        vehicle.depth is not None and \
+                        vehicle.depth > self.dropout_depth
+        self.depth.update(max_depth, self.horizon, self.hysteresis, now)
+        self.altitude.update(min_altitude, self.horizon, self.hysteresis, now, count_dropout)
+        return self.ok
+
+    @property
+    def ok(self):
+        return self.depth.state == Limit.OK and self.altitude.state == Limit.OK
+
+    @property
+    def violated(self):
+        return self.depth.state == Limit.VIOLATED or self.altitude.state == Limit.VIOLATED
+
+    @property
+    def predicted(self):
+        """
+        a limit will be crossed within the horizon and none is crossed yet
+        """
+        return not self.violated and not self.ok
+
+    def __str__(self):
+        return "{}, {}".format(self.depth, self.altitude)
@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Runs the BTs of several vehicles in one process, mostly for large simulations.
+One node, one tf listener and one tick loop for all of them.
+
+Each vehicle gets its own AUVConfig with params read from ~<robot_name>/,
+its topics made absolute under /<robot_name>/ and its own blackboard.
+The py_trees blackboard is shared by every behaviour in the process, so the
+contents of it are swapped in and out around everything done for a vehicle.
+There is no dynamic reconfig server per vehicle, the config values are
+put in the blackboards directly.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+import rospy
+import tf
+import py_trees as pt
+
+import common_globals
+from auv_config import AUVConfig
+from reconfig_server import ReconfigServer
+from vehicle import Vehicle
+from smarc_bt import BTRunner
+
+
+class BlackboardSwitcher(object):
+    def __init__(self):
+        # every Blackboard object shares this same dict
+        self._shared = pt.blackboard.Blackboard().__dict__
+        self._states = {}
+
+    @contextmanager
+    def use(self, name):
+        """
+        with switcher.use(name): -> the blackboard has the contents of name inside
+        """
+        self._shared.clear()
+        self._shared.update(self._states.get(name, {}))
+        try:
+            yield
+        finally:
+            self._states[name] = dict(self._shared)
+
+
+def make_config(robot_name):
+    config = AUVConfig(robot_name = robot_name)
+    config.read_rosparams(prefix = '~'+robot_name+'/')
+    config.make_names_absolute()
+    # log names do not include the vehicle
+    config.MISSION_LOG_FOLDER = os.path.join(config.MISSION_LOG_FOLDER, robot_name)
+    return config
+
+
+def main():
+    rospy.init_node("bt_fleet", log_level=rospy.INFO)
+    robot_names = rospy.get_param('~robot_names', ['sam_1', 'sam_2'])
+
+    tf_listener = tf.TransformListener()
+    switcher = BlackboardSwitcher()
+    runners = []
+    for robot_name in robot_names:
+        rospy.loginfo("Setting up {}".format(robot_name))
+        config = make_config(robot_name)
+        vehicle = Vehicle(config)
+        while vehicle.setup_tf_listener(timeout_secs = common_globals.SETUP_TIMEOUT,
+                                        listener = tf_listener) is None:
+            rospy.logerr("No TF for {}! Is there a UTM frame connected to its base link? \n retrying in 5s.".format(robot_name))
+            time.sleep(5)
+
+        with switcher.use(robot_name):
+            bb = pt.blackboard.Blackboard()
+            ReconfigServer.set_defaults(config, bb)
+            runner = BTRunner(config,
+                              vehicle,
+                              bb,
+                              tree_file_path = 'last_ran_tree_{}.txt'.format(robot_name))
+            runner.resume_from_checkpoint()
+            if runner.safety_monitor is not None:
+                runner.safety_monitor.start(tf_listener)
+        runners.append((robot_name, runner))
+
+    rate = rospy.Rate(common_globals.BT_TICK_RATE)
+    rospy.loginfo("Ticktocking {} vehicles....".format(len(runners)))
+    while not rospy.is_shutdown():
+        for robot_name, runner in runners:
+            with switcher.use(robot_name):
+                runner.tick(tf_listener)
+        rate.sleep()
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except rospy.ROSInitException:
+        rospy.loginfo("ROS Interrupt")
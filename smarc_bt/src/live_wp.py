@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Smooths a live waypoint and decides when it is worth sending again.
+Sources like a follower or SLAM move the waypoint many times a second,
+sending every one of those as a goal makes the vehicle stop and start.
+
+The position of the waypoint is tracked with an alpha-beta filter, which
+gives a smoothed position and how fast it is moving. The goal is put where
+the waypoint is expected to be when the next goal can be sent, and a new
+goal is only sent once at least min_interval seconds passed since the last.
+The prediction is never further ahead than min_interval and a small margin,
+and a waypoint that has not moved for max_gap seconds is not predicted at all.
+"""
+
+import copy
+import time
+
+
+class LiveWaypointCoalescer(object):
+    def __init__(self,
+                 min_interval = 1.,
+                 alpha = 0.5,
+                 beta = 0.1,
+                 max_gap = 5.,
+                 lead_margin = 0.5):
+        """
+        min_interval -> seconds, goals are not sent more often than this
+        alpha, beta -> weights of a new position in the smoothed position and velocity.
+        alpha=1, beta=0 is no smoothing and no prediction
+        max_gap -> seconds, if the waypoint did not change for this long the filter starts over
+        lead_margin -> seconds, the prediction is at most min_interval + this ahead of the last update
+        """
+        self.min_interval = min_interval
+        self.alpha = alpha
+        self.beta = beta
+        self.max_gap = max_gap
+        self.lead_margin = lead_margin
+
+        self.last_sent_time = 0
+        self._reset()
+
+    def _reset(self):
+        self._last_wp = None
+        self._last_time = None
+        self.position = None
+        self.velocity = (0., 0.)
+        self.num_updates = 0
+
+    def add(self, wp, t=None):
+        """
+        wp -> mission_plan.Waypoint, the same object is only counted once
+        """
+        if wp is self._last_wp:
+            return
+        if t is None:
+            t = time.time()
+
+        if self.position is None or t - self._last_time > self.max_gap or \
+           wp.wp.pose.header.frame_id != self._last_wp.wp.pose.header.frame_id:
+            self._reset()
+            self.position = (wp.x, wp.y)
+        else:
+            dt = t - self._last_time
+            vx, vy = self.velocity
+            # predict to now, then correct with the new position
+            px = self.position[0] + vx*dt
+            py = self.position[1] + vy*dt
+            rx = wp.x - px
+            ry = wp.y - py
+            self.position = (px + self.alpha*rx, py + self.alpha*ry)
+            if dt > 0:
+                self.velocity = (vx + self.beta*rx/dt, vy + self.beta*ry/dt)
+
+        self._last_wp = wp
+        self._last_time = t
+        self.num_updates += 1
+
+    def predicted(self, wp, t=None):
+        """
+        a copy of wp moved to where the waypoint should be when the
+        goal made from it is replaced, wp itself if nothing was added yet
+        or it was added too long ago for its velocity to mean anything
+        """
+        if self.position is None or wp is not self._last_wp:
+            return wp
+        if t is None:
+            t = time.time()
+        if t - self._last_time > self.max_gap:
+            return wp
+
+        lead = min((t - self._last_time) + self.min_interval,
+                   self.min_interval + self.lead_margin)
+        predicted_wp = copy.copy(wp)
+        predicted_wp.wp = copy.deepcopy(wp.wp)
+        predicted_wp.wp.pose.pose.position.x = self.position[0] + self.velocity[0]*lead
+        predicted_wp.wp.pose.pose.position.y = self.position[1] + self.velocity[1]*lead
+        return predicted_wp
+
+    def can_send(self, t=None):
+        if t is None:
+            t = time.time()
+        return t - self.last_sent_time >= self.min_interval
+
+    def sent(self, t=None):
+        self.last_sent_time = time.time() if t is None else t
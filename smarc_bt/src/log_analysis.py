@@ -0,0 +1,450 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Summaries and plots of the json logs saved by MissionLog.
+
+A log is parsed into numpy arrays once and the arrays are cached in a .npz
+file next to it, later runs only read the cache.
+Plots are decimated and the swath lines are drawn as one LineCollection.
+
+Examples:
+    log_analysis.py 2021-05-04-10-22_plan.json --plot
+    log_analysis.py 2021-05-04-10-22_plan.json --plot --3d --equal-z --no-swath
+    log_analysis.py --folder ~/MissionLogs --jobs 4
+    log_analysis.py --folder ~/MissionLogs --json > summaries.json
+"""
+
+from __future__ import print_function, division
+
+import os
+import sys
+import json
+import argparse
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+
+DEFAULT_LOG_FOLDER = "~/MissionLogs/"
+# bump when the cached arrays change
+CACHE_VERSION = 2
+
+
+def _rows(trace, width):
+    """
+    a list of tuples/None into a (N,width) float array, None -> nan
+    """
+    nan_row = [np.nan] * width
+    return np.array([nan_row if row is None else [np.nan if v is None else v for v in row]
+                     for row in trace], dtype=float).reshape(-1, width)
+
+
+def _column(trace):
+    return np.array([np.nan if v is None else v for v in trace], dtype=float)
+
+
+def parse_log_data(data):
+    """
+    data is the dict saved by MissionLog.
+    returns a dict of numpy arrays and the scalars of the log
+    """
+    arrays = {
+        'nav': _rows(data.get('navigation_trace', []), 6),
+        'time': _column(data.get('time_trace', [])),
+        'altitude': _column(data.get('altitude_trace', [])),
+        'gps': _rows(data.get('raw_gps_trace', []), 2),
+        'plan': _rows(data.get('mission_plan_wps', []), 3),
+        'wp_index': _column(data.get('wp_index_trace', [])),
+        'battery': _rows(data.get('battery_trace', []), 3),
+        'swath': np.array(np.nan if data.get('swath') is None else data.get('swath'), dtype=float),
+        'cache_version': np.array(CACHE_VERSION)
+    }
+    return arrays
+
+
+def _cache_path(log_path):
+    return os.path.splitext(log_path)[0] + '.npz'
+
+
+def load_log(log_path, use_cache=True, write_cache=True):
+    """
+    the parsed arrays of a log, from the cache if it is newer than the log.
+    write_cache=False only reads the caches that are already there
+    """
+    cache_path = _cache_path(log_path)
+    if use_cache and os.path.exists(cache_path) and \
+       os.path.getmtime(cache_path) >= os.path.getmtime(log_path):
+        try:
+            with np.load(cache_path) as cached:
+                if int(cached['cache_version']) == CACHE_VERSION:
+                    return dict(cached.items())
+        except Exception:
+            pass
+
+    with open(log_path, 'r') as f:
+        arrays = parse_log_data(json.load(f))
+
+    if use_cache and write_cache:
+        try:
+            np.savez(cache_path, **arrays)
+        except Exception:
+            # read-only folder, no cache then
+            pass
+    return arrays
+
+
+def resolve_log_path(name):
+    """
+    the name as given, next to this script or in the default log folder
+    """
+    candidates = [name,
+                  os.path.join(os.path.dirname(os.path.realpath(__file__)), name),
+                  os.path.join(os.path.expanduser(DEFAULT_LOG_FOLDER), name)]
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return name
+
+
+def decimate(n, max_points):
+    """
+    indices to use to plot at most max_points of n
+    """
+    step = max(1, int(np.ceil(n / float(max_points))))
+    return np.arange(0, n, step)
+
+
+def waypoint_times(arrays, tolerance=5.):
+    """
+    seconds spent going to each waypoint of the plan.
+    uses the logged waypoint index if there is one, otherwise the first time
+    the vehicle got within tolerance (or closest) of each waypoint in order.
+    nan for waypoints that were never reached
+    """
+    t = arrays['time']
+    plan = arrays['plan']
+    num_wps = len(plan)
+    times = np.full(num_wps, np.nan)
+    if num_wps == 0 or len(t) == 0:
+        return times
+
+    wp_index = arrays['wp_index']
+    if len(wp_index) == len(t) and np.isfinite(wp_index).any():
+        valid = np.isfinite(wp_index)
+        idx = wp_index[valid].astype(int)
+        tv = t[valid]
+        dt = np.append(np.diff(tv), 0.)
+        inside = (idx >= 0) & (idx < num_wps)
+        times[:] = 0.
+        np.add.at(times, idx[inside], dt[inside])
+        # never went towards these
+        visited = np.zeros(num_wps, dtype=bool)
+        visited[idx[inside]] = True
+        times[~visited] = np.nan
+        return times
+
+    xy = arrays['nav'][:, :2]
+    start = 0
+    start_time = t[0]
+    for i, wp in enumerate(plan):
+        if start >= len(xy):
+            break
+        dists = np.hypot(xy[start:, 0] - wp[0], xy[start:, 1] - wp[1])
+        if not np.isfinite(dists).any():
+            break
+        close = np.nonzero(dists < tolerance)[0]
+        if len(close) > 0:
+            arrival = start + close[0]
+        else:
+            arrival = start + int(np.nanargmin(dists))
+        times[i] = t[arrival] - start_time
+        start_time = t[arrival]
+        start = arrival + 1
+    return times
+
+
+def summarize(arrays):
+    nav = arrays['nav']
+    t = arrays['time']
+    xy = nav[:, :2]
+    valid = np.isfinite(xy).all(axis=1)
+
+    steps = np.diff(xy[valid], axis=0)
+    distance = float(np.hypot(steps[:, 0], steps[:, 1]).sum()) if len(steps) else 0.
+    duration = float(t[-1] - t[0]) if len(t) > 1 else 0.
+
+    summary = {'samples': int(len(t)),
+               'duration': duration,
+               'distance': distance,
+               'mean_speed': distance / duration if duration > 0 else None,
+               'max_depth': float(-np.nanmin(nav[:, 2])) if np.isfinite(nav[:, 2]).any() else None,
+               'min_altitude': float(np.nanmin(arrays['altitude'])) if np.isfinite(arrays['altitude']).any() else None,
+               'num_plan_wps': int(len(arrays['plan']))}
+
+    gps = arrays['gps']
+    n = min(len(gps), len(xy))
+    fixed = np.isfinite(gps[:n]).all(axis=1) & valid[:n]
+    summary['num_gps_fixes'] = int(fixed.sum())
+    if fixed.any():
+        errors = np.hypot(gps[:n][fixed, 0] - xy[:n][fixed, 0], gps[:n][fixed, 1] - xy[:n][fixed, 1])
+        summary['gps_dr_error_mean'] = float(errors.mean())
+        summary['gps_dr_error_median'] = float(np.median(errors))
+        summary['gps_dr_error_max'] = float(errors.max())
+    else:
+        summary['gps_dr_error_mean'] = None
+        summary['gps_dr_error_median'] = None
+        summary['gps_dr_error_max'] = None
+
+    wp_times = waypoint_times(arrays)
+    summary['waypoint_times'] = [None if np.isnan(v) else float(v) for v in wp_times]
+    return summary
+
+
+def summarize_file(log_path, use_cache=True):
+    try:
+        summary = summarize(load_log(log_path, use_cache))
+    except Exception as e:
+        summary = {'error': str(e)}
+    summary['file'] = log_path
+    return summary
+
+
+def summarize_folder(folder, jobs=None, use_cache=True):
+    folder = os.path.expanduser(folder)
+    paths = [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith('.json')]
+    if jobs == 1 or len(paths) <= 1:
+        return [summarize_file(p, use_cache) for p in paths]
+
+    pool = Pool(jobs)
+    try:
+        return pool.map(partial(summarize_file, use_cache=use_cache), paths)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def format_summary(summary):
+    if 'error' in summary:
+        return "{}: could not read, {}".format(os.path.basename(summary['file']), summary['error'])
+
+    def fmt(v, unit):
+        return '-' if v is None else '{:.1f}{}'.format(v, unit)
+
+    wp_times = [v for v in summary['waypoint_times'] if v is not None]
+    return "{}: {} over {}, speed:{} depth:{} gps-dr error mean/max:{}/{} ({} fixes) wps:{}/{} slowest wp:{}".format(
+        os.path.basename(summary['file']),
+        fmt(summary['distance'], 'm'),
+        fmt(summary['duration']/60., 'min'),
+        fmt(summary['mean_speed'], 'm/s'),
+        fmt(summary['max_depth'], 'm'),
+        fmt(summary['gps_dr_error_mean'], 'm'),
+        fmt(summary['gps_dr_error_max'], 'm'),
+        summary['num_gps_fixes'],
+        len(wp_times),
+        summary['num_plan_wps'],
+        fmt(max(wp_times) if wp_times else None, 's'))
+
+
+def swath_segments(nav, origin, swath, swath_lines):
+    """
+    (N,2,2) left-right segments across the track, swath wide, at most swath_lines of them
+    """
+    sidx = decimate(len(nav), swath_lines)
+    yaw = nav[sidx, 5]
+    centers = nav[sidx, :2] - origin
+    offsets = np.stack([np.cos(yaw + np.pi/2), np.sin(yaw + np.pi/2)], axis=-1) * swath / 2.
+    return np.stack([centers - offsets, centers + offsets], axis=1)
+
+
+def set_axes_equal(ax):
+    """
+    equal scale on all axes of a 3D plot, matplotlib's set_aspect('equal')
+    does not work for 3D. The limits become a cube of the largest range.
+    """
+    limits = np.array([ax.get_xlim3d(), ax.get_ylim3d(), ax.get_zlim3d()])
+    middles = limits.mean(axis=1)
+    radius = 0.5 * np.max(np.abs(limits[:, 1] - limits[:, 0]))
+    ax.set_xlim3d([middles[0] - radius, middles[0] + radius])
+    ax.set_ylim3d([middles[1] - radius, middles[1] + radius])
+    ax.set_zlim3d([middles[2] - radius, middles[2] + radius])
+
+
+def plot_log_3d(ax, nav, altitude, arrays, origin, idx, max_points, swath_lines, equal_z, no_swath, no_bottom):
+    """
+    the 3D depth plot of the old viewer: nav with heading arrows, the bottom,
+    swath lines at the median bottom depth, the plan and the gps fixes at the surface.
+    """
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+    xyz = nav[idx, :3] - [origin[0], origin[1], 0.]
+    ax.plot(xyz[:, 0], xyz[:, 1], xyz[:, 2], c='green', label='nav')
+    ax.text(xyz[0, 0], xyz[0, 1], xyz[0, 2], "S")
+    ax.text(xyz[-1, 0], xyz[-1, 1], xyz[-1, 2], "E")
+
+    qidx = decimate(len(nav), max(1, max_points // 10))
+    yaw = nav[qidx, 5]
+    pitch = nav[qidx, 4]
+    qxyz = nav[qidx, :3] - [origin[0], origin[1], 0.]
+    ax.quiver(qxyz[:, 0], qxyz[:, 1], qxyz[:, 2],
+              np.cos(yaw) * np.cos(pitch), np.sin(yaw) * np.cos(pitch), np.sin(pitch),
+              length=1, color='green')
+
+    has_bottom = len(altitude) == len(nav)
+    if has_bottom and not no_bottom:
+        ax.plot(xyz[:, 0], xyz[:, 1], nav[idx, 2] - altitude[idx], c='y', label='bottom')
+
+    swath = float(arrays['swath'])
+    if not no_swath and np.isfinite(swath) and swath > 0:
+        segments = swath_segments(nav, origin, swath, swath_lines)
+        bottom = nav[:, 2] - altitude if has_bottom else nav[:, 2]
+        finite = np.isfinite(bottom)
+        bottom_mid = np.median(bottom[finite]) if finite.any() else 0.
+        segments = np.concatenate([segments, np.full(segments.shape[:2] + (1,), bottom_mid)], axis=-1)
+        ax.add_collection(Line3DCollection(segments, colors='purple', alpha=0.2))
+
+    plan = arrays['plan']
+    if len(plan) > 1:
+        ax.plot(plan[:, 0] - origin[0], plan[:, 1] - origin[1], np.minimum(plan[:, 2], 0), c='red', label='plan')
+
+    gps = arrays['gps']
+    fixed = np.isfinite(gps).all(axis=1)
+    if fixed.any():
+        gps = gps[fixed]
+        gidx = decimate(len(gps), max_points)
+        ax.scatter(gps[gidx, 0] - origin[0], gps[gidx, 1] - origin[1], np.zeros(len(gidx)),
+                   c='grey', s=4, alpha=0.4, label='gps')
+
+    ax.set_xlabel('utm x')
+    ax.set_ylabel('utm y')
+    ax.set_zlabel('z')
+    ax.legend()
+    if equal_z:
+        set_axes_equal(ax)
+
+
+def plot_log(arrays, title='', max_points=5000, swath_lines=500,
+             three_d=False, equal_z=False, no_swath=False, no_bottom=False):
+    """
+    a map and a depth over time plot of the log.
+    three_d replaces the map with the 3D depth plot, equal_z gives its z axis
+    the same scale as x,y. no_swath and no_bottom leave those out.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.gridspec import GridSpec
+
+    nav = arrays['nav']
+    t = arrays['time']
+    valid = np.isfinite(nav[:, :3]).all(axis=1)
+    nav = nav[valid]
+    t = t[:len(valid)][valid]
+    altitude = arrays['altitude'][:len(valid)][valid]
+    if len(nav) == 0:
+        print("No navigation in the log")
+        return
+
+    origin = nav[0, :2].copy()
+    idx = decimate(len(nav), max_points)
+    xy = nav[idx, :2] - origin
+
+    fig = plt.figure(figsize=(14, 7))
+    grid = GridSpec(1, 2, width_ratios=[2, 1])
+    ax_depth = fig.add_subplot(grid[1])
+
+    if three_d:
+        from mpl_toolkits.mplot3d import Axes3D  # noqa: F401, registers the '3d' projection
+        ax_3d = fig.add_subplot(grid[0], projection='3d')
+        plot_log_3d(ax_3d, nav, altitude, arrays, origin, idx, max_points, swath_lines,
+                    equal_z, no_swath, no_bottom)
+    else:
+        ax_map = fig.add_subplot(grid[0])
+        plot_map(ax_map, xy, arrays, origin, nav, max_points, swath_lines, no_swath)
+
+    rel_t = (t[idx] - t[0]) / 60.
+    ax_depth.plot(rel_t, nav[idx, 2], c='green', label='z')
+    if len(altitude) == len(nav) and not no_bottom:
+        ax_depth.plot(rel_t, nav[idx, 2] - altitude[idx], c='y', label='bottom')
+    ax_depth.set_xlabel('minutes')
+    ax_depth.legend()
+
+    if len(t) > 1:
+        title = "{} Duration:{:.2f} mins".format(title, (t[-1]-t[0])/60.)
+    fig.suptitle(title)
+    plt.show()
+
+
+def plot_map(ax_map, xy, arrays, origin, nav, max_points, swath_lines, no_swath):
+    """
+    the 2D map: nav, swath lines, plan and gps fixes
+    """
+    from matplotlib.collections import LineCollection
+
+    swath = float(arrays['swath'])
+    if not no_swath and np.isfinite(swath) and swath > 0:
+        segments = swath_segments(nav, origin, swath, swath_lines)
+        ax_map.add_collection(LineCollection(segments, colors='purple', alpha=0.2))
+
+    ax_map.plot(xy[:, 0], xy[:, 1], c='green', label='nav')
+    ax_map.text(xy[0, 0], xy[0, 1], "S")
+    ax_map.text(xy[-1, 0], xy[-1, 1], "E")
+
+    plan = arrays['plan']
+    if len(plan) > 1:
+        ax_map.plot(plan[:, 0] - origin[0], plan[:, 1] - origin[1], c='red', label='plan')
+
+    gps = arrays['gps']
+    fixed = np.isfinite(gps).all(axis=1)
+    if fixed.any():
+        gps = gps[fixed]
+        gidx = decimate(len(gps), max_points)
+        ax_map.scatter(gps[gidx, 0] - origin[0], gps[gidx, 1] - origin[1], c='grey', s=4, alpha=0.4, label='gps')
+
+    ax_map.set_aspect('equal')
+    ax_map.set_xlabel('utm x')
+    ax_map.set_ylabel('utm y')
+    ax_map.legend()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize and plot MissionLog json files")
+    parser.add_argument('logs', nargs='*', help="log files, relative to here, this script or {}".format(DEFAULT_LOG_FOLDER))
+    parser.add_argument('--folder', help="summarize all the logs in this folder")
+    parser.add_argument('--jobs', type=int, default=None, help="processes to use for a folder, default all cores")
+    parser.add_argument('--plot', action='store_true', help="plot each given log")
+    parser.add_argument('--json', action='store_true', help="print the summaries as json")
+    parser.add_argument('--no-cache', action='store_true', help="do not read or write the .npz caches")
+    parser.add_argument('--max-points', type=int, default=5000, help="max points per plotted line")
+    parser.add_argument('--3d', dest='three_d', action='store_true', help="plot the track in 3D with the depth")
+    parser.add_argument('--equal-z', action='store_true', help="same scale on z as on x,y in the 3D plot")
+    parser.add_argument('--no-swath', action='store_true', help="do not draw the swath lines")
+    parser.add_argument('--no-bottom', action='store_true', help="do not draw the bottom (z - altitude)")
+    args = parser.parse_args(argv)
+
+    use_cache = not args.no_cache
+    summaries = []
+    if args.folder is not None:
+        summaries += summarize_folder(args.folder, args.jobs, use_cache)
+
+    for name in args.logs:
+        path = resolve_log_path(name)
+        summaries.append(summarize_file(path, use_cache))
+        if args.plot:
+            plot_log(load_log(path, use_cache), title=os.path.basename(path), max_points=args.max_points,
+                     three_d=args.three_d, equal_z=args.equal_z,
+                     no_swath=args.no_swath, no_bottom=args.no_bottom)
+
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    else:
+        for s in summaries:
+            print(format_summary(s))
+
+    if len(summaries) == 0:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,12 +10,30 @@ import numpy as np
 import os
 import json
 import time
+import shutil
+import threading
 
 from nav_msgs.msg import Path
 from visualization_msgs.msg import Marker
 from geometry_msgs.msg import Point, PoseStamped
 import rospy
 
+from service_client import run_async
+
+# the log analysis tool is copied next to the logs as view.py
+viewer_script_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'log_analysis.py')
+
+# the traces that get one entry every time the log is updated
+TRACE_KEYS = ['navigation_trace',
+              'velocity_trace',
+              'raw_gps_trace',
+              'raw_gps_latlon_trace',
+              'tree_tip_trace',
+              'wp_index_trace',
+              'time_trace',
+              'altitude_trace',
+              'battery_trace']
+
 class MissionLog:
     def __init__(self,
                  mission_plan,
@@ -31,6 +49,10 @@ class MissionLog:
         """
 
         self.robot_name = robot_name
+        # saves run in the worker threads, one at a time and never older over newer
+        self._save_lock = threading.Lock()
+        self._num_snapshots = 0
+        self._written_snapshot = 0
         # filtered/corrected trace of auv pose
         # x,y,z, yaw,pitch,roll
         self.navigation_trace = []
@@ -38,6 +60,8 @@ class MissionLog:
         self.velocity_trace = []
         # distance from bottom
         self.altitude_trace = []
+        # percentage, voltage, current from the battery
+        self.battery_trace = []
         # raw gps fixes
         self.raw_gps_trace = []
         self.raw_gps_latlon_trace = []
@@ -45,6 +69,13 @@ class MissionLog:
         self.tree_tip_trace = []
         # the waypoints of the mission this log belongs to
         self.mission_plan_wps = []
+        # index of the waypoint being gone to
+        self.wp_index_trace = []
+        # (time, distance travelled, DR error) at each surfacing
+        # only when there is a new one, not every tick
+        self.drift_samples = []
+        self.error_growth_estimate = None
+        self._num_drift_samples_seen = None
 
         self.time_trace = []
 
@@ -68,6 +99,7 @@ class MissionLog:
             # used to check if log and mission plan are synched
             self.creation_time = mission_plan.creation_time
             self.plan_id = mission_plan.plan_id
+            self._num_patches = mission_plan.num_patches
 
             # we can populate the mission plan right away
             for wp in mission_plan.waypoints:
@@ -77,6 +109,7 @@ class MissionLog:
         else:
             self.creation_time = time.time()
             self.plan_id = "MANUAL"
+            self._num_patches = 0
 
 
         # give a nice name to the file
@@ -107,6 +140,7 @@ class MissionLog:
 
         self.swath = None
         self.loc_uncertainty_growth = None
+        self.poi_registry = None
 
 
     def vehicle_log(self, key, bb_key, bb):
@@ -147,8 +181,14 @@ class MissionLog:
 
         ############################################
         # vehicle-agnostic stuff
+        # a patched plan has different waypoints than it started with
+        if mplan is not None and self.plan_id == mplan.plan_id and mplan.num_patches != self._num_patches:
+            self.mission_plan_wps = [(wp.x, wp.y, -wp.wp.travel_depth) for wp in mplan.waypoints]
+            self._num_patches = mplan.num_patches
+
         self.swath = bb.get(bb_enums.SWATH)
         self.loc_uncertainty_growth = bb.get(bb_enums.LOCALIZATION_ERROR_GROWTH)
+        self.poi_registry = bb.get(bb_enums.POI_REGISTRY)
 
         vehicle = bb.get(bb_enums.VEHICLE_STATE)
 
@@ -180,7 +220,7 @@ class MissionLog:
         # velocities from dvl
         vel_msg = vehicle.dvl_velocity_msg
         if vel_msg is None:
-            rospy.logwarn("The vehicle has no DVL message received! Is the DVL alive?")
+            rospy.logwarn_throttle(10, "The vehicle has no DVL message received! Is the DVL alive?")
             vels = (None, None, None)
         else:
             vels = (vel_msg.x, vel_msg.y, vel_msg.z)
@@ -196,15 +236,14 @@ class MissionLog:
         else:
             # also log the raw lat lon
             self.raw_gps_latlon_trace.append((gps.latitude, gps.longitude))
-            # translate the latlon to utm point using the same service as the mission plan
-            gps_utm_x, gps_utm_y = mplan.latlon_to_utm(lat = gps.latitude,
-                                                       lon = gps.longitude,
-                                                       z = 0.,
-                                                       in_degrees = True)
-            if gps_utm_x is None or gps_utm_y is None:
-                gps_utm_point = None
+            # the drift estimator converts every fix in the background, a fix it
+            # has not converted yet is only in the latlon trace, the tick does not wait for it
+            drift_estimator = bb.get(bb_enums.DRIFT_ESTIMATOR)
+            if drift_estimator is not None and drift_estimator.last_fix is not None and \
+               drift_estimator.last_fix[0] == gps.header.stamp.to_sec():
+                gps_utm_point = tuple(drift_estimator.last_fix[1:])
             else:
-                gps_utm_point = (gps_utm_x, gps_utm_y)
+                gps_utm_point = None
         self.raw_gps_trace.append(gps_utm_point)
 
         # then add the tree tip and its status
@@ -212,15 +251,34 @@ class MissionLog:
         tip_status = bb.get(bb_enums.TREE_TIP_STATUS)
         self.tree_tip_trace.append((tree_tip, tip_status))
 
+        # only the samples made while this log was running
+        drift_estimator = bb.get(bb_enums.DRIFT_ESTIMATOR)
+        if drift_estimator is not None:
+            if self._num_drift_samples_seen is not None:
+                self.drift_samples.extend(drift_estimator.samples[self._num_drift_samples_seen:])
+            self._num_drift_samples_seen = drift_estimator.num_samples
+            self.error_growth_estimate = drift_estimator.error_growth
+
         # time keeping
         if t is None:
             t = time.time()
         self.time_trace.append(t)
 
+        if mplan is None:
+            self.wp_index_trace.append(None)
+        else:
+            self.wp_index_trace.append(mplan.current_wp_index)
+
         # simple enough
         alt = vehicle.altitude
         self.altitude_trace.append(alt)
 
+        battery = vehicle.battery_msg
+        if battery is None or not battery.present:
+            self.battery_trace.append(None)
+        else:
+            self.battery_trace.append((battery.percentage, battery.voltage, battery.current))
+
         # publish some visualization stuffs for rviz
         ps = PoseStamped()
         ps.header = point.header
@@ -286,213 +344,111 @@ class MissionLog:
 
 
 
-    def save(self):
-        if self.disabled:
-            print("Save location was bad before, can not save!")
-            return
+    def to_dict(self):
+        pois = []
+        if self.poi_registry is not None:
+            pois = self.poi_registry.to_list()
 
-        # save a json file for now for easy inspection
-        data = {'navigation_trace':self.navigation_trace,
+        return {'navigation_trace':self.navigation_trace,
                 'velocity_trace':self.velocity_trace,
                 'raw_gps_trace':self.raw_gps_trace,
                 'raw_gps_latlon_trace':self.raw_gps_latlon_trace,
                 'tree_tip_trace':self.tree_tip_trace,
                 'mission_plan_wps':self.mission_plan_wps,
+                'wp_index_trace':self.wp_index_trace,
                 'time_trace':self.time_trace,
                 'altitude_trace':self.altitude_trace,
+                'battery_trace':self.battery_trace,
                 'vehicle_data':self.vehicle_data,
                 'swath':self.swath,
-                'loc_uncertainty_growth':self.loc_uncertainty_growth}
+                'loc_uncertainty_growth':self.loc_uncertainty_growth,
+                'drift_samples':self.drift_samples,
+                'error_growth_estimate':self.error_growth_estimate,
+                'pois':pois}
 
-        with open(self.data_full_path, 'w+') as f:
-            json.dump(data, f)
+
+    def load_saved(self, length):
+        """
+        continue a log that was saved before, with the first length entries
+        of each trace from the file, the rest was logged after a checkpoint.
+        returns False if there is no such log file
+        """
+        if self.disabled or not os.path.exists(self.data_full_path):
+            return False
+
+        try:
+            with open(self.data_full_path, 'r') as f:
+                data = json.load(f)
+        except Exception as e:
+            rospy.logwarn("Could not read the previous log {}: {}".format(self.data_full_path, e))
+            return False
+
+        for key in TRACE_KEYS:
+            setattr(self, key, data.get(key, [])[:length])
+        self.vehicle_data = {}
+        for k,v in data.get('vehicle_data', {}).items():
+            if type(v) == list:
+                v = v[:length]
+            self.vehicle_data[k] = v
+        self.drift_samples = data.get('drift_samples', [])
+        return True
+
+
+    def snapshot(self):
+        """
+        a copy of to_dict that the tick can keep appending to the log after,
+        returns (number of the snapshot, data)
+        """
+        data = self.to_dict()
+        for key in TRACE_KEYS:
+            data[key] = list(data[key])
+        data['vehicle_data'] = dict((k, list(v) if type(v) == list else v) for k,v in data['vehicle_data'].items())
+        data['drift_samples'] = list(data['drift_samples'])
+        self._num_snapshots += 1
+        return self._num_snapshots, data
+
+
+    def write(self, snapshot):
+        """
+        writes a snapshot to a temporary file that is renamed over the log,
+        a crash in the middle of it leaves the previous save in place.
+        a snapshot older than the one on disk is not written.
+        """
+        number, data = snapshot
+        with self._save_lock:
+            if number <= self._written_snapshot:
+                return
+            # save a json file for now for easy inspection
+            tmp_path = self.data_full_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_path, self.data_full_path)
+            self._written_snapshot = number
 
         # also save a viewer script to the same locale
         try:
-            with open(self.script_full_path, 'w+') as f:
-                global viewer_script
-                f.write(viewer_script)
+            shutil.copyfile(viewer_script_path, self.script_full_path)
         except:
             print("Viewer script could not be written")
 
 
-viewer_script = """#! /usr/bin/env python3
-
-def set_axes_equal(ax):
-    '''Make axes of 3D plot have equal scale so that spheres appear as spheres,
-    cubes as cubes, etc..  This is one possible solution to Matplotlib's
-    ax.set_aspect('equal') and ax.axis('equal') not working for 3D.
-
-    Input
-      ax: a matplotlib axis, e.g., as output from plt.gca().
-    '''
-
-    x_limits = ax.get_xlim3d()
-    y_limits = ax.get_ylim3d()
-    z_limits = ax.get_zlim3d()
-
-    x_range = abs(x_limits[1] - x_limits[0])
-    x_middle = np.mean(x_limits)
-    y_range = abs(y_limits[1] - y_limits[0])
-    y_middle = np.mean(y_limits)
-    z_range = abs(z_limits[1] - z_limits[0])
-    z_middle = np.mean(z_limits)
-
-    # The plot bounding box is a sphere in the sense of the infinity
-    # norm, hence I call half the max range the plot radius.
-    plot_radius = 0.5*max([x_range, y_range, z_range])
-
-    ax.set_xlim3d([x_middle - plot_radius, x_middle + plot_radius])
-    ax.set_ylim3d([y_middle - plot_radius, y_middle + plot_radius])
-    ax.set_zlim3d([z_middle - plot_radius, z_middle + plot_radius])
-
-
-
-if __name__ == '__main__':
-    import numpy as np
-    import os
-    import json
-    import matplotlib.pyplot as plt
-    from mpl_toolkits.mplot3d import Axes3D #needed for '3d'
-    import sys
-
-    try:
-        __IPYTHON__
-        plt.ion()
-    except:
-        pass
-
-    filename = sys.argv[1]
-    filename = os.path.join(os.path.expanduser("~"), "MissionLogs", filename)
-
-    equal_z = False
-    if 'equalz' in sys.argv:
-        equal_z = True
-
-    no_bottom = False
-    if 'nobottom' in sys.argv:
-        no_bottom = True
-
-    no_swath = False
-    if 'noswath' in sys.argv:
-        no_swath = True
-
-
-
-
-    with open(filename, 'r') as f:
-        data = json.load(f)
-
-    nav_trace = np.array(data['navigation_trace']).astype(float)
-    loc_trace = nav_trace[:,:3]
-    roll_trace = nav_trace[:,3]
-    pitch_trace = nav_trace[:,4]
-    yaw_trace = nav_trace[:,5]
-    altitude_trace = np.array(data['altitude_trace']).astype(float)
-    gps_trace = np.array(data['raw_gps_trace'])
-    mplan = np.array(data['mission_plan_wps'])
-    swath = data.get('swath', 20)
-    err_growth = data.get('loc_uncertainty_growth',0.1)
-
-
-    fig = plt.figure()
-    ax = fig.add_subplot(111, projection='3d')
-
-    if loc_trace is not None:
-        origin = np.array(list(loc_trace[0]))
-        #center on first nav point
-        loc_trace -= origin
-        ax.plot(loc_trace[:,0], loc_trace[:,1], loc_trace[:,2], c='green')
-        ax.text(loc_trace[0,0], loc_trace[0,1], loc_trace[0,2], "S")
-        ax.text(loc_trace[-1,0], loc_trace[-1,1], loc_trace[-1,2], "E")
-    else:
-        print("Loc trace was None")
-
-    if yaw_trace is not None and pitch_trace is not None:
-        rot_vecs_x = np.cos(yaw_trace) * np.cos(pitch_trace)
-        rot_vecs_y = np.sin(yaw_trace) * np.cos(pitch_trace)
-        rot_vecs_z = np.sin(pitch_trace)
-        rot_vecs = np.vstack([rot_vecs_x, rot_vecs_y, rot_vecs_z]).T
-        step = 9
-        ax.quiver(loc_trace[::step, 0],
-                  loc_trace[::step, 1],
-                  loc_trace[::step, 2],
-                  rot_vecs[::step, 0],
-                  rot_vecs[::step, 1],
-                  rot_vecs[::step, 2],
-                  length = 1,
-                  color='green')
-    else:
-        print("Yaw or pitch traces were None")
-
-
-    if not no_bottom:
-        # plot the altitude relative to the height of the auv
-        bottom = loc_trace[:,2] - altitude_trace
-        ax.plot(loc_trace[:,0], loc_trace[:,1], bottom, c='yellow')
-
-    if not no_swath and swath is not None:
-        bottom = loc_trace[:,2] - altitude_trace
-        bottom_mid = np.median(bottom)
-        left_xs, left_ys = np.cos(yaw_trace+np.pi/2), np.sin(yaw_trace+np.pi/2)
-        right_xs, right_ys = np.cos(yaw_trace-np.pi/2), np.sin(yaw_trace-np.pi/2)
-        left_xs *= swath/2
-        right_xs *= swath/2
-        left_ys *= swath/2
-        right_ys *= swath/2
-        left_xs += loc_trace[:,0]
-        right_xs += loc_trace[:,0]
-        left_ys += loc_trace[:,1]
-        right_ys += loc_trace[:,1]
-        for x1,x2,y1,y2 in zip(right_xs, left_xs, right_ys, left_ys):
-            ax.plot([x1,x2],[y1,y2],[bottom_mid, bottom_mid],
-                    c='purple', alpha=0.2)
-
-
-
-
-
-    if len(mplan) > 1:
-        mplan[:,:2] -= origin[:2]
-        mplan[:,2] = np.minimum(mplan[:,2], 0)
-        ax.plot(mplan[:,0], mplan[:,1], mplan[:,2], c='red')
-
-    # filter out "non-fixes"
-    good_fixes = []
-    good_fix_locs = []
-    for gps_fix, loc in zip(gps_trace, loc_trace):
-        if gps_fix is None:
-            continue
-        good_fixes.append(gps_fix-origin[:2])
-        good_fix_locs.append(loc)
-
-    if len(good_fixes) > 0:
-        gps_fixes = np.array(good_fixes)
-        fix_locs = np.array(good_fix_locs)
-
-        ax.scatter(gps_fixes[:,0], gps_fixes[:,1], 0, c='grey', alpha=0.2)
-        step = 20
-        for fix, loc in zip(gps_fixes[::step], fix_locs[::step]):
-            xs = [fix[0], loc[0]]
-            ys = [fix[1], loc[1]]
-            zs = [0., loc[2]]
-            diff = np.sqrt((xs[0]-xs[1])**2+(ys[0]-ys[1])**2)
-            if diff > 0.5:
-                ax.plot(xs, ys, zs, c='grey', alpha=0.1)
-                ax.text(sum(xs)/2, sum(ys)/2, sum(zs)/2, s='{:.1f}'.format(diff))
-
-    plt.xlabel('lat utm')
-    plt.ylabel('lon utm')
-
-    tstart = data['time_trace'][0]
-    tend = data['time_trace'][-1]
-    plt.title("Duration:{:.2f} mins".format((tend-tstart)/60))
-
-    if equal_z:
-        set_axes_equal(ax)
-
-    plt.show()
-"""
+    def save(self):
+        if self.disabled:
+            print("Save location was bad before, can not save!")
+            return
+
+        self.write(self.snapshot())
 
 
+    def save_async(self):
+        """
+        like save, but only the copy is made here and the writing is done
+        in a worker thread. returns the job, None if the log is disabled
+        """
+        if self.disabled:
+            print("Save location was bad before, can not save!")
+            return None
 
+        return run_async(self.write, self.snapshot())
@@ -18,7 +18,9 @@ from geographic_msgs.msg import GeoPoint
 from smarc_msgs.srv import LatLonToUTM
 from smarc_msgs.msg import GotoWaypointGoal, GotoWaypoint
 
-from coverage_planner import create_coverage_path
+from coverage_planner import create_coverage_path, leg_water_speeds, CurrentField
+from plan_optimizer import optimize_waypoints
+from plan_patch import diff_plans, patch_summary
 
 class Waypoint:
     def __init__(self,
@@ -67,6 +69,8 @@ class Waypoint:
         # the GotoWaypoint object from smarc_msgs.msg
         self.wp = goto_waypoint
         self.extra_data = extra_data
+        # if True, the plan optimizer will not move this waypoint
+        self.ordered = False
 
 
     def set_utm_from_latlon(self, lat_lon_to_utm_serv, set_frame=False):
@@ -196,6 +200,55 @@ class Waypoint:
         self.extra_data = extra_data
 
 
+    def to_dict(self):
+        """
+        everything needed to re-create this waypoint, json-friendly
+        """
+        return {'imc_man_id':self.imc_man_id,
+                'ordered':self.ordered,
+                'extra_data':self.extra_data,
+                'frame_id':self.wp.pose.header.frame_id,
+                'x':self.wp.pose.pose.position.x,
+                'y':self.wp.pose.pose.position.y,
+                'z':self.wp.pose.pose.position.z,
+                'goal_tolerance':self.wp.goal_tolerance,
+                'z_control_mode':self.wp.z_control_mode,
+                'travel_altitude':self.wp.travel_altitude,
+                'travel_depth':self.wp.travel_depth,
+                'speed_control_mode':self.wp.speed_control_mode,
+                'travel_rpm':self.wp.travel_rpm,
+                'travel_speed':self.wp.travel_speed,
+                'lat':self.wp.lat,
+                'lon':self.wp.lon,
+                'name':self.wp.name}
+
+
+    def read_dict(self, d):
+        """
+        the opposite of to_dict
+        """
+        gwp = GotoWaypoint()
+        gwp.pose.header.frame_id = d['frame_id']
+        gwp.pose.pose.position.x = d['x']
+        gwp.pose.pose.position.y = d['y']
+        gwp.pose.pose.position.z = d['z']
+        gwp.goal_tolerance = d['goal_tolerance']
+        gwp.z_control_mode = d['z_control_mode']
+        gwp.travel_altitude = d['travel_altitude']
+        gwp.travel_depth = d['travel_depth']
+        gwp.speed_control_mode = d['speed_control_mode']
+        gwp.travel_rpm = d['travel_rpm']
+        gwp.travel_speed = d['travel_speed']
+        gwp.lat = d['lat']
+        gwp.lon = d['lon']
+        gwp.name = d['name']
+
+        self.imc_man_id = d['imc_man_id']
+        self.ordered = d['ordered']
+        self.extra_data = d['extra_data']
+        self.wp = gwp
+
+
     def __str__(self):
         s = 'Man: {}'.format(self.wp)
         return s
@@ -228,8 +281,13 @@ class MissionPlan:
             self.plan_id = plan_id
 
         self.plan_frame = auv_config.UTM_LINK
+        # maneuvers with this in their id are kept in the order they were given
+        self.ordered_tag = auv_config.PLAN_OPTIMIZATION_ORDERED_TAG
         self.coverage_swath = coverage_swath
         self.vehicle_localization_error_growth = vehicle_localization_error_growth
+        self.current_file = auv_config.COVERAGE_CURRENT_FILE
+        self.constant_current = (auv_config.COVERAGE_CURRENT_U, auv_config.COVERAGE_CURRENT_V)
+        self.coverage_max_speed = auv_config.COVERAGE_MAX_SPEED
 
         # test if the service is usable!
         # if not, test the backup
@@ -266,6 +324,10 @@ class MissionPlan:
         else:
             self.waypoints = []
 
+        # only re-order plans that we read ourselves
+        if waypoints is None and auv_config.ENABLE_PLAN_OPTIMIZATION:
+            self.optimize_order()
+
         for wp in self.waypoints:
             self.waypoint_man_ids.append(wp.wp.name)
 
@@ -276,6 +338,13 @@ class MissionPlan:
         # state of this plan
         self.plan_is_go = False
 
+        # re-uploads of this plan that were patched into it
+        self.num_patches = 0
+        self.last_patch = None
+        # changes when the waypoints still to be visited were changed under
+        # the goto action, by a patch or a skipped waypoint
+        self.revision = 0
+
 
     def _get_latlon_to_utm_service(self):
         try:
@@ -326,6 +395,7 @@ class MissionPlan:
         for wp_msg in msg.waypoints:
             wp = Waypoint(goto_waypoint = wp_msg,
                           imc_man_id = imc_enums.MANEUVER_GOTO)
+            wp.ordered = self.ordered_tag in wp_msg.name
             # also make sure they are in utm
             wp.set_utm_from_latlon(serv, set_frame=True)
             waypoints.append(wp)
@@ -382,6 +452,7 @@ class MissionPlan:
                 # construct the waypoint object
                 wp = Waypoint()
                 wp.read_imc_maneuver(maneuver, utm_x, utm_y, extra_data)
+                wp.ordered = self.ordered_tag in man_id
                 waypoints.append(wp)
 
 
@@ -405,10 +476,14 @@ class MissionPlan:
                 if len(maneuver.polygon) > 2:
                     rospy.loginfo("Generating rectangular coverage pattern")
                     utm_poly_points += [self.latlon_to_utm(polyvert.lat, polyvert.lon, -maneuver.z) for polyvert in maneuver.polygon]
-                    coverage_points = self.generate_coverage_pattern(utm_poly_points)
+                    travel_speed = None
+                    if maneuver.speed_units == imc_enums.SPEED_UNIT_MPS:
+                        travel_speed = maneuver.speed
+                    coverage_points, leg_speeds = self.generate_coverage_pattern(utm_poly_points, travel_speed)
                 else:
                     rospy.loginfo("This polygon ({}) has too few polygons for a coverarea, it will be used as a simple waypoint!".format(man_id))
                     coverage_points = utm_poly_points
+                    leg_speeds = None
 
 
                 for i,point in enumerate(coverage_points):
@@ -416,6 +491,11 @@ class MissionPlan:
                     wp.read_imc_maneuver(maneuver, point[0], point[1], {"poly":maneuver.polygon})
                     wp.wp.name = str(man_id) + "_{}/{}".format(i+1, len(coverage_points))
                     wp.imc_man_id = imc_enums.MANEUVER_GOTO
+                    # the leg that ends at this point
+                    if leg_speeds is not None and i > 0:
+                        wp.wp.travel_speed = float(leg_speeds[i-1])
+                    # the coverage pattern only makes sense in this order
+                    wp.ordered = True
                     waypoints.append(wp)
 
 
@@ -432,10 +512,119 @@ class MissionPlan:
 
 
 
-    def generate_coverage_pattern(self, polygon):
-        return create_coverage_path(polygon,
-                                    self.coverage_swath,
-                                    self.vehicle_localization_error_growth)
+    def optimize_order(self):
+        """
+        re-order the waypoints between the first, last and ordered ones
+        to shorten the path
+        """
+        t0 = time.time()
+        waypoints, dist_before, dist_after = optimize_waypoints(self.waypoints)
+        if dist_before is None:
+            return
+
+        self.waypoints = waypoints
+        rospy.loginfo("Re-ordered plan {} in {:.3f}s, length {:.1f}m -> {:.1f}m, saved {:.1f}m".format(self.plan_id,
+                                                                                                       time.time() - t0,
+                                                                                                       dist_before,
+                                                                                                       dist_after,
+                                                                                                       dist_before - dist_after))
+
+
+
+    def load_current_field(self):
+        """
+        None if there is no current configured or the file can not be read
+        """
+        if self.current_file is not None and self.current_file != '':
+            try:
+                return CurrentField.from_file(self.current_file)
+            except Exception as e:
+                rospy.logwarn("Could not read the current file {}: {}".format(self.current_file, e))
+                return None
+
+        if any(self.constant_current):
+            return CurrentField.constant(*self.constant_current)
+
+        return None
+
+
+    def append_waypoints(self, waypoints):
+        """
+        add waypoints to the end of the plan, a completed plan
+        will continue with them
+        """
+        self.waypoints.extend(waypoints)
+        for wp in waypoints:
+            self.waypoint_man_ids.append(wp.wp.name)
+
+
+    def patch(self, new_plan):
+        """
+        take the waypoints of a re-uploaded version of this plan, keeping
+        the visited waypoints that did not change as visited.
+        returns the patch dict, None if the plans could not be matched
+        in which case nothing is changed
+        """
+        result = diff_plans(self.waypoints, new_plan.waypoints, self.current_wp_index)
+        if result is None:
+            return None
+
+        waypoints, patch = result
+        self.waypoints = waypoints
+        self.waypoint_man_ids = [wp.wp.name for wp in waypoints]
+        self.current_wp_index = patch['new_index']
+        # for the md5 that neptus asks for
+        self.plandb_msg = new_plan.plandb_msg
+        self.num_patches += 1
+        self.last_patch = patch
+        if patch['rest_changed']:
+            self.revision += 1
+        return patch
+
+
+    @staticmethod
+    def patch_current(bb, auv_config, new_plan):
+        """
+        patches new_plan into the plan in the bb if it is a re-upload of it.
+        used by the handlers for every new plan that comes in.
+        returns True if it was patched, False if new_plan should replace the plan in the bb
+        """
+        current_plan = bb.get(bb_enums.MISSION_PLAN_OBJ)
+        if not auv_config.ENABLE_PLAN_PATCHING or \
+           current_plan is None or \
+           current_plan.plan_id != new_plan.plan_id:
+            return False
+
+        patch = current_plan.patch(new_plan)
+        if patch is None:
+            rospy.logwarn("Plan {} could not be patched, maneuver names are missing or repeated. Replacing it.".format(new_plan.plan_id))
+            return False
+
+        rospy.loginfo("Patched plan {}: {}".format(current_plan.plan_id, patch_summary(patch)))
+        return True
+
+
+    def generate_coverage_pattern(self, polygon, travel_speed=None):
+        """
+        returns the coverage points and the water speed of each leg between them.
+        leg speeds are None unless both a current and a travel speed are known
+        """
+        current_field = None
+        if travel_speed is not None:
+            current_field = self.load_current_field()
+
+        coverage_points = create_coverage_path(polygon,
+                                               self.coverage_swath,
+                                               self.vehicle_localization_error_growth,
+                                               current_field = current_field,
+                                               travel_speed = travel_speed,
+                                               max_speed = self.coverage_max_speed)
+        if current_field is None:
+            return coverage_points, None
+
+        leg_speeds = leg_water_speeds(coverage_points, current_field, travel_speed, self.coverage_max_speed)
+        rospy.loginfo("Coverage legs planned with current, speeds {:.2f}-{:.2f}m/s".format(min(leg_speeds), max(leg_speeds)))
+        return coverage_points, leg_speeds
 
 
     def get_pose_array(self, flip_z=False):
@@ -505,6 +694,17 @@ class MissionPlan:
         self.current_wp_index += 1
 
 
+    def skip_current_wp(self):
+        """
+        leave the current wp without going to it, the goto action
+        that is going to it drops its goal like it does after a patch
+        """
+        if self.is_complete():
+            return
+        self.visit_wp()
+        self.revision += 1
+
+
     def get_current_wp(self):
         """
         pop a wp from the remaining wps and return it
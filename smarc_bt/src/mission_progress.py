@@ -0,0 +1,174 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Distance based progress and ETA of a mission plan.
+The leg lengths are computed once when a new plan is seen, after that
+every update only projects the vehicle onto the current leg.
+"""
+
+import math
+import time
+
+
+class MissionProgress(object):
+    def __init__(self,
+                 speed_smoothing = 0.1,
+                 min_speed = 0.05,
+                 dvl_timeout = 2.):
+        """
+        speed_smoothing -> weight of a new speed measurement in the running average
+        min_speed -> below this speed, m/s, no ETA is given
+        dvl_timeout -> seconds, older dvl velocities are ignored and
+        the speed is estimated from the change in position instead
+        """
+        self.speed_smoothing = speed_smoothing
+        self.min_speed = min_speed
+        self.dvl_timeout = dvl_timeout
+
+        self.speed = None
+        self._last_position = None
+        self._last_position_time = None
+
+        self._reset(None)
+
+    def _reset(self, mission_plan):
+        self._plan = mission_plan
+        self._num_patches = 0 if mission_plan is None else mission_plan.num_patches
+        # cumulative[i] = length of the plan from the first wp to the i'th wp
+        self._cumulative = []
+        # the first leg starts where the vehicle was when the plan was seen
+        self._start = None
+        self._start_length = 0.
+
+        self.progress = 0.
+        self.travelled_distance = 0.
+        self.remaining_distance = None
+        self.eta = None
+
+        if mission_plan is None:
+            return
+
+        total = 0.
+        prev = None
+        for wp in mission_plan.waypoints:
+            if prev is not None:
+                total += math.hypot(wp.x - prev.x, wp.y - prev.y)
+            self._cumulative.append(total)
+            prev = wp
+
+    @property
+    def total_distance(self):
+        if len(self._cumulative) == 0:
+            return 0.
+        return self._start_length + self._cumulative[-1]
+
+    def _update_speed(self, position, dvl_velocity, dvl_time, now):
+        measured = None
+        if dvl_velocity is not None and dvl_time is not None and now - dvl_time < self.dvl_timeout:
+            measured = math.hypot(dvl_velocity.x, dvl_velocity.y)
+        elif position is not None and self._last_position is not None:
+            dt = now - self._last_position_time
+            if dt > 0:
+                measured = math.hypot(position[0] - self._last_position[0],
+                                      position[1] - self._last_position[1]) / dt
+
+        if position is not None:
+            self._last_position = position
+            self._last_position_time = now
+
+        if measured is None:
+            return
+
+        if self.speed is None:
+            self.speed = measured
+        else:
+            self.speed += self.speed_smoothing * (measured - self.speed)
+
+    def update(self, mission_plan, position, dvl_velocity=None, dvl_time=None, now=None):
+        """
+        position -> (x,y) in the frame of the plan, can be None
+        dvl_velocity -> a Vector3 like object, can be None
+        dvl_time -> when dvl_velocity was received
+        """
+        if now is None:
+            now = time.time()
+
+        if position is not None and None in position:
+            position = None
+
+        self._update_speed(position, dvl_velocity, dvl_time, now)
+
+        if mission_plan is not self._plan or \
+           (mission_plan is not None and len(mission_plan.waypoints) != len(self._cumulative)) or \
+           (mission_plan is not None and mission_plan.num_patches != self._num_patches):
+            self._reset(mission_plan)
+
+        if mission_plan is None or len(mission_plan.waypoints) == 0:
+            return
+
+        if mission_plan.is_complete():
+            self.progress = 100.
+            self.travelled_distance = self.total_distance
+            self.remaining_distance = 0.
+            self.eta = 0.
+            return
+
+        if position is None:
+            return
+
+        index = max(mission_plan.current_wp_index, 0)
+        wp = mission_plan.waypoints[index]
+        if index == 0:
+            if self._start is None:
+                self._start = position
+                self._start_length = math.hypot(wp.x - position[0], wp.y - position[1])
+            prev_x, prev_y = self._start
+            before = 0.
+            leg_length = self._start_length
+        else:
+            prev_wp = mission_plan.waypoints[index-1]
+            prev_x, prev_y = prev_wp.x, prev_wp.y
+            before = self._start_length + self._cumulative[index-1]
+            leg_length = self._cumulative[index] - self._cumulative[index-1]
+
+        # projection of the vehicle onto the current leg
+        if leg_length > 0:
+            along = ((position[0] - prev_x)*(wp.x - prev_x) + (position[1] - prev_y)*(wp.y - prev_y)) / leg_length
+            along = min(max(along, 0.), leg_length)
+        else:
+            along = 0.
+
+        total = self.total_distance
+        self.travelled_distance = before + along
+        self.remaining_distance = max(total - self.travelled_distance, 0.)
+        if total > 0:
+            self.progress = min(100., 100. * self.travelled_distance / total)
+        else:
+            self.progress = 0.
+
+        if self.speed is not None and self.speed > self.min_speed:
+            self.eta = self.remaining_distance / self.speed
+        else:
+            self.eta = None
+
+    def tick(self, vehicle, mission_plan):
+        self.update(mission_plan,
+                    vehicle.position_utm,
+                    vehicle.dvl_velocity_msg,
+                    vehicle._last_update_dvl)
+
+    def to_dict(self):
+        return {'progress': self.progress,
+                'travelled_distance': self.travelled_distance,
+                'remaining_distance': self.remaining_distance,
+                'speed': self.speed,
+                'eta': self.eta}
+
+    def __str__(self):
+        if self.eta is None:
+            eta = 'unknown'
+        else:
+            eta = '{:.0f}s'.format(self.eta)
+        return "Progress:{:.1f}% remaining:{} ETA:{}".format(self.progress, self.remaining_distance, eta)
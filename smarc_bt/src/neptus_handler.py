@@ -11,6 +11,8 @@ import rospy, time
 import numpy as np
 
 from mission_plan import MissionPlan
+from service_client import run_async
+from telemetry_scheduler import TelemetryScheduler
 
 class NeptusHandler(object):
     """
@@ -67,11 +69,25 @@ class NeptusHandler(object):
         # a list of messages from all the different parts of the handler
         self.feedback_messages = []
 
+        # reading a plan calls the lat_lon_to_utm service for every waypoint
+        # so it is done in the background, only the latest one is kept
+        self._plan_job = None
+
+        # the link to neptus is usually slow, only send what changed
+        heartbeat = self._config.IMC_HEARTBEAT_PERIOD
+        self._telemetry = TelemetryScheduler()
+        self._telemetry.add_channel('EstimatedState', self._config.IMC_ESTIMATED_STATE_PERIOD, heartbeat)
+        self._telemetry.add_channel('PlanControlState', self._config.IMC_PLAN_CONTROL_STATE_PERIOD, heartbeat)
+        self._telemetry.add_channel('VehicleState', self._config.IMC_VEHICLE_STATE_PERIOD, heartbeat)
+        self._telemetry.add_channel('PlanDBSuccess', self._config.IMC_PLANDB_SUCCESS_PERIOD, heartbeat)
+        self._telemetry.add_channel('GPSFix', self._config.IMC_GPS_FIX_PERIOD, heartbeat)
+
 
     def __str__(self):
         s = "Neptus status:\n"
         for m in self.feedback_messages:
             s += "\n"+m
+        s += "\n"+str(self._telemetry)
         return s
 
     def tick(self):
@@ -82,6 +98,7 @@ class NeptusHandler(object):
         self._updatePlanControl()
         self._updateGPSFix()
         self.feedback_messages = []
+        rospy.loginfo_throttle(60, str(self._telemetry))
 
     def _updateEstimatedState(self):
         lat, lon = self._vehicle.position_latlon
@@ -100,7 +117,12 @@ class NeptusHandler(object):
         self._estimated_state_msg.depth = depth
         self._estimated_state_msg.psi = np.pi/2. - yaw
         # send the message to neptus
-        self._estimated_state_pub.publish(self._estimated_state_msg)
+        # ~10cm, 10cm and ~0.5deg are 'the same' for the map in neptus
+        key = (round(lat, 6), round(lon, 6), round(depth, 1), round(yaw, 2))
+        self._telemetry.publish('EstimatedState',
+                                self._estimated_state_pub,
+                                self._estimated_state_msg,
+                                key)
 
     def _updateGPSFix(self):
         # the bridge only looks at lat lon height=altitude
@@ -112,10 +134,15 @@ class NeptusHandler(object):
                 self._gps_fix_msg.longitude = ros_gps_msg.longitude
                 self._gps_fix_msg.altitude = -self._vehicle.depth
                 self._gps_fix_msg.header.seq = int(time.time())
-                self._gps_fix_pub.publish(self._gps_fix_msg)
-                self._gps_nav_data_pub.publish(self._gps_fix_msg)
+                key = (ros_gps_msg.latitude, ros_gps_msg.longitude, round(self._vehicle.depth, 1))
+                if self._telemetry.publish('GPSFix',
+                                           self._gps_fix_pub,
+                                           self._gps_fix_msg,
+                                           key):
+                    # same content, no need to ask the scheduler again
+                    self._gps_nav_data_pub.publish(self._gps_fix_msg)
         except:
-            self.feedback_message.append("Could not update neptus gps fix")
+            self.feedback_messages.append("Could not update neptus gps fix")
             pass
 
     def _updatePlanControlState(self):
@@ -141,7 +168,11 @@ class NeptusHandler(object):
             if mission_plan.plan_is_go:
                 self._plan_control_state_msg.man_id = current_man_id
 
-            plan_progress = (current_wp_index * 100.0) / total # percent float
+            mission_progress = self._bb.get(bb_enums.MISSION_PROGRESS)
+            if mission_progress is not None and mission_progress.total_distance > 0:
+                plan_progress = mission_progress.progress
+            else:
+                plan_progress = (max(current_wp_index, 0) * 100.0) / total # percent float
             self._plan_control_state_msg.plan_progress = plan_progress
 
 
@@ -159,7 +190,12 @@ class NeptusHandler(object):
             self._plan_control_state_msg.plan_id += '(AUTONOMOUS)'
 
         # send message to neptus
-        self._plan_control_state_pub.publish(self._plan_control_state_msg)
+        msg = self._plan_control_state_msg
+        key = (msg.state, msg.plan_id, msg.man_id, round(msg.plan_progress, 1))
+        self._telemetry.publish('PlanControlState',
+                                self._plan_control_state_pub,
+                                msg,
+                                key)
 
 
     def _updateVehicleState(self):
@@ -171,7 +207,10 @@ class NeptusHandler(object):
         else:
             self._vehicle_state_msg.op_mode = imc_enums.OP_MODE_SERVICE
 
-        self._vehicle_state_pub.publish(self._vehicle_state_msg)
+        self._telemetry.publish('VehicleState',
+                                self._vehicle_state_pub,
+                                self._vehicle_state_msg,
+                                self._vehicle_state_msg.op_mode)
 
     ##### PLANDB STUFF BEGINS HERE
     def _plandb_cb(self, msg):
@@ -224,15 +263,37 @@ class NeptusHandler(object):
 
     def _handle_set_plan(self, plandb_msg):
         # there is a plan we can at least look at
-        mission_plan = MissionPlan(auv_config = self._config,
+        # the bb is read here, the worker thread should not touch it
+        self._plan_job = run_async(MissionPlan,
+                                   auv_config = self._config,
                                    plandb_msg = plandb_msg,
                                    coverage_swath = self._bb.get(bb_enums.SWATH),
                                    vehicle_localization_error_growth = self._bb.get(bb_enums.LOCALIZATION_ERROR_GROWTH))
+        self.feedback_messages.append("Reading plan:{}".format(plandb_msg.plan_id))
+
+    def _check_plan_job(self):
+        if self._plan_job is None or not self._plan_job.done():
+            return
+
+        job = self._plan_job
+        self._plan_job = None
+        try:
+            mission_plan = job.get()
+        except Exception as e:
+            rospy.logerr("Could not read the plan: {}".format(e))
+            self.feedback_messages.append("MISSION PLAN COULD NOT BE READ")
+            return
+        rospy.loginfo("Read plan {} in {:.2f}s".format(mission_plan.plan_id, job.elapsed))
 
         if mission_plan.no_service:
             self.feedback_messages.append("MISSION PLAN HAS NO SERVICE")
             return
 
+        if MissionPlan.patch_current(self._bb, self._config, mission_plan):
+            self._bb.set(bb_enums.MISSION_FINALIZED, False)
+            self.feedback_messages.append("Patched plan:{}".format(mission_plan.plan_id))
+            return
+
         self._bb.set(bb_enums.MISSION_PLAN_OBJ, mission_plan)
         self._bb.set(bb_enums.ENABLE_AUTONOMY, False)
         self._bb.set(bb_enums.MISSION_FINALIZED, False)
@@ -278,10 +339,16 @@ class NeptusHandler(object):
         plandb_msg.type = imc_enums.PLANDB_TYPE_SUCCESS
         plandb_msg.op = imc_enums.PLANDB_OP_SET
         plandb_msg.plan_id = plan_id
-        self._plandb_pub.publish(plandb_msg)
-        self.feedback_messages.append("Answered set success for plan_id:"+str(plan_id))
+        # the plan only changes rarely, no need to spam the link with this
+        key = (plan_id, current_mission_plan.creation_time, current_mission_plan.num_patches)
+        if self._telemetry.publish('PlanDBSuccess',
+                                   self._plandb_pub,
+                                   plandb_msg,
+                                   key):
+            self.feedback_messages.append("Answered set success for plan_id:"+str(plan_id))
 
     def _updatePlanDB(self):
+        self._check_plan_job()
         self._respond_set_success()
         self._handle_plandb_msg()
         self._last_received_plandb_msg = None
@@ -296,6 +363,7 @@ class NeptusHandler(object):
             # not receiving anything is ok.
             return
 
+
         # check if this message is a 'go' or 'no go' message
         # imc/plan_control(569):
         # int type:[0,1,2,3] req,suc,fail,in prog
@@ -324,6 +392,9 @@ class NeptusHandler(object):
         current_mission_plan = self._bb.get(bb_enums.MISSION_PLAN_OBJ)
         # separate well-defined ifs for possible future shenanigans.
         if typee==0 and op==0 and plan_id!='' and flags==1:
+            # a start given right after a plan should wait for the plan
+            if self._plan_job is not None:
+                return
             # start button
             # check if the start was given for our current plan
             self._bb.set(bb_enums.ENABLE_AUTONOMY, False)
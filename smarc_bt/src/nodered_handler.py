@@ -2,13 +2,15 @@
 # -*- coding: utf-8 -*-
 # vim:fenc=utf-8
 
-import rospy, time
+import rospy, time, json
 import numpy as np
 
 from mission_plan import MissionPlan
+from service_client import run_async
 import imc_enums, bb_enums
 
 from smarc_msgs.msg import MissionControl
+from std_msgs.msg import String
 
 class NoderedHandler(object):
     """
@@ -37,18 +39,54 @@ class NoderedHandler(object):
                                                     MissionControl,
                                                     queue_size=1)
 
+        # small, periodic message with the index and progress of the plan
+        # so that the full plan does not need to be sent all the time
+        self._progress_pub = rospy.Publisher(self._config.MISSION_PROGRESS_TOPIC,
+                                             String,
+                                             queue_size=1)
+
+        self._feedback_period = self._config.NODERED_FEEDBACK_PERIOD
+        self._compact_feedback = self._config.NODERED_COMPACT_FEEDBACK
+        self._last_feedback_time = 0
+        # (plan_id, creation_time, #wps, #patches) of the plan whose waypoints we sent last
+        # and the waypoint list of it, so we dont re-build it every tick
+        self._sent_plan_key = None
+        self._plan_wps_key = None
+        self._plan_wps = []
+
+        # plans are read in the background, see NeptusHandler
+        self._plan_job = None
+
     def _mission_control_cb(self, msg):
+        # our own feedback comes back on the same topic, it should not
+        # replace a command that is waiting for a plan to be read
+        if msg.command == MissionControl.CMD_IS_FEEDBACK:
+            return
         self._last_received_mc_msg = msg
 
-    def _publish_current_plan(self):
-        # simply publish the current plan at every tick
+    def _plan_waypoints(self, mission_plan, plan_key):
+        if plan_key != self._plan_wps_key:
+            # mission plan should contain a list of waypoint objects that each contain
+            # a GotoWaypoint object called wp
+            self._plan_wps = [wp.wp for wp in mission_plan.waypoints]
+            self._plan_wps_key = plan_key
+        return self._plan_wps
+
+    def _publish_current_plan(self, full=False):
+        """
+        publish the state of the current plan.
+        in compact mode, the waypoints are only included when the plan is new
+        or when full=True, otherwise the list is left empty.
+        """
         self._mc_msg.command = MissionControl.CMD_IS_FEEDBACK
         mission_plan = self._bb.get(bb_enums.MISSION_PLAN_OBJ)
         if mission_plan is None:
+            plan_key = None
             self._mc_msg.name = "No plan"
             self._mc_msg.plan_state = MissionControl.FB_STOPPED
             self._mc_msg.waypoints = []
         else:
+            plan_key = (mission_plan.plan_id, mission_plan.creation_time, len(mission_plan.waypoints), mission_plan.num_patches)
             # there is a plan, inform the planner of its state
             self._mc_msg.name = mission_plan.plan_id
             if mission_plan.is_complete():
@@ -63,11 +101,55 @@ class NoderedHandler(object):
 
             # XXX maybe check emergency as well, maybe not meh
 
-            # mission plan should contain a list of waypoint objects that each contain
-            # a GotoWaypoint object called wp
-            self._mc_msg.waypoints = [wp.wp for wp in mission_plan.waypoints]
+            if full or not self._compact_feedback or plan_key != self._sent_plan_key:
+                self._mc_msg.waypoints = self._plan_waypoints(mission_plan, plan_key)
+            else:
+                self._mc_msg.waypoints = []
 
         self._mission_control_pub.publish(self._mc_msg)
+        self._sent_plan_key = plan_key
+        self._last_feedback_time = time.time()
+        self._publish_progress(mission_plan)
+
+    def _publish_progress(self, mission_plan):
+        progress = {'name': self._mc_msg.name,
+                    'plan_state': self._mc_msg.plan_state}
+        if mission_plan is not None:
+            total = len(mission_plan.waypoints)
+            index = max(mission_plan.current_wp_index, 0)
+            progress['current_wp_index'] = mission_plan.current_wp_index
+            progress['num_wps'] = total
+            if mission_plan.last_patch is not None:
+                progress['num_patches'] = mission_plan.num_patches
+                progress['last_patch'] = mission_plan.last_patch
+            if total > 0:
+                progress['progress'] = min(100.0, (index * 100.0) / total)
+            else:
+                progress['progress'] = 100.0
+
+            # distance based progress, remaining distance and ETA if we have them
+            mission_progress = self._bb.get(bb_enums.MISSION_PROGRESS)
+            if mission_progress is not None and mission_progress.total_distance > 0:
+                progress.update(mission_progress.to_dict())
+
+            coverage_map = self._bb.get(bb_enums.COVERAGE_MAP)
+            if coverage_map is not None and coverage_map.target is not None:
+                progress.update(coverage_map.to_dict())
+
+        self._progress_pub.publish(String(data=json.dumps(progress)))
+
+    def _feedback_is_due(self):
+        mission_plan = self._bb.get(bb_enums.MISSION_PLAN_OBJ)
+        if mission_plan is None:
+            plan_key = None
+        else:
+            plan_key = (mission_plan.plan_id, mission_plan.creation_time, len(mission_plan.waypoints), mission_plan.num_patches)
+
+        # a new plan should be sent as soon as we have it
+        if plan_key != self._sent_plan_key:
+            return True
+
+        return time.time() - self._last_feedback_time >= self._feedback_period
 
     def _command_matches_known_mission(self, msg):
         current_mission = self._bb.get(bb_enums.MISSION_PLAN_OBJ)
@@ -81,8 +163,27 @@ class NoderedHandler(object):
             return False
         return True
 
+    def _check_plan_job(self):
+        if self._plan_job is None or not self._plan_job.done():
+            return
+
+        job = self._plan_job
+        self._plan_job = None
+        try:
+            new_plan = job.get()
+        except Exception as e:
+            rospy.logerr("Could not read the plan: {}".format(e))
+            return
+
+        if not MissionPlan.patch_current(self._bb, self._config, new_plan):
+            self._bb.set(bb_enums.MISSION_PLAN_OBJ, new_plan)
+            rospy.loginfo("New mission {} set!".format(new_plan.plan_id))
+
     def tick(self):
-        self._publish_current_plan()
+        self._check_plan_job()
+
+        if self._feedback_is_due():
+            self._publish_current_plan()
 
         if self._last_received_mc_msg is None:
             return
@@ -90,6 +191,10 @@ class NoderedHandler(object):
         # there might be a command from nodered, check it
 
         msg = self._last_received_mc_msg
+        # a start given right after a plan should wait for the plan
+        if msg.command == MissionControl.CMD_START and self._plan_job is not None:
+            return
+        self._last_received_mc_msg = None
         current_mission = self._bb.get(bb_enums.MISSION_PLAN_OBJ)
         if msg.command == MissionControl.CMD_START:
             # start a mission, but check that the start is given
@@ -119,20 +224,20 @@ class NoderedHandler(object):
             rospy.logwarn("Aborted")
 
         elif msg.command == MissionControl.CMD_SET_PLAN:
-            new_plan = MissionPlan(auv_config = self._config,
-                                   plan_id = msg.name,
-                                   mission_control_msg = msg,
-                                   coverage_swath = self._bb.get(bb_enums.SWATH),
-                                   vehicle_localization_error_growth = self._bb.get(bb_enums.LOCALIZATION_ERROR_GROWTH))
-            self._bb.set(bb_enums.MISSION_PLAN_OBJ, new_plan)
-            rospy.loginfo("New mission {} set!".format(msg.name))
+            self._plan_job = run_async(MissionPlan,
+                                       auv_config = self._config,
+                                       plan_id = msg.name,
+                                       mission_control_msg = msg,
+                                       coverage_swath = self._bb.get(bb_enums.SWATH),
+                                       vehicle_localization_error_growth = self._bb.get(bb_enums.LOCALIZATION_ERROR_GROWTH))
+            rospy.loginfo("Reading mission {}".format(msg.name))
 
         elif msg.command == MissionControl.CMD_IS_FEEDBACK:
             # do nothing with feedback
             pass
 
         elif msg.command == MissionControl.CMD_REQUEST_FEEDBACK:
-            self._publish_current_plan()
+            self._publish_current_plan(full=True)
 
         else:
             pass
@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Re-orders the waypoints of a plan to make the path shorter.
+Nearest neighbour for a first route, then 2-opt and Or-opt moves
+until nothing improves or the time runs out.
+The first and last points of a route never move.
+"""
+
+import time
+import numpy as np
+
+# improvements smaller than this are ignored, meters
+EPS = 1e-6
+
+
+def distance_matrix(points):
+    points = np.asarray(points, dtype=float)
+    diff = points[:, np.newaxis, :] - points[np.newaxis, :, :]
+    return np.sqrt((diff**2).sum(axis=-1))
+
+
+def route_length(dist, route):
+    route = np.asarray(route)
+    return dist[route[:-1], route[1:]].sum()
+
+
+def nearest_neighbour_route(dist):
+    """
+    starts at 0, ends at n-1, greedily picks the closest point in between
+    """
+    n = len(dist)
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[0] = False
+    unvisited[n-1] = False
+    route = [0]
+    current = 0
+    for _ in range(n-2):
+        candidates = np.where(unvisited, dist[current], np.inf)
+        current = int(np.argmin(candidates))
+        unvisited[current] = False
+        route.append(current)
+    route.append(n-1)
+    return route
+
+
+def two_opt_pass(dist, route):
+    """
+    reverse route[i:j+1] if it makes the route shorter.
+    all j are checked at once for every i.
+    returns True if anything changed
+    """
+    improved = False
+    n = len(route)
+    for i in range(1, n-2):
+        r = np.asarray(route)
+        a, b = r[i-1], r[i]
+        c = r[i+1:n-1]
+        d = r[i+2:n]
+        delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+        k = int(np.argmin(delta))
+        if delta[k] < -EPS:
+            j = i + 1 + k
+            route[i:j+1] = route[i:j+1][::-1]
+            improved = True
+    return improved
+
+
+def or_opt_pass(dist, route, max_segment_length=3):
+    """
+    move a segment of 1 to max_segment_length points, possibly reversed,
+    to wherever it makes the route shortest.
+    returns True if anything changed
+    """
+    improved = False
+    for seg_len in range(1, max_segment_length+1):
+        i = 1
+        while i + seg_len < len(route):
+            seg = route[i:i+seg_len]
+            prev, nxt = route[i-1], route[i+seg_len]
+            first, last = seg[0], seg[-1]
+            removal_gain = dist[prev, first] + dist[last, nxt] - dist[prev, nxt]
+
+            rest = np.asarray(route[:i] + route[i+seg_len:])
+            u = rest[:-1]
+            v = rest[1:]
+            base = dist[u, v]
+            forward = dist[u, first] + dist[last, v] - base
+            backward = dist[u, last] + dist[first, v] - base
+
+            k_f = int(np.argmin(forward))
+            k_b = int(np.argmin(backward))
+            if forward[k_f] <= backward[k_b]:
+                k, cost, reverse = k_f, forward[k_f], False
+            else:
+                k, cost, reverse = k_b, backward[k_b], True
+
+            if cost - removal_gain < -EPS:
+                rest = list(rest)
+                if reverse:
+                    seg = seg[::-1]
+                route[:] = rest[:k+1] + seg + rest[k+1:]
+                improved = True
+            i += 1
+    return improved
+
+
+def optimize_order(points, time_limit=0.2):
+    """
+    points is an (N,2) array
+    returns a list of indices into points, starting with 0 and ending with N-1
+    """
+    n = len(points)
+    if n <= 3:
+        return list(range(n))
+
+    dist = distance_matrix(points)
+    route = nearest_neighbour_route(dist)
+    # nearest neighbour can be worse than the given order
+    if route_length(dist, route) > route_length(dist, range(n)):
+        route = list(range(n))
+
+    deadline = time.time() + time_limit
+    while time.time() < deadline:
+        improved = two_opt_pass(dist, route)
+        improved = or_opt_pass(dist, route) or improved
+        if not improved:
+            break
+
+    return route
+
+
+def optimize_waypoints(waypoints, time_limit=0.2):
+    """
+    waypoints is a list of mission_plan.Waypoint objects.
+    The first and last waypoints, and the ones with ordered=True stay
+    where they are, the waypoints between them are re-ordered.
+    returns (new list of waypoints, length before, length after)
+    """
+    if len(waypoints) <= 3:
+        return waypoints, None, None
+
+    points = np.array([(wp.x, wp.y) for wp in waypoints])
+    anchors = [i for i,wp in enumerate(waypoints) if i == 0 or i == len(waypoints)-1 or wp.ordered]
+
+    order = []
+    for a, b in zip(anchors[:-1], anchors[1:]):
+        group_order = optimize_order(points[a:b+1], time_limit / len(anchors))
+        order.extend(a + i for i in group_order[:-1])
+    order.append(len(waypoints)-1)
+
+    dist_before = np.linalg.norm(np.diff(points, axis=0), axis=1).sum()
+    dist_after = np.linalg.norm(np.diff(points[order], axis=0), axis=1).sum()
+    return [waypoints[i] for i in order], dist_before, dist_after
@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Compares a re-uploaded version of a plan with the running one.
+Waypoints are matched by their maneuver names, which the planners keep
+between uploads of the same plan. A waypoint that was visited and did not
+change stays visited, the plan continues from the first waypoint that was
+not visited or was edited.
+The unchanged waypoint objects of the running plan are kept in the patched
+list, the actions that hold them do not see a difference.
+"""
+
+from bisect import bisect_left
+
+
+def waypoint_key(wp):
+    """
+    what makes two waypoints the same, the goal tolerance is
+    over-written by the goto action so it is left out
+    """
+    d = wp.to_dict()
+    d.pop('goal_tolerance')
+    return d
+
+
+def increasing_subsequence(values):
+    """
+    the longest strictly increasing subsequence of values
+    returns the set of the values in it
+    """
+    # tails[k] = index in values of the smallest tail of a subsequence of length k+1
+    tails = []
+    tail_values = []
+    parents = [None]*len(values)
+    for i, v in enumerate(values):
+        k = bisect_left(tail_values, v)
+        if k > 0:
+            parents[i] = tails[k-1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(v)
+        else:
+            tails[k] = i
+            tail_values[k] = v
+
+    kept = set()
+    i = tails[-1] if tails else None
+    while i is not None:
+        kept.add(values[i])
+        i = parents[i]
+    return kept
+
+
+def diff_plans(old_waypoints, new_waypoints, old_index):
+    """
+    old_waypoints, new_waypoints -> lists of mission_plan.Waypoint objects
+    old_index -> current_wp_index of the running plan, the waypoints before it are visited
+    returns (patched waypoint list, patch dict) or None if the waypoints
+    can not be matched because of missing or repeated names
+    """
+    old_names = [wp.wp.name for wp in old_waypoints]
+    new_names = [wp.wp.name for wp in new_waypoints]
+    for names in (old_names, new_names):
+        if '' in names or len(set(names)) != len(names):
+            return None
+
+    old_by_name = dict(zip(old_names, old_waypoints))
+    old_pos = dict((n, i) for i, n in enumerate(old_names))
+
+    inserted = []
+    changed = []
+    common = []
+    waypoints = []
+    for wp, name in zip(new_waypoints, new_names):
+        old_wp = old_by_name.get(name)
+        if old_wp is None:
+            inserted.append(name)
+            waypoints.append(wp)
+            continue
+        common.append(name)
+        if waypoint_key(old_wp) == waypoint_key(wp):
+            waypoints.append(old_wp)
+        else:
+            changed.append(name)
+            waypoints.append(wp)
+
+    new_set = set(new_names)
+    deleted = [n for n in old_names if n not in new_set]
+    # the common waypoints that are not in the longest run that kept its order
+    in_order = increasing_subsequence([old_pos[n] for n in common])
+    moved = [n for n in common if old_pos[n] not in in_order]
+
+    # the plan continues from the first waypoint that was not visited as it is now
+    if old_index < 0:
+        new_index = old_index
+        visited = set()
+    else:
+        visited = set(old_names[:old_index]) - set(changed)
+        new_index = 0
+        while new_index < len(new_names) and new_names[new_index] in visited:
+            new_index += 1
+
+    # the part that is still to be done, if that did not change the
+    # vehicle can keep going to where it was going
+    old_rest = old_waypoints[max(old_index, 0):]
+    new_rest = waypoints[max(new_index, 0):]
+    rest_changed = len(old_rest) != len(new_rest) or \
+                   any(a is not b for a, b in zip(old_rest, new_rest))
+
+    patch = {'inserted': inserted,
+             'deleted': deleted,
+             'moved': moved,
+             'changed': changed,
+             'old_index': old_index,
+             'new_index': new_index,
+             'rest_changed': rest_changed}
+    return waypoints, patch
+
+
+def patch_summary(patch):
+    return "+{} -{} moved:{} changed:{}, wp {}->{}".format(len(patch['inserted']),
+                                                         len(patch['deleted']),
+                                                         len(patch['moved']),
+                                                         len(patch['changed']),
+                                                         patch['old_index'],
+                                                         patch['new_index'])
@@ -0,0 +1,129 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+A registry of all the points of interest seen during a mission.
+Detections closer than merge_radius to a known POI are merged into it.
+"""
+
+import math
+
+
+class POI(object):
+    def __init__(self, poi_id, x, y, z, frame_id, t):
+        self.poi_id = poi_id
+        self.x = x
+        self.y = y
+        self.z = z
+        self.frame_id = frame_id
+        self.hits = 1
+        self.first_seen = t
+        self.last_seen = t
+
+    def merge(self, x, y, z, t):
+        # running mean of the detections
+        self.hits += 1
+        self.x += (x - self.x) / self.hits
+        self.y += (y - self.y) / self.hits
+        self.z += (z - self.z) / self.hits
+        self.last_seen = t
+
+    def distance_to(self, x, y, z):
+        return math.sqrt( (self.x-x)**2 + (self.y-y)**2 + (self.z-z)**2 )
+
+    def to_dict(self):
+        return {'id':self.poi_id,
+                'x':self.x,
+                'y':self.y,
+                'z':self.z,
+                'frame_id':self.frame_id,
+                'hits':self.hits,
+                'first_seen':self.first_seen,
+                'last_seen':self.last_seen}
+
+    def __str__(self):
+        return "POI#{} ({:.1f},{:.1f},{:.1f}) hits:{}".format(self.poi_id, self.x, self.y, self.z, self.hits)
+
+
+class POIRegistry(object):
+    """
+    Spatial hash of POIs with cells of merge_radius size.
+    Anything within merge_radius of a point is in the 27 cells around it,
+    so a lookup does not depend on how many POIs we have seen.
+    """
+    def __init__(self, merge_radius):
+        assert merge_radius > 0, "The merge radius of the POI registry must be positive, got {}".format(merge_radius)
+        self.merge_radius = float(merge_radius)
+        self.pois = []
+        # cell -> list of POIs in that cell
+        self._grid = {}
+
+    def __len__(self):
+        return len(self.pois)
+
+    def _cell(self, x, y, z):
+        r = self.merge_radius
+        return (int(math.floor(x/r)), int(math.floor(y/r)), int(math.floor(z/r)))
+
+    def _remove_from_grid(self, poi):
+        cell = self._cell(poi.x, poi.y, poi.z)
+        bucket = self._grid.get(cell)
+        if bucket is not None:
+            bucket.remove(poi)
+            if len(bucket) == 0:
+                del self._grid[cell]
+
+    def _add_to_grid(self, poi):
+        self._grid.setdefault(self._cell(poi.x, poi.y, poi.z), []).append(poi)
+
+    def nearest(self, x, y, z):
+        """
+        returns (poi, distance) of the closest known POI within merge_radius
+        or (None, None)
+        """
+        cx, cy, cz = self._cell(x, y, z)
+        closest = None
+        closest_dist = None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    for poi in self._grid.get((cx+dx, cy+dy, cz+dz), ()):
+                        dist = poi.distance_to(x, y, z)
+                        if dist <= self.merge_radius and (closest_dist is None or dist < closest_dist):
+                            closest = poi
+                            closest_dist = dist
+        return closest, closest_dist
+
+    def add(self, x, y, z, frame_id, t):
+        """
+        add a detection to the registry.
+        returns (poi, is_new)
+        """
+        poi, dist = self.nearest(x, y, z)
+        if poi is None:
+            poi = POI(len(self.pois), x, y, z, frame_id, t)
+            self.pois.append(poi)
+            self._add_to_grid(poi)
+            return poi, True
+
+        # the mean might move the poi to a different cell
+        self._remove_from_grid(poi)
+        poi.merge(x, y, z, t)
+        self._add_to_grid(poi)
+        return poi, False
+
+    def add_point_stamped(self, ps, t=None):
+        if t is None:
+            t = ps.header.stamp.to_sec()
+        return self.add(ps.point.x, ps.point.y, ps.point.z, ps.header.frame_id, t)
+
+    def clear(self):
+        self.pois = []
+        self._grid = {}
+
+    def to_list(self):
+        return [poi.to_dict() for poi in self.pois]
+
+    def __str__(self):
+        return "{} POIs, merge radius:{}".format(len(self.pois), self.merge_radius)
@@ -64,6 +64,20 @@ class ReconfigServer(object):
 
 
 
+    @staticmethod
+    def set_defaults(config, bb):
+        """
+        put the same values the server would into the BB, without a server.
+        """
+        bb.set(bb_enums.MIN_ALTITUDE, float(config.MIN_ALTITUDE))
+        bb.set(bb_enums.MAX_DEPTH, float(config.MAX_DEPTH))
+        bb.set(bb_enums.WAYPOINT_TOLERANCE, float(config.WAYPOINT_TOLERANCE))
+        bb.set(bb_enums.SWATH, float(config.SWATH))
+        bb.set(bb_enums.LOCALIZATION_ERROR_GROWTH, float(config.LOCALIZATION_ERROR_GROWTH))
+        bb.set(bb_enums.MISSION_LOG_FOLDER, config.MISSION_LOG_FOLDER)
+        bb.set(bb_enums.ENABLE_MANUAL_MISSION_LOG, config.ENABLE_MANUAL_MISSION_LOG)
+
+
     def reconfig_cb(self, config, level):
         for key in self.ddrc.get_variable_names():
             new_value = config.get(key)
@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Checks the same limits as the safety conditions of the tree, but outside of it.
+Leak, altitude and abort are checked in their subscriber callbacks and depth
+is looked up from TF with a timer, so a violation is acted on right away
+instead of at the next tick, after the data ingestion and log saving.
+
+Acting on it means publishing to the emergency topic, the same thing the
+abort branch of the tree does first. The violation is then kept until the
+next tick takes it and put in the blackboard, where it stays, so the tree goes
+through its own emergency branch too even if the reading was fine again by then.
+The time from getting the reading to having published is sent on a topic.
+
+The limits are given by the tick from the blackboard, the blackboard is not
+touched from the threads in here.
+"""
+
+import time
+import threading
+
+import rospy
+from std_msgs.msg import Empty, Float64
+from smarc_msgs.msg import DVL, Leak
+
+
+class SafetyMonitor(object):
+    def __init__(self, auv_config, max_depth, min_altitude):
+        """
+        auv_config -> for the topics, links and the timer rate
+        max_depth, min_altitude -> initial limits, updated with set_limits
+        """
+        self.auv_config = auv_config
+        self.max_depth = max_depth
+        self.min_altitude = min_altitude
+
+        self._lock = threading.Lock()
+        # (reason, detection time) until the tick takes it
+        self._violation = None
+        # reason -> violated right now, to only publish when one starts
+        self._active = {}
+        self.num_violations = 0
+        # with the envelope check, the tree ignores single dvl dropouts,
+        # so the altitude here has to be low this many times in a row too
+        self._altitude_hysteresis = 1
+        if auv_config.ENABLE_ENVELOPE_CHECK:
+            self._altitude_hysteresis = auv_config.ENVELOPE_HYSTERESIS
+        self._low_altitude_count = 0
+        self.last_latency = None
+
+        self._emergency_pub = rospy.Publisher(auv_config.EMERGENCY_TOPIC, Empty, queue_size=1)
+        self._latency_pub = rospy.Publisher(auv_config.SAFETY_LATENCY_TOPIC, Float64, queue_size=10)
+
+        self._tf_listener = None
+        self._timer = None
+        self._subs = []
+
+    def start(self, tf_listener):
+        """
+        tf_listener -> used for the depth, the one the vehicle uses is fine
+        """
+        self._tf_listener = tf_listener
+        self._subs = [rospy.Subscriber(self.auv_config.LEAK_TOPIC, Leak, self._leak_cb, queue_size=1),
+                      rospy.Subscriber(self.auv_config.DVL_TOPIC, DVL, self._dvl_cb, queue_size=1),
+                      rospy.Subscriber(self.auv_config.ABORT_TOPIC, Empty, self._abort_cb, queue_size=1)]
+        self._timer = rospy.Timer(rospy.Duration(1./self.auv_config.SAFETY_MONITOR_RATE), self._depth_cb)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.shutdown()
+            self._timer = None
+        for sub in self._subs:
+            sub.unregister()
+        self._subs = []
+
+    def set_limits(self, max_depth, min_altitude):
+        self.max_depth = max_depth
+        self.min_altitude = min_altitude
+
+    def take_violation(self):
+        """
+        returns (reason, detection time) of the first violation since the
+        last call, None if there was none
+        """
+        with self._lock:
+            violation = self._violation
+            self._violation = None
+        return violation
+
+    def _check(self, reason, violated, detection_time):
+        with self._lock:
+            started = violated and not self._active.get(reason, False)
+            self._active[reason] = violated
+            if not started:
+                return
+            self.num_violations += 1
+            if self._violation is None:
+                self._violation = (reason, detection_time)
+
+        self._emergency_pub.publish(Empty())
+        latency = time.time() - detection_time
+        self.last_latency = latency
+        self._latency_pub.publish(Float64(latency))
+        rospy.logwarn("Safety monitor: {}, emergency published {:.4f}s after the reading".format(reason, latency))
+
+    def _leak_cb(self, msg):
+        self._check('leak', msg.value == True, time.time())
+
+    def _dvl_cb(self, msg):
+        t = time.time()
+        if self._altitude_hysteresis > 1 and msg.altitude <= 0:
+            # no bottom lock, same as the envelope
+            return
+        if msg.altitude <= self.min_altitude:
+            self._low_altitude_count += 1
+        else:
+            self._low_altitude_count = 0
+        self._check('altitude', self._low_altitude_count >= self._altitude_hysteresis, t)
+
+    def _abort_cb(self, msg):
+        self._check('abort', True, time.time())
+
+    def _depth_cb(self, event):
+        t = time.time()
+        try:
+            posi, ori = self._tf_listener.lookupTransform(self.auv_config.UTM_LINK,
+                                                          self.auv_config.BASE_LINK,
+                                                          rospy.Time(0))
+        except Exception:
+            return
+        self._check('depth', -posi[2] >= self.max_depth, t)
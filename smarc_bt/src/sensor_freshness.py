@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+How fresh the data from each sensor is.
+Every message of a source is recorded with the time it arrived and the stamp
+in its header, if it has one. The last few gaps between arrivals and the
+delays from stamp to arrival are kept for the stats, the age of the latest
+message tells if the source stalled.
+Times are from rospy so that they compare with the stamps in simulation too.
+"""
+
+from collections import deque
+
+import rospy
+
+
+class SourceStats(object):
+    def __init__(self, name, window=50):
+        self.name = name
+        self.count = 0
+        self.last_time = None
+        # seconds between arrivals
+        self.gaps = deque(maxlen=window)
+        # seconds from the header stamp to the arrival
+        self.delays = deque(maxlen=window)
+
+    def record(self, receive_time, stamp=None):
+        """
+        receive_time -> rospy.get_time() when the message came in
+        stamp -> header stamp of the message in seconds, None if there is none
+        """
+        if self.last_time is not None:
+            self.gaps.append(receive_time - self.last_time)
+        # a zero stamp is a message that was never stamped
+        if stamp:
+            self.delays.append(receive_time - stamp)
+        self.last_time = receive_time
+        self.count += 1
+
+    def age(self, now=None):
+        """
+        seconds since the last message, None if there was none
+        """
+        if self.last_time is None:
+            return None
+        if now is None:
+            now = rospy.get_time()
+        return now - self.last_time
+
+    def stats(self, now=None):
+        def mean_max(values):
+            values = list(values)
+            if len(values) == 0:
+                return None, None
+            return round(sum(values)/len(values), 4), round(max(values), 4)
+
+        age = self.age(now)
+        gap_mean, gap_max = mean_max(self.gaps)
+        delay_mean, delay_max = mean_max(self.delays)
+        return {'count': self.count,
+                'age': None if age is None else round(age, 4),
+                'gap_mean': gap_mean,
+                'gap_max': gap_max,
+                'delay_mean': delay_mean,
+                'delay_max': delay_max}
+
+
+class SensorFreshness(object):
+    def __init__(self, window=50):
+        self.window = window
+        self.sources = {}
+
+    def record(self, name, stamp=None):
+        """
+        called from the callback of the source, with the header stamp of the message if it has one
+        """
+        source = self.sources.get(name)
+        if source is None:
+            source = SourceStats(name, self.window)
+            self.sources[name] = source
+        if stamp is not None:
+            stamp = stamp.to_sec()
+        source.record(rospy.get_time(), stamp)
+
+    def age(self, name):
+        source = self.sources.get(name)
+        if source is None:
+            return None
+        return source.age()
+
+    def stale(self, max_ages):
+        """
+        max_ages -> {name:seconds}
+        returns the list of (name, age) of the sources older than their max age,
+        age is None for sources that never sent anything
+        """
+        now = rospy.get_time()
+        stale = []
+        for name, max_age in max_ages.items():
+            source = self.sources.get(name)
+            age = None if source is None else source.age(now)
+            if age is None or age > max_age:
+                stale.append((name, age))
+        return stale
+
+    def stats(self):
+        now = rospy.get_time()
+        # list, a callback might add a source meanwhile
+        return dict((name, source.stats(now)) for name, source in list(self.sources.items()))
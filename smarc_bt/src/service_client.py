@@ -0,0 +1,308 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Service calls that do not block the tick.
+A call is handed to a worker thread of its service and the caller gets a
+ServiceCall back to poll on the next ticks, behaviours return RUNNING until
+it is done. Other slow work, like reading a plan or writing a log, goes to
+a small pool of its own, so a service that hangs can not hold it up.
+
+Every service has its own timeout, after which a call counts as failed even
+if the worker is still stuck in it, and a circuit breaker: after some failures
+in a row the service is not called at all for a while, so a dead or slow node
+does not tie up the workers. Only one call to a service runs at a time, a call
+made while the previous one is still running is rejected, so a service that
+never answers holds a single thread. Latencies and failures are counted per service.
+"""
+
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+
+import rospy
+
+NUM_WORKERS = 4
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# service name -> ServiceClient, for the stats
+CLIENTS = {}
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(NUM_WORKERS)
+    return _pool
+
+
+class AsyncJob(object):
+    """
+    fn(*args, **kwargs) running in the given pool
+    """
+    def __init__(self, pool, fn, args, kwargs):
+        self.start_time = time.time()
+        self.end_time = None
+        self._result = pool.apply_async(self._run, (fn, args, kwargs))
+
+    def _run(self, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.end_time = time.time()
+
+    def done(self):
+        return self._result.ready()
+
+    def get(self):
+        """
+        the return value of fn, raises what fn raised.
+        only call when done()
+        """
+        return self._result.get(0)
+
+    @property
+    def elapsed(self):
+        """
+        how long fn took, or has been running so far
+        """
+        if self.end_time is None:
+            return time.time() - self.start_time
+        return self.end_time - self.start_time
+
+
+def run_async(fn, *args, **kwargs):
+    return AsyncJob(get_pool(), fn, args, kwargs)
+
+
+class ServiceCall(object):
+    PENDING = 'pending'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    TIMED_OUT = 'timed_out'
+    REJECTED = 'rejected'
+
+    def __init__(self, client, job=None, reason=None):
+        """
+        job -> the running call, None if it was not made because of reason
+        """
+        self.client = client
+        self.job = job
+        self.result = None
+        self.error = None
+        if job is None:
+            self.state = ServiceCall.REJECTED
+            self.error = reason
+        else:
+            self.state = ServiceCall.PENDING
+
+    def poll(self):
+        """
+        returns the state, the result or error are set once it is not PENDING
+        """
+        if self.state != ServiceCall.PENDING:
+            return self.state
+
+        if self.job.done():
+            try:
+                self.result = self.job.get()
+                self.state = ServiceCall.SUCCEEDED
+            except Exception as e:
+                self.error = str(e)
+                self.state = ServiceCall.FAILED
+            self.client._record(self.state, self.job.elapsed)
+        elif self.job.elapsed > self.client.timeout:
+            self.error = "Timed out after {}s".format(self.client.timeout)
+            self.state = ServiceCall.TIMED_OUT
+            self.client._record(self.state, self.job.elapsed)
+
+        return self.state
+
+    def done(self):
+        return self.poll() != ServiceCall.PENDING
+
+
+class ServiceClient(object):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self,
+                 service_name,
+                 service_type,
+                 timeout = 2.,
+                 max_failures = 3,
+                 open_period = 10.,
+                 persistent = False):
+        """
+        timeout -> seconds, a call that takes longer counts as failed
+        max_failures -> this many failures in a row opens the circuit
+        open_period -> seconds the circuit stays open before one call is tried again
+        persistent -> keep the connection to the service open between calls
+        """
+        self.service_name = service_name
+        self.service_type = service_type
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.open_period = open_period
+        self.persistent = persistent
+
+        self._proxy = None
+        self._lock = threading.Lock()
+        # the calls are made in here, one at a time, which a persistent
+        # connection needs anyway
+        self._pool = None
+        self._in_flight = False
+
+        self.circuit = ServiceClient.CLOSED
+        self._opened_time = None
+        self._trial_pending = False
+        self.consecutive_failures = 0
+
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.last_latency = None
+        self.max_latency = 0.
+        self._total_latency = 0.
+
+        CLIENTS[service_name] = self
+
+    def _get_proxy(self):
+        with self._lock:
+            if self._proxy is None:
+                self._proxy = rospy.ServiceProxy(self.service_name,
+                                                 self.service_type,
+                                                 persistent = self.persistent)
+            return self._proxy
+
+    def _do_call(self, *args, **kwargs):
+        try:
+            return self._get_proxy()(*args, **kwargs)
+        except Exception:
+            # a persistent proxy is dead after its connection is
+            with self._lock:
+                self._proxy = None
+            raise
+        finally:
+            with self._lock:
+                self._in_flight = False
+
+    def _allow(self):
+        """
+        marks a call as running and returns None if it can be made,
+        the reason it can not otherwise
+        """
+        with self._lock:
+            reason = None
+            if self._in_flight:
+                # a call that timed out might still be stuck in there
+                reason = "Previous call to {} is still running".format(self.service_name)
+            elif self.circuit == ServiceClient.OPEN and time.time() - self._opened_time > self.open_period:
+                self.circuit = ServiceClient.HALF_OPEN
+
+            if reason is None and self.circuit != ServiceClient.CLOSED:
+                # only one call to see if the service is back
+                if self.circuit == ServiceClient.HALF_OPEN and not self._trial_pending:
+                    self._trial_pending = True
+                else:
+                    reason = "Circuit open for {}".format(self.service_name)
+
+            if reason is not None:
+                self.rejected += 1
+                return reason
+            self._in_flight = True
+            if self._pool is None:
+                self._pool = ThreadPool(1)
+            return None
+
+    def _record(self, state, latency):
+        with self._lock:
+            self.calls += 1
+            self._trial_pending = False
+            if state == ServiceCall.SUCCEEDED:
+                self.successes += 1
+                self.consecutive_failures = 0
+                self.circuit = ServiceClient.CLOSED
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+                self._total_latency += latency
+                return
+
+            self.failures += 1
+            if state == ServiceCall.TIMED_OUT:
+                self.timeouts += 1
+            self.consecutive_failures += 1
+            if self.circuit == ServiceClient.HALF_OPEN or self.consecutive_failures >= self.max_failures:
+                if self.circuit != ServiceClient.OPEN:
+                    rospy.logwarn("Service {} failed {} times in a row, not calling it for {}s".format(self.service_name,
+                                                                                                    self.consecutive_failures,
+                                                                                                    self.open_period))
+                self.circuit = ServiceClient.OPEN
+                self._opened_time = time.time()
+
+    def call_async(self, *args, **kwargs):
+        """
+        returns a ServiceCall to poll, REJECTED right away if the circuit is open
+        or the previous call is still running
+        """
+        reason = self._allow()
+        if reason is not None:
+            return ServiceCall(self, reason=reason)
+        return ServiceCall(self, AsyncJob(self._pool, self._do_call, args, kwargs))
+
+    def call(self, *args, **kwargs):
+        """
+        blocking call through the circuit breaker, for threads other than the tick.
+        waits at most the timeout, even if the service never answers.
+        raises rospy.ServiceException if the call was not made or timed out,
+        what the service call raised if it failed
+        """
+        service_call = self.call_async(*args, **kwargs)
+        while not service_call.done():
+            time.sleep(0.005)
+
+        if service_call.state == ServiceCall.SUCCEEDED:
+            return service_call.result
+        if service_call.state == ServiceCall.FAILED:
+            # raises it again
+            service_call.job.get()
+        raise rospy.ServiceException(service_call.error)
+
+    @property
+    def mean_latency(self):
+        if self.successes == 0:
+            return None
+        return self._total_latency / self.successes
+
+    def stats(self):
+        return {'circuit': self.circuit,
+                'calls': self.calls,
+                'successes': self.successes,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'last_latency': self.last_latency,
+                'mean_latency': self.mean_latency,
+                'max_latency': self.max_latency}
+
+
+def get_client(service_name, service_type, **kwargs):
+    """
+    the ServiceClient of the service, made with kwargs if there is none yet.
+    everyone calling a service shares its circuit and stats
+    """
+    client = CLIENTS.get(service_name)
+    if client is None:
+        client = ServiceClient(service_name, service_type, **kwargs)
+    return client
+
+
+def all_stats():
+    return dict((name, client.stats()) for name, client in CLIENTS.items())
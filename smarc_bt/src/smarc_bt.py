@@ -3,7 +3,7 @@
 # vim:fenc=utf-8
 # Ozer Ozkahraman (ozero@kth.se)
 
-import os, time
+import os, time, json
 
 import rospy
 
@@ -21,10 +21,12 @@ if not hasattr(rospy, 'logerr_throttle_identical'):  setattr(rospy, 'logerr_thro
 from py_trees.composites import Selector as Fallback
 
 # messages
-from std_msgs.msg import Float64, Empty, Bool
+from std_msgs.msg import Float64, Empty, Bool, String
 from smarc_msgs.msg import Leak, DVL
+from smarc_msgs.srv import LatLonToUTM
 from sensor_msgs.msg import NavSatFix
 from geometry_msgs.msg import PointStamped, PoseStamped
+from nav_msgs.msg import OccupancyGrid
 from geographic_msgs.msg import GeoPoint
 
 from auv_config import AUVConfig
@@ -37,10 +39,14 @@ from bt_conditions import C_DepthOK, \
                           C_NoAbortReceived, \
                           C_AltOK, \
                           C_LeakOK, \
+                          C_SafetyMonitorOK, \
+                          C_EnvelopeOK, \
+                          C_SensorsFresh, \
                           C_StartPlanReceived, \
                           C_HaveCoarseMission, \
                           C_PlanIsNotChanged, \
                           C_NoNewPOIDetected, \
+                          C_EnoughBattery, \
                           C_AutonomyDisabled, \
                           C_LeaderFollowerEnabled, \
                           C_LeaderExists, \
@@ -50,14 +56,16 @@ from bt_conditions import C_DepthOK, \
 
 from bt_common import Sequence, \
                       CheckBlackboardVariableValue, \
-                      ReadTopic, \
+                      ReadTopics, \
                       A_RunOnce, \
                       A_SimplePublisher, \
                       Counter, \
                       Not
 
 from bt_actions import A_GotoWaypoint, \
+                       A_FollowPath, \
                        A_SetNextPlanAction, \
+                       A_AvoidPredictedViolation, \
                        A_PublishMissionPlan, \
                        A_FollowLeader, \
                        A_SetDVLRunning, \
@@ -65,6 +73,7 @@ from bt_actions import A_GotoWaypoint, \
                        A_UpdateMissionLog, \
                        A_SaveMissionLog, \
                        A_ManualMissionLog, \
+                       A_FillCoverageGaps, \
                        A_PublishFinalize, \
                        A_ReadLolo, \
                        A_ReadWaypoint
@@ -79,8 +88,18 @@ import common_globals
 # packed up object to keep vehicle-state up to date
 # to avoid having a million subscibers inside the tree
 from vehicle import Vehicle
+from mission_progress import MissionProgress
+from endurance import EnduranceModel
+from coverage_map import CoverageMap
+from drift_estimator import DriftEstimator
+from checkpoint import CheckpointStore
+from mission_plan import MissionPlan, Waypoint
+from mission_log import MissionLog
 from neptus_handler import NeptusHandler
 from nodered_handler import NoderedHandler
+import service_client
+from safety_monitor import SafetyMonitor
+from envelope import EnvelopeChecker
 
 def const_tree(auv_config):
     """
@@ -116,13 +135,25 @@ def const_tree(auv_config):
          # blackboard_variables,
          # max_period = None,
          # allow_silence = True -> If false, will fail if no message is received ever
-
-
-        read_detection = ReadTopic(
-            name = "A_ReadCameraDetection",
-            topic_name = auv_config.CAMERA_DETECTION_TOPIC,
-            topic_type = PointStamped,
-            blackboard_variables = {bb_enums.POI_POINT_STAMPED:None} # read the entire message into the bb
+         # ReadTopics takes a list of these without the name and reads them all
+
+
+        read_topics = ReadTopics(
+            name = "A_ReadTopics",
+            topics = [
+                dict(topic_name = auv_config.CAMERA_DETECTION_TOPIC,
+                     topic_type = PointStamped,
+                     blackboard_variables = {bb_enums.POI_POINT_STAMPED:None}), # read the entire message into the bb
+                dict(topic_name = auv_config.LIVE_WP_ENABLE_TOPIC,
+                     topic_type = Bool,
+                     blackboard_variables = {bb_enums.LIVE_WP_ENABLE : 'data'}),
+                dict(topic_name = auv_config.GUI_WP_ENABLE_TOPIC,
+                     topic_type = Bool,
+                     blackboard_variables = {bb_enums.GUI_WP_ENABLE : 'data'}),
+                dict(topic_name = auv_config.ALGAE_FOLLOW_ENABLE_TOPIC,
+                     topic_type = Bool,
+                     blackboard_variables = {bb_enums.ALGAE_FOLLOW_ENABLE : 'data'})
+            ]
         )
 
 
@@ -130,31 +161,10 @@ def const_tree(auv_config):
             topic_name=auv_config.BUOY_TOPIC,
             buoy_link=auv_config.LOCAL_LINK,
             utm_link=auv_config.UTM_LINK,
-            latlon_utm_serv=auv_config.LATLONTOUTM_SERVICE
+            latlon_utm_serv=auv_config.LATLONTOUTM_SERVICE,
+            min_line_separation=auv_config.BUOY_MIN_LINE_SEPARATION
         )
 
-        read_reloc_enable = ReadTopic(
-            name = "A_ReadLiveWPEnable",
-            topic_name = auv_config.LIVE_WP_ENABLE_TOPIC,
-            topic_type = Bool,
-            blackboard_variables={bb_enums.LIVE_WP_ENABLE : 'data'}
-        )
-
-        read_gui_enable = ReadTopic(
-            name = "A_ReadGUIEnable",
-            topic_name = auv_config.GUI_WP_ENABLE_TOPIC,
-            topic_type = Bool,
-            blackboard_variables={bb_enums.GUI_WP_ENABLE : 'data'}
-        )
-
-        read_algae_follow_enable = ReadTopic(
-            name = "A_ReadAlgaeEnable",
-            topic_name = auv_config.ALGAE_FOLLOW_ENABLE_TOPIC,
-            topic_type = Bool,
-            blackboard_variables={bb_enums.ALGAE_FOLLOW_ENABLE: 'data'}
-        )
-
-
         read_reloc_wp = A_ReadWaypoint(
             ps_topic = auv_config.LIVE_WP,
             bb_key = bb_enums.LIVE_WP,
@@ -193,15 +203,12 @@ def const_tree(auv_config):
                         blackbox_level=1,
                         children=[
                             read_abort,
-                            read_detection,
+                            read_topics,
                             read_buoys,
                             read_lolo,
                             publish_heartbeat,
-                            read_reloc_enable,
                             read_reloc_wp,
-                            read_gui_enable,
                             read_gui_wp,
-                            read_algae_follow_enable,
                             read_algae_follow_wp
                         ])
 
@@ -233,15 +240,29 @@ def const_tree(auv_config):
         depthOK = C_DepthOK()
         leakOK = C_LeakOK()
         # more safety checks will go here
+        if auv_config.ENABLE_ENVELOPE_CHECK:
+            # the envelope checks the altitude with hysteresis and predicts
+            # both, the instant altitude would surface on a single dvl dropout
+            checks = [no_abort,
+                      depthOK,
+                      C_EnvelopeOK(),
+                      leakOK]
+        else:
+            checks = [no_abort,
+                      altOK,
+                      depthOK,
+                      leakOK]
+        if auv_config.ENABLE_SAFETY_MONITOR:
+            checks.append(C_SafetyMonitorOK())
+        if auv_config.ENABLE_SENSOR_WATCHDOG:
+            max_ages = {'tf': auv_config.SENSOR_MAX_AGE_TF,
+                        'dvl': auv_config.SENSOR_MAX_AGE_DVL,
+                        'leak': auv_config.SENSOR_MAX_AGE_LEAK}
+            checks.append(C_SensorsFresh(dict((k,v) for k,v in max_ages.items() if v > 0)))
 
         safety_checks = Sequence(name="SQ-SafetyChecks",
                         blackbox_level=1,
-                        children=[
-                                  no_abort,
-                                  altOK,
-                                  depthOK,
-                                  leakOK
-                        ])
+                        children=checks)
 
 
         skip_wp = Sequence(name='SQ-CountEmergenciesAndSkip',
@@ -291,7 +312,11 @@ def const_tree(auv_config):
 
     def const_execute_mission_tree():
         # GOTO
-        goto_action = A_GotoWaypoint(auv_config = auv_config)
+        if auv_config.ENABLE_PATH_FOLLOWING:
+            goto_action = A_FollowPath(auv_config = auv_config)
+        else:
+            goto_action = A_GotoWaypoint(auv_config = auv_config,
+                                         pipelined = auv_config.PIPELINE_GOTO_WAYPOINTS)
         mission_wp_is_goto = C_CheckWaypointType(expected_wp_type = imc_enums.MANEUVER_GOTO)
         goto_maneuver = Sequence(name="SQ-GotoWaypoint",
                                  children=[
@@ -326,14 +351,18 @@ def const_tree(auv_config):
 
 
         # and then execute them in order
+        follow_plan_children = [C_HaveCoarseMission(),
+                                C_StartPlanReceived(),
+                                C_EnoughBattery(enforce=auv_config.ENABLE_BATTERY_CHECK),
+                                unfinalize]
+        # a limit that is about to be crossed skips the waypoint,
+        # the safety tree only reacts once it is crossed
+        if auv_config.ENABLE_ENVELOPE_CHECK:
+            follow_plan_children.append(A_AvoidPredictedViolation())
+        follow_plan_children += [execute_maneuver,
+                                 A_SetNextPlanAction()]
         follow_plan = Sequence(name="SQ-FollowMissionPlan",
-                               children=[
-                                         C_HaveCoarseMission(),
-                                         C_StartPlanReceived(),
-                                         unfinalize,
-                                         execute_maneuver,
-                                         A_SetNextPlanAction()
-                               ])
+                               children=follow_plan_children)
 
         # LIVE WP
         live_wp_enabled = CheckBlackboardVariableValue(bb_enums.LIVE_WP_ENABLE,
@@ -419,16 +448,22 @@ def const_tree(auv_config):
 
 
 
+        children = [C_HaveCoarseMission(),
+                    C_PlanIsNotChanged(),
+                    C_StartPlanReceived(),
+                    A_UpdateMissionLog()]
+
+        # gaps are added to the plan before it is seen as complete
+        if auv_config.ENABLE_GAP_FILLING:
+            children.append(A_FillCoverageGaps(utm_to_lat_lon_service_name = auv_config.UTM_TO_LATLON_SERVICE,
+                                               max_rounds = auv_config.GAP_FILLING_MAX_ROUNDS))
+
+        children += [plan_complete_or_stopped,
+                     publish_complete,
+                     A_SaveMissionLog()]
+
         return Sequence(name="SQ-FinalizeMission",
-                        children=[
-                                  C_HaveCoarseMission(),
-                                  C_PlanIsNotChanged(),
-                                  C_StartPlanReceived(),
-                                  A_UpdateMissionLog(),
-                                  plan_complete_or_stopped,
-                                  publish_complete,
-                                  A_SaveMissionLog()
-                        ])
+                        children=children)
 
     # The root of the tree is here
 
@@ -464,6 +499,250 @@ def const_tree(auv_config):
     return ptr.trees.BehaviourTree(root,record_rosbag=False)
 
 
+class BTRunner(object):
+    def __init__(self, config, vehicle, bb, tree_file_path='last_ran_tree.txt'):
+        """
+        The tree of one vehicle and everything that is ticked along with it.
+        The node, the tf listener and the reconfig server are not in here
+        so that a process can run more than one of these.
+        """
+        self.config = config
+        self.vehicle = vehicle
+        self.bb = bb
+        bb.set(bb_enums.VEHICLE_STATE, vehicle)
+
+        # progress and ETA of the current plan, for the handlers to report
+        self.mission_progress = MissionProgress()
+        bb.set(bb_enums.MISSION_PROGRESS, self.mission_progress)
+
+        # swath coverage of the plan, gaps are published for the operators to see
+        self.coverage_map = CoverageMap(resolution = config.COVERAGE_MAP_RESOLUTION,
+                                        min_gap_area = config.COVERAGE_MAP_MIN_GAP_AREA)
+        bb.set(bb_enums.COVERAGE_MAP, self.coverage_map)
+        self.coverage_map_pub = rospy.Publisher(config.COVERAGE_MAP_TOPIC, OccupancyGrid, queue_size=1, latch=True)
+        self.last_coverage_map_pub_time = 0
+
+        # dead reckoning error growth, measured at every surfacing
+        self.drift_estimator = DriftEstimator()
+        bb.set(bb_enums.DRIFT_ESTIMATOR, self.drift_estimator)
+        self.latlon_to_utm_client = service_client.get_client(config.LATLONTOUTM_SERVICE, LatLonToUTM, persistent=True)
+        # the conversion of the latest gps fix and the (lat,lon) it is for
+        self.gps_call = None
+        self.gps_call_latlon = None
+
+        # how the services and sensors are doing, not every tick
+        self.service_stats_pub = rospy.Publisher(config.SERVICE_STATS_TOPIC, String, queue_size=1)
+        self.last_service_stats_pub_time = 0
+        self.sensor_diagnostics_pub = rospy.Publisher(config.SENSOR_DIAGNOSTICS_TOPIC, String, queue_size=1)
+
+        # depth and altitude limits, predicted from the recent readings
+        self.envelope_checker = None
+        if config.ENABLE_ENVELOPE_CHECK:
+            self.envelope_checker = EnvelopeChecker(window = config.ENVELOPE_WINDOW,
+                                                    horizon = config.ENVELOPE_HORIZON,
+                                                    hysteresis = config.ENVELOPE_HYSTERESIS,
+                                                    dropout_depth = config.DVL_RUNNING_DEPTH)
+        bb.set(bb_enums.ENVELOPE_CHECKER, self.envelope_checker)
+
+        # the safety limits checked as the readings come in, between the ticks
+        self.safety_monitor = None
+        bb.set(bb_enums.SAFETY_VIOLATION, None)
+        if config.ENABLE_SAFETY_MONITOR:
+            self.safety_monitor = SafetyMonitor(config,
+                                                max_depth = bb.get(bb_enums.MAX_DEPTH),
+                                                min_altitude = bb.get(bb_enums.MIN_ALTITUDE))
+
+        # progress of the plan on disk, to continue after a restart
+        self.checkpoint_store = None
+        if config.ENABLE_MISSION_CHECKPOINT:
+            self.checkpoint_store = CheckpointStore(os.path.join(config.MISSION_LOG_FOLDER, 'checkpoints'))
+
+        # energy use learned from the previous missions, in the background
+        # and put in the bb by the tick when it is done
+        bb.set(bb_enums.ENDURANCE_MODEL, None)
+        self.endurance_job = service_client.run_async(self.learn_endurance, config)
+
+        # construct the neptus handler that handles talking to neptus
+        # since the BT doesnt really care about the stuff from neptus beyond
+        # signals, it doesnt need these as actions and such
+        self.neptus_handler = NeptusHandler(config, vehicle, bb)
+        self.nodered_handler = NoderedHandler(config, vehicle, bb)
+
+        # construct the BT with the config and a vehicle model
+        rospy.loginfo("Constructing tree")
+        self.tree = const_tree(config)
+        rospy.loginfo("Setting up tree")
+        setup_ok = False
+        # make sure the BT is happy
+        while not setup_ok:
+            setup_ok = self.tree.setup(timeout=common_globals.SETUP_TIMEOUT)
+            if not setup_ok:
+                rospy.logerr("Tree could not be setup! Retrying in 5s!")
+                time.sleep(5)
+
+
+        # write the structure of the tree to file, useful for post-mortem inspections
+        # if needed
+        # this will put it in the ~/.ros folder if run from launch file
+        last_ran_tree_path = tree_file_path
+        bt_viz = pt.display.ascii_tree(self.tree.root)
+        with open(last_ran_tree_path, 'w+') as f:
+            f.write(bt_viz)
+            rospy.loginfo("Wrote the tree to {}".format(last_ran_tree_path))
+
+
+        # print out the config and the BT on screen
+        rospy.loginfo(config)
+        rospy.loginfo(bt_viz)
+
+
+    def learn_endurance(self, config):
+        endurance_model = EnduranceModel(battery_capacity_wh = config.BATTERY_CAPACITY_WH,
+                                         default_wh_per_meter = config.DEFAULT_WH_PER_METER,
+                                         reserve_percent = config.BATTERY_RESERVE_PERCENT)
+        endurance_model.learn_from_folder(config.MISSION_LOG_FOLDER, config.ENDURANCE_MAX_LOGS)
+        return endurance_model
+
+
+    def gps_to_utm(self, lat, lon):
+        """
+        the utm of a gps fix, None while the service is still converting it.
+        the call is made in the background and polled on the next ticks
+        """
+        if self.gps_call is None or self.gps_call_latlon != (lat, lon):
+            self.gps_call_latlon = (lat, lon)
+            self.gps_call = self.latlon_to_utm_client.call_async(GeoPoint(latitude=lat, longitude=lon, altitude=0))
+
+        state = self.gps_call.poll()
+        if state == service_client.ServiceCall.PENDING:
+            return None
+        if state != service_client.ServiceCall.SUCCEEDED:
+            # asked again on the next tick, the circuit of the client limits how often
+            self.gps_call = None
+            return None
+
+        res = self.gps_call.result
+        return (res.utm_point.x, res.utm_point.y)
+
+
+    def tick(self, tf_listener):
+        # some info _about the tree_ in the BB.
+        # better do this outside the tree
+        tip = self.tree.tip()
+        if tip is None:
+            self.bb.set(bb_enums.TREE_TIP_NAME, '')
+            self.bb.set(bb_enums.TREE_TIP_STATUS, 'Status.X')
+        else:
+            self.bb.set(bb_enums.TREE_TIP_NAME, tip.name)
+            self.bb.set(bb_enums.TREE_TIP_STATUS, str(tip.status))
+
+        if self.endurance_job is not None and self.endurance_job.done():
+            try:
+                endurance_model = self.endurance_job.get()
+                rospy.loginfo(str(endurance_model))
+                self.bb.set(bb_enums.ENDURANCE_MODEL, endurance_model)
+            except Exception as e:
+                rospy.logwarn("Could not learn the endurance model: {}".format(e))
+            self.endurance_job = None
+
+        # update the TF of the vehicle first
+        # print(self.vehicle)
+        self.vehicle.tick(tf_listener)
+        self.mission_progress.tick(self.vehicle, self.bb.get(bb_enums.MISSION_PLAN_OBJ))
+        self.coverage_map.tick(self.vehicle, self.bb.get(bb_enums.MISSION_PLAN_OBJ), self.bb.get(bb_enums.SWATH))
+        if self.drift_estimator.tick(self.vehicle, self.gps_to_utm):
+            rospy.loginfo(str(self.drift_estimator))
+            if self.config.ENABLE_ERROR_GROWTH_ESTIMATION and \
+               self.drift_estimator.num_samples >= self.config.ERROR_GROWTH_MIN_SAMPLES:
+                self.bb.set(bb_enums.LOCALIZATION_ERROR_GROWTH, self.drift_estimator.error_growth)
+        # the grid can be large, only send it when it changed and not too often
+        if self.coverage_map.last_change_time > self.last_coverage_map_pub_time and \
+           time.time() - self.last_coverage_map_pub_time > 1:
+            grid = self.coverage_map.to_occupancy_grid(self.config.UTM_LINK)
+            if grid is not None:
+                self.coverage_map_pub.publish(grid)
+            self.last_coverage_map_pub_time = time.time()
+        # the ages of the sensors are not much use if they are not sent often
+        self.sensor_diagnostics_pub.publish(String(data=json.dumps(self.vehicle.freshness.stats())))
+        if time.time() - self.last_service_stats_pub_time > 5:
+            self.service_stats_pub.publish(String(data=json.dumps(service_client.all_stats())))
+            self.last_service_stats_pub_time = time.time()
+        # print(self.neptus_handler)
+        self.neptus_handler.tick()
+        self.nodered_handler.tick()
+        if self.envelope_checker is not None:
+            self.envelope_checker.tick(self.vehicle,
+                                       self.bb.get(bb_enums.MAX_DEPTH),
+                                       self.bb.get(bb_enums.MIN_ALTITUDE))
+        if self.safety_monitor is not None:
+            # reconfig might have changed these
+            self.safety_monitor.set_limits(self.bb.get(bb_enums.MAX_DEPTH),
+                                           self.bb.get(bb_enums.MIN_ALTITUDE))
+            # kept in the bb, not cleared on the next tick
+            violation = self.safety_monitor.take_violation()
+            if violation is not None and self.bb.get(bb_enums.SAFETY_VIOLATION) is None:
+                self.bb.set(bb_enums.SAFETY_VIOLATION, violation)
+                rospy.logwarn("Tree got the safety violation '{}' {:.3f}s after it was caught".format(violation[0],
+                                                                                                     time.time() - violation[1]))
+        # an actual tick, finally.
+        self.tree.tick()
+
+        # after the tick, so that a waypoint that was just reached is in it
+        if self.checkpoint_store is not None:
+            self.checkpoint_store.tick(self.bb.get(bb_enums.MISSION_PLAN_OBJ),
+                                       self.bb.get(bb_enums.MISSION_LOG_OBJ))
+
+
+    def resume_from_checkpoint(self):
+        """
+        put the plan of the last checkpoint back in the bb at the same waypoint,
+        with its log continuing from where it was.
+        returns True if a plan was resumed
+        """
+        if self.checkpoint_store is None:
+            return False
+
+        loaded = self.checkpoint_store.load()
+        if loaded is None:
+            return False
+        checkpoint, waypoint_dicts = loaded
+
+        waypoints = []
+        for d in waypoint_dicts:
+            wp = Waypoint()
+            wp.read_dict(d)
+            waypoints.append(wp)
+
+        mplan = MissionPlan(auv_config = self.config,
+                            plan_id = checkpoint['plan_id'],
+                            coverage_swath = self.bb.get(bb_enums.SWATH),
+                            vehicle_localization_error_growth = self.bb.get(bb_enums.LOCALIZATION_ERROR_GROWTH),
+                            waypoints = waypoints)
+        # same creation time -> same log file and the log action keeps using the log below
+        mplan.creation_time = checkpoint['creation_time']
+        mplan.current_wp_index = checkpoint['current_wp_index']
+        mplan.plan_is_go = checkpoint['plan_is_go'] and self.config.CHECKPOINT_RESUME_GO
+
+        if checkpoint['log_path'] is not None:
+            log = MissionLog(mission_plan = mplan,
+                             robot_name = self.config.robot_name,
+                             save_location = self.bb.get(bb_enums.MISSION_LOG_FOLDER))
+            if log.load_saved(checkpoint['log_length']):
+                self.bb.set(bb_enums.MISSION_LOG_OBJ, log)
+
+        self.bb.set(bb_enums.MISSION_PLAN_OBJ, mplan)
+
+        s = "Resumed plan {} at waypoint {}/{} from checkpoint of {}".format(mplan.plan_id,
+                                                                            mplan.current_wp_index,
+                                                                            len(mplan.waypoints),
+                                                                            time.ctime(checkpoint['time']))
+        if checkpoint['plan_is_go'] and not mplan.plan_is_go:
+            s += ", waiting for a start to continue"
+        rospy.logwarn(s)
+        return True
+
+
+
 def main():
     # create a config object that will handle all the rosparams and such
     # and then auto-generate the launch file from it
@@ -504,64 +783,17 @@ def main():
 
     # put the vehicle model inside the bb
     bb = pt.blackboard.Blackboard()
-    bb.set(bb_enums.VEHICLE_STATE, vehicle)
-
-    # construct the neptus handler that handles talking to neptus
-    # since the BT doesnt really care about the stuff from neptus beyond
-    # signals, it doesnt need these as actions and such
-    neptus_handler = NeptusHandler(config, vehicle, bb)
-    nodered_handler = NoderedHandler(config, vehicle, bb)
-
-    # construct the BT with the config and a vehicle model
-    rospy.loginfo("Constructing tree")
-    tree = const_tree(config)
-    rospy.loginfo("Setting up tree")
-    setup_ok = False
-    # make sure the BT is happy
-    while not setup_ok:
-        setup_ok = tree.setup(timeout=common_globals.SETUP_TIMEOUT)
-        if not setup_ok:
-            rospy.logerr("Tree could not be setup! Retrying in 5s!")
-            sleep(5)
-
-
-    # write the structure of the tree to file, useful for post-mortem inspections
-    # if needed
-    # this will put it in the ~/.ros folder if run from launch file
-    last_ran_tree_path = 'last_ran_tree.txt'
-    bt_viz = pt.display.ascii_tree(tree.root)
-    with open(last_ran_tree_path, 'w+') as f:
-        f.write(bt_viz)
-        rospy.loginfo("Wrote the tree to {}".format(last_ran_tree_path))
-
-
-    # print out the config and the BT on screen
-    rospy.loginfo(config)
-    rospy.loginfo(bt_viz)
+    runner = BTRunner(config, vehicle, bb)
+    runner.resume_from_checkpoint()
+    if runner.safety_monitor is not None:
+        runner.safety_monitor.start(tf_listener)
 
     # setup the ticking freq and the BlackBoard
     rate = rospy.Rate(common_globals.BT_TICK_RATE)
 
     rospy.loginfo("Ticktocking....")
     while not rospy.is_shutdown():
-        # some info _about the tree_ in the BB.
-        # better do this outside the tree
-        tip = tree.tip()
-        if tip is None:
-            bb.set(bb_enums.TREE_TIP_NAME, '')
-            bb.set(bb_enums.TREE_TIP_STATUS, 'Status.X')
-        else:
-            bb.set(bb_enums.TREE_TIP_NAME, tip.name)
-            bb.set(bb_enums.TREE_TIP_STATUS, str(tip.status))
-
-        # update the TF of the vehicle first
-        # print(vehicle)
-        vehicle.tick(tf_listener)
-        # print(neptus_handler)
-        neptus_handler.tick()
-        nodered_handler.tick()
-        # an actual tick, finally.
-        tree.tick()
+        runner.tick(tf_listener)
 
         # use py-trees-tree-watcher if you can
         #  pt.display.print_ascii_tree(tree.root, show_status=True)
@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+Rate limiting and change detection for messages that go out over
+slow links (IMC bridge to neptus over acoustic/radio etc.)
+"""
+
+import time
+from collections import deque
+from io import BytesIO
+
+
+class TelemetryChannel(object):
+    """
+    Book-keeping for one type of message.
+
+    min_period -> never send more often than this, seconds
+    heartbeat_period -> send at least this often even if nothing changed, seconds
+    """
+    def __init__(self,
+                 name,
+                 min_period,
+                 heartbeat_period,
+                 bandwidth_window = 10.):
+        self.name = name
+        self.min_period = min_period
+        self.heartbeat_period = max(heartbeat_period, min_period)
+        self.bandwidth_window = bandwidth_window
+
+        self.last_sent_time = None
+        self.last_key = None
+
+        self.sent_count = 0
+        self.skipped_count = 0
+        self.sent_bytes = 0
+        # (time, num bytes) of recently sent messages
+        self._window = deque()
+
+    def should_send(self, key, now):
+        if self.last_sent_time is None:
+            return True
+
+        elapsed = now - self.last_sent_time
+        if elapsed < self.min_period:
+            return False
+
+        if key != self.last_key:
+            return True
+
+        return elapsed >= self.heartbeat_period
+
+    def record(self, key, num_bytes, now):
+        self.last_sent_time = now
+        self.last_key = key
+        self.sent_count += 1
+        self.sent_bytes += num_bytes
+        self._window.append((now, num_bytes))
+        self._trim(now)
+
+    def _trim(self, now):
+        while len(self._window) > 0 and now - self._window[0][0] > self.bandwidth_window:
+            self._window.popleft()
+
+    def bandwidth(self, now=None):
+        """
+        bytes per second over the last bandwidth_window seconds
+        """
+        if now is None:
+            now = time.time()
+        self._trim(now)
+        return sum(b for t,b in self._window) / float(self.bandwidth_window)
+
+    def __str__(self):
+        return "{}: {:.1f}B/s sent:{} skipped:{} total:{}B".format(self.name,
+                                                                   self.bandwidth(),
+                                                                   self.sent_count,
+                                                                   self.skipped_count,
+                                                                   self.sent_bytes)
+
+
+class TelemetryScheduler(object):
+    """
+    Decides if a message should be published right now or not.
+    A message is sent if it changed since the last time it was sent and
+    it has been at least min_period since then, or if heartbeat_period passed
+    without sending anything.
+
+    The change is detected by comparing a 'key' given with the message,
+    so the caller decides what counts as a change (rounding etc.)
+    """
+    def __init__(self):
+        self._channels = {}
+
+    def add_channel(self, name, min_period, heartbeat_period):
+        channel = TelemetryChannel(name, min_period, heartbeat_period)
+        self._channels[name] = channel
+        return channel
+
+    def publish(self, name, publisher, msg, key, force=False):
+        """
+        publish msg with the publisher if the channel allows it.
+        returns True if published.
+        """
+        channel = self._channels[name]
+        now = time.time()
+        if not force and not channel.should_send(key, now):
+            channel.skipped_count += 1
+            return False
+
+        publisher.publish(msg)
+        channel.record(key, TelemetryScheduler.message_size(msg), now)
+        return True
+
+    @staticmethod
+    def message_size(msg):
+        buff = BytesIO()
+        try:
+            msg.serialize(buff)
+        except Exception:
+            return 0
+        return len(buff.getvalue())
+
+    def total_bandwidth(self):
+        now = time.time()
+        return sum(c.bandwidth(now) for c in self._channels.values())
+
+    def __str__(self):
+        s = "Telemetry {:.1f}B/s total".format(self.total_bandwidth())
+        for name in sorted(self._channels.keys()):
+            s += "\n\t" + str(self._channels[name])
+        return s
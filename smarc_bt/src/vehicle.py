@@ -4,12 +4,15 @@
 # Ozer Ozkahraman (ozero@kth.se)
 
 import time
+from collections import deque
 
 import rospy, tf
 from geometry_msgs.msg import PointStamped
 from geographic_msgs.msg import GeoPoint
 from smarc_msgs.msg import DVL, Leak, GotoWaypoint
-from sensor_msgs.msg import NavSatFix
+from sensor_msgs.msg import NavSatFix, BatteryState
+
+from sensor_freshness import SensorFreshness
 
 
 class StringAnimation(object):
@@ -49,7 +52,11 @@ class Vehicle(object):
         self.auv_config = auv_config
         self.robot_name = auv_config.robot_name
 
+        # arrival stats of every source, to catch the ones that stall
+        self.freshness = SensorFreshness()
+
         self._init_tf_vars()
+        self._last_tf_stamp = None
         # some state strings to be reported in case of trouble
         self._status_str_tf = "Uninitialized"
         self._last_update_tf = -1
@@ -57,6 +64,8 @@ class Vehicle(object):
         # these will come from dvl
         self.altitude = None
         self.dvl_velocity_msg = None
+        # (time, altitude) of the recent dvl messages, not just the last one
+        self.altitude_readings = deque(maxlen=50)
         self._dvl_sub = rospy.Subscriber(self.auv_config.DVL_TOPIC, DVL, self._dvl_cb, queue_size=2)
         self._status_str_dvl = "Uninitialized"
         self._last_update_dvl = -1
@@ -78,6 +87,11 @@ class Vehicle(object):
         self._last_update_gps = -1
 
 
+        # battery
+        self.battery_msg = None
+        self._battery_sub = rospy.Subscriber(self.auv_config.BATTERY_TOPIC, BatteryState, self._battery_cb, queue_size=2)
+        self._last_update_battery = -1
+
         # for visualizations
         self._animation = StringAnimation(num_slots=5)
         self.last_goto_wp = GotoWaypoint()
@@ -121,14 +135,16 @@ class Vehicle(object):
         self.position_point_stamped = None
 
 
-    def setup_tf_listener(self, timeout_secs=120):
+    def setup_tf_listener(self, timeout_secs=120, listener=None):
         """
         create a tf listener to be used later and return it
         because we cant store a tf listener in the blackboard of a BT
         due to serialization problems
         so we just... dont store it in this object...
+        if a listener is given, it is checked and returned instead
         """
-        listener = tf.TransformListener()
+        if listener is None:
+            listener = tf.TransformListener()
         try:
             listener.waitForTransform(self.auv_config.UTM_LINK,
                                       self.auv_config.BASE_LINK,
@@ -167,6 +183,15 @@ class Vehicle(object):
             return
 
 
+        # tf always has a transform, a new one is what counts as a message
+        try:
+            stamp = listener.getLatestCommonTime(self.auv_config.UTM_LINK, self.auv_config.BASE_LINK)
+            if stamp != self._last_tf_stamp:
+                self._last_tf_stamp = stamp
+                self.freshness.record('tf', stamp)
+        except Exception:
+            pass
+
         # position for x,y
         self.position_utm = [posi[0], posi[1]]
         # depth for z.
@@ -192,23 +217,33 @@ class Vehicle(object):
         self.altitude = msg.altitude
         self.dvl_velocity_msg = msg.velocity
         self._last_update_dvl = time.time()
+        self.altitude_readings.append((self._last_update_dvl, msg.altitude))
+        self.freshness.record('dvl', msg.header.stamp)
         self._status_str_dvl = "Working"
         self._animation.update(1)
 
     def _leak_cb(self, msg):
         self.leak = msg.value
         self._last_update_leak = time.time()
+        self.freshness.record('leak')
         self._status_str_leak = "Working"
         self._animation.update(2)
 
     def _latlon_cb(self, msg):
         self.position_latlon = [msg.latitude, msg.longitude]
+        self.freshness.record('latlon')
         self._animation.update(3)
 
+    def _battery_cb(self, msg):
+        self.battery_msg = msg
+        self._last_update_battery = time.time()
+        self.freshness.record('battery', msg.header.stamp)
+
     def _gps_cb(self, msg):
         self.raw_gps_obj = msg
         self._status_str_gps = "Working"
         self._last_update_gps = time.time()
+        self.freshness.record('gps', msg.header.stamp)
         self._animation.update(4)
 
 
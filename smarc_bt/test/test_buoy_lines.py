@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from buoy_lines import fit_buoy_lines, BuoyLineModel
+
+
+def farm(num_lines, per_line, line_spacing, buoy_spacing, angle=0., offset=(0., 0.)):
+    """
+    buoys of num_lines lines along the direction at angle, in line order
+    """
+    direction = np.array([np.cos(angle), np.sin(angle)])
+    normal = np.array([-direction[1], direction[0]])
+    points = []
+    for l in range(num_lines):
+        for b in range(per_line):
+            xy = np.array(offset) + l*line_spacing*normal + b*buoy_spacing*direction
+            points.append([xy[0], xy[1], 0.])
+    return np.array(points)
+
+
+class TestFitBuoyLines(unittest.TestCase):
+    def assert_parallel(self, a, b):
+        self.assertAlmostEqual(abs(np.dot(a, b)), 1., places=3)
+
+    def test_long_farm(self):
+        angle = 0.4
+        model = fit_buoy_lines(farm(3, 5, 10, 20, angle), 2)
+        self.assertEqual(len(model['lines']), 3)
+        self.assert_parallel(model['direction'], [np.cos(angle), np.sin(angle)])
+        self.assertEqual(model['all'].shape, (3, 5, 3))
+
+    def test_square_farm_at_an_angle(self):
+        # lines are closer than the buoys on them
+        angle = np.radians(30)
+        points = farm(4, 4, 8, 12, angle, offset=(650000, 6500000))
+        model = fit_buoy_lines(points, 2)
+        self.assertEqual(len(model['lines']), 4)
+        self.assert_parallel(model['direction'], [np.cos(angle), np.sin(angle)])
+        for line in model['lines']:
+            self.assertEqual(len(line), 4)
+
+    def test_square_farm_with_noise(self):
+        rng = np.random.RandomState(0)
+        angle = np.radians(45)
+        points = farm(3, 3, 10, 10, angle)
+        points[:,:2] += rng.normal(0, 0.3, (len(points), 2))
+        model = fit_buoy_lines(points, 2)
+        self.assertEqual(len(model['lines']), 3)
+        for line in model['lines']:
+            self.assertEqual(len(line), 3)
+
+    def test_square_grid_keeps_the_old_layout(self):
+        # a perfect grid splits both ways, lines along y like the old reshape
+        points = farm(3, 3, 5, 5)
+        model = fit_buoy_lines(points, 2)
+        self.assert_parallel(model['direction'], [0, 1])
+        for line in model['lines']:
+            self.assertTrue(np.allclose(line[:,0], line[0,0]))
+
+    def test_uneven_lines(self):
+        points = np.concatenate([farm(1, 4, 10, 20), farm(1, 2, 10, 20, offset=(0, 10))])
+        model = fit_buoy_lines(points, 2)
+        self.assertEqual(sorted(len(l) for l in model['lines']), [2, 4])
+        self.assertTrue(isinstance(model['all'], list))
+
+    def test_single_line(self):
+        model = fit_buoy_lines(farm(1, 5, 10, 10, 1.), 2)
+        self.assertEqual(len(model['lines']), 1)
+        self.assertEqual(len(model['lines'][0]), 5)
+
+    def test_single_buoy(self):
+        model = fit_buoy_lines([[1, 2, 0]], 2)
+        self.assertEqual(len(model['lines']), 1)
+        self.assertIsNone(fit_buoy_lines([], 2))
+
+
+class TestBuoyLineModel(unittest.TestCase):
+    def test_refits_only_when_moved(self):
+        line_model = BuoyLineModel(min_line_separation=2, move_tolerance=0.1)
+        points = farm(3, 5, 10, 20)
+        line_model.update(points, stamp=1)
+        line_model.update(points, stamp=1)
+        line_model.update(points + 0.05, stamp=2)
+        self.assertEqual(line_model.num_fits, 1)
+        line_model.update(points + 1, stamp=3)
+        self.assertEqual(line_model.num_fits, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+try:
+    from checkpoint import CheckpointStore
+except ImportError:
+    # needs rospy for the worker threads
+    CheckpointStore = None
+
+
+class WP(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def to_dict(self):
+        return {'x':self.x, 'y':self.y}
+
+
+class Plan(object):
+    def __init__(self, n):
+        self.plan_id = 'test_plan'
+        self.creation_time = 123.
+        self.waypoints = [WP(i, 0) for i in range(n)]
+        self.current_wp_index = 0
+        self.plan_is_go = True
+        self.num_patches = 0
+
+    def is_complete(self):
+        return self.current_wp_index >= len(self.waypoints)
+
+
+class Log(object):
+    def __init__(self, path):
+        self.disabled = False
+        self.creation_time = 123.
+        self.data_full_path = path
+        self.time_trace = []
+        self.written = []
+
+    def snapshot(self):
+        return len(self.written), {'time_trace': list(self.time_trace)}
+
+    def write(self, snapshot):
+        self.written.append(snapshot[1])
+
+
+@unittest.skipIf(CheckpointStore is None, "rospy is not available")
+class TestCheckpointStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = CheckpointStore(self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_save_and_load(self):
+        plan = Plan(5)
+        plan.current_wp_index = 2
+        self.store.save(plan)
+        checkpoint, waypoints = self.store.load()
+        self.assertEqual(checkpoint['current_wp_index'], 2)
+        self.assertEqual(waypoints, [wp.to_dict() for wp in plan.waypoints])
+        self.assertFalse(any(f.endswith('.tmp') for f in os.listdir(self.folder)))
+
+    def test_tick_writes_in_the_background_when_something_changed(self):
+        plan = Plan(5)
+        log = Log(os.path.join(self.folder, 'log.json'))
+        log.time_trace = [0, 1, 2]
+        self.assertTrue(self.store.tick(plan, log))
+        # appended after the tick, not in the checkpoint
+        log.time_trace.append(3)
+        self.assertTrue(self.store.wait())
+        self.assertFalse(self.store.tick(plan, log))
+        checkpoint, _ = self.store.load()
+        self.assertEqual(checkpoint['log_length'], 3)
+        self.assertEqual(log.written, [{'time_trace': [0, 1, 2]}])
+
+        plan.current_wp_index = 1
+        self.assertTrue(self.store.tick(plan, log))
+        self.assertTrue(self.store.wait())
+        self.assertEqual(self.store.load()[0]['current_wp_index'], 1)
+
+    def test_finished_plan_clears(self):
+        plan = Plan(2)
+        self.store.tick(plan)
+        self.store.wait()
+        plan.current_wp_index = 2
+        self.assertTrue(self.store.tick(plan))
+        self.store.wait()
+        self.assertIsNone(self.store.load())
+
+    def test_older_write_is_not_written_over_a_newer_one(self):
+        plan = Plan(5)
+        old = self.store._prepare(plan)
+        plan.current_wp_index = 3
+        new = self.store._prepare(plan)
+        self.store._write(new)
+        self.store._write(old)
+        self.assertEqual(self.store.load()[0]['current_wp_index'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+try:
+    from coverage_map import CoverageMap, label_cells
+except ImportError:
+    # needs nav_msgs
+    CoverageMap = None
+
+
+class WP(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Plan(object):
+    def __init__(self, points):
+        self.waypoints = [WP(x, y) for x, y in points]
+        self.num_patches = 0
+        self.current_wp_index = 0
+
+    def is_complete(self):
+        return self.current_wp_index >= len(self.waypoints)
+
+
+@unittest.skipIf(CoverageMap is None, "nav_msgs is not available")
+class TestLabelCells(unittest.TestCase):
+    def test_four_connected_groups(self):
+        mask = np.array([[1, 1, 0, 0],
+                         [0, 1, 0, 1],
+                         [0, 0, 1, 1],
+                         [1, 0, 0, 0]], dtype=bool)
+        groups = label_cells(mask)
+        self.assertEqual(sorted(len(g) for g in groups), [1, 3, 3])
+        # diagonal neighbours are not connected
+        self.assertEqual(len(label_cells(mask, min_cells=2)), 2)
+        for g in groups:
+            self.assertTrue(mask[g[:,0], g[:,1]].all())
+
+    def test_empty(self):
+        self.assertEqual(label_cells(np.zeros((3, 3), dtype=bool)), [])
+
+
+@unittest.skipIf(CoverageMap is None, "nav_msgs is not available")
+class TestCoverageMap(unittest.TestCase):
+    def setUp(self):
+        self.plan = Plan([(0, 0), (50, 0), (50, 10), (0, 10)])
+        self.cmap = CoverageMap(resolution=1., min_gap_area=4., gaps_period=5.)
+
+    def test_covered_leg_has_no_gaps(self):
+        self.cmap.update(self.plan, (0, 0), 4)
+        self.cmap.update(self.plan, (50, 0), 4)
+        self.plan.current_wp_index = 2
+        self.cmap.update(self.plan, (50, 10), 4)
+        self.assertEqual(self.cmap.find_gaps(), [])
+        self.assertGreater(self.cmap.percent_covered, 0)
+
+    def test_skipped_part_is_a_gap(self):
+        self.cmap.update(self.plan, (0, 0), 4)
+        self.cmap.update(self.plan, (20, 0), 4)
+        # jumped over the middle of the leg
+        self.cmap.max_step = 10
+        self.cmap.update(self.plan, (40, 0), 4)
+        self.cmap.update(self.plan, (50, 0), 4)
+        self.plan.current_wp_index = 2
+        self.cmap.update(self.plan, (50, 0), 4)
+        gaps = self.cmap.find_gaps()
+        self.assertEqual(len(gaps), 1)
+        self.assertAlmostEqual(gaps[0]['center'][0], 30, delta=1.5)
+
+    def test_gaps_are_kept_until_a_leg_is_finished(self):
+        self.cmap.update(self.plan, (0, 0), 4)
+        self.plan.current_wp_index = 2
+        self.cmap.update(self.plan, (0, 0), 4)
+        gaps = self.cmap.find_gaps()
+        self.assertEqual(len(gaps), 1)
+        # new coverage alone does not find them again within the period
+        self.cmap.update(self.plan, (25, 0), 4)
+        self.assertIs(self.cmap.find_gaps(), gaps)
+        self.assertIsNot(self.cmap.find_gaps(max_age=0), gaps)
+        # a finished leg does
+        gaps = self.cmap.find_gaps()
+        self.plan.current_wp_index = 3
+        self.cmap.update(self.plan, (25, 0), 4)
+        self.assertIsNot(self.cmap.find_gaps(), gaps)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from coverage_planner import CurrentField, \
+                             best_leg_heading, \
+                             create_coverage_path, \
+                             create_mower_pattern, \
+                             mower_pattern_segments, \
+                             ground_speeds
+
+
+def rectangle(length, width, angle=0.):
+    c, s = np.cos(angle), np.sin(angle)
+    corners = np.array([[0, 0], [length, 0], [length, width], [0, width]], dtype=float)
+    return corners.dot(np.array([[c, s], [-s, c]]))
+
+
+def leg_directions(path):
+    deltas = np.diff(path, axis=0)
+    long_legs = np.hypot(deltas[:,0], deltas[:,1]) > 20
+    return np.arctan2(deltas[long_legs,1], deltas[long_legs,0])
+
+
+class TestCoveragePlanner(unittest.TestCase):
+    def test_ground_speeds(self):
+        # with, against and across a 0.5m/s current
+        speeds = ground_speeds(np.array([0., np.pi, np.pi/2]), 1., np.array([0.5, 0.]))
+        self.assertAlmostEqual(speeds[0], 1.5)
+        self.assertAlmostEqual(speeds[1], 0.5)
+        self.assertAlmostEqual(speeds[2], np.sqrt(0.75))
+        # can not beat it
+        self.assertEqual(ground_speeds(np.array([np.pi]), 1., np.array([2., 0.]))[0], 0.)
+
+    def test_mower_pattern_covers_the_height(self):
+        xs, ys = create_mower_pattern(100, 19, 5, 0)
+        self.assertGreaterEqual(max(ys) + 2.5, 19)
+        self.assertEqual(len(set(ys)), 4)
+
+    def test_legs_along_the_long_side(self):
+        angle = 0.3
+        path = create_coverage_path(rectangle(100, 30, angle), 5, 0)
+        for d in leg_directions(path):
+            self.assertAlmostEqual(abs(np.sin(d - angle)), 0, places=3)
+
+    def test_segments_match_the_mower_pattern(self):
+        sizes = [(100, 19, 5, 0), (120, 40, 10, 0.01), (40, 100, 5, 0.02), (100, 400, 5, 0.2)]
+        for d, h, w, k in sizes:
+            xs, ys = create_mower_pattern(d, h, w, k)
+            expected = np.diff(np.array([xs, ys]), axis=1).T
+            deltas, valid = mower_pattern_segments([d], [h], w, k)
+            np.testing.assert_allclose(deltas[0][valid[0]], expected)
+
+    def test_short_side_along_the_current(self):
+        # the legs go across the current, along the long side
+        polygon = rectangle(100, 40)
+        current = CurrentField.constant(0., 0.6)
+        heading, predicted_time = best_leg_heading(polygon, 5, current, 1., 1.)
+        self.assertLess(abs(np.sin(heading)), 0.2)
+        self.assertTrue(np.isfinite(predicted_time))
+
+    def test_legs_along_the_short_side(self):
+        # the long side runs along a strong current, going back and forth
+        # across it is faster even if the legs are short
+        polygon = rectangle(100, 40)
+        current = CurrentField.constant(0.9, 0.)
+        heading, predicted_time = best_leg_heading(polygon, 5, current, 1., 1.)
+        self.assertLess(abs(np.cos(heading)), 0.2)
+        path = create_coverage_path(polygon, 5, 0, current, 1., 1.)
+        for d in leg_directions(path):
+            self.assertAlmostEqual(abs(np.cos(d)), 0, places=3)
+
+    def test_predicted_time_matches_the_path(self):
+        # at 1m/s without current the time is the length of the path,
+        # with the legs that grow with the error growth too
+        polygon = rectangle(120, 40)
+        current = CurrentField.constant(0., 0.)
+        for error_growth in (0., 0.01):
+            _, predicted_time = best_leg_heading(polygon, 10, current, 1., 1., error_growth, num_headings=4)
+            path = create_coverage_path(polygon, 10, error_growth, current, 1., 1.)
+            length = np.sum(np.hypot(*np.diff(path, axis=0).T))
+            self.assertAlmostEqual(predicted_time, length, places=6)
+
+    def test_current_that_can_not_be_beaten(self):
+        polygon = rectangle(100, 30)
+        current = CurrentField.constant(5., 5.)
+        path = create_coverage_path(polygon, 5, 0, current, 1., 1.)
+        self.assertGreater(len(path), 2)
+        for d in leg_directions(path):
+            self.assertAlmostEqual(abs(np.sin(d)), 0, places=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from drift_estimator import DriftEstimator
+
+
+class Attrs(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def travel(estimator, distance, step=1., depth=2.):
+    """
+    moves along x from the last position, returns the final position
+    """
+    x = 0. if estimator._last_position is None else estimator._last_position[0]
+    for _ in range(int(distance / step)):
+        x += step
+        estimator.update((x, 0.), depth)
+    return (x, 0.)
+
+
+class TestDriftEstimator(unittest.TestCase):
+    def test_distance_is_integrated(self):
+        estimator = DriftEstimator()
+        estimator.update((0., 0.), 2.)
+        travel(estimator, 30.)
+        self.assertAlmostEqual(estimator.distance_since_fix, 30.)
+        self.assertIsNone(estimator.error_growth)
+
+    def test_sample_at_the_surface(self):
+        estimator = DriftEstimator(min_distance=20.)
+        estimator.update((0., 0.), 0.)
+        x, y = travel(estimator, 50.)
+        self.assertTrue(estimator.update((x, y), 0., fix_stamp=1., fix_utm=(x, y + 2.)))
+        self.assertAlmostEqual(estimator.error_growth, 2. / 50.)
+        self.assertEqual(estimator.distance_since_fix, 0.)
+        self.assertEqual(estimator.samples, [(1., 50., 2.)])
+
+    def test_least_squares_of_samples(self):
+        estimator = DriftEstimator()
+        estimator.add_sample(10., 1., 0.)
+        estimator.add_sample(20., 1., 1.)
+        # sum(e*d)/sum(d*d) = 30/500
+        self.assertAlmostEqual(estimator.error_growth, 0.06)
+
+    def test_growth_is_clamped(self):
+        estimator = DriftEstimator(max_growth=0.1)
+        estimator.add_sample(10., 5., 0.)
+        self.assertEqual(estimator.error_growth, 0.1)
+
+    def test_short_distance_is_not_a_sample(self):
+        estimator = DriftEstimator(min_distance=20.)
+        estimator.update((0., 0.), 0.)
+        x, y = travel(estimator, 10.)
+        self.assertFalse(estimator.update((x, y), 0., fix_stamp=1., fix_utm=(x, y + 2.)))
+        self.assertEqual(estimator.num_samples, 0)
+        # still corrected by the fix
+        self.assertEqual(estimator.distance_since_fix, 0.)
+
+    def test_fix_while_diving_is_ignored(self):
+        estimator = DriftEstimator(min_distance=20., surface_depth=0.5)
+        estimator.update((0., 0.), 0.)
+        x, y = travel(estimator, 50.)
+        self.assertFalse(estimator.update((x, y), 3., fix_stamp=1., fix_utm=(x, y + 2.)))
+        self.assertEqual(estimator.num_samples, 0)
+        self.assertAlmostEqual(estimator.distance_since_fix, 50.)
+        self.assertEqual(estimator.last_fix, (1., x, y + 2.))
+
+    def test_same_fix_is_used_once(self):
+        estimator = DriftEstimator(min_distance=20.)
+        estimator.update((0., 0.), 0.)
+        x, y = travel(estimator, 50.)
+        self.assertTrue(estimator.update((x, y), 0., fix_stamp=1., fix_utm=(x, y + 2.)))
+        x, y = travel(estimator, 50.)
+        self.assertFalse(estimator.update((x, y), 0., fix_stamp=1., fix_utm=(x, y + 2.)))
+        self.assertEqual(estimator.num_samples, 1)
+
+    def test_tick_retries_unconverted_fix(self):
+        estimator = DriftEstimator(min_distance=20.)
+        gps = Attrs(status=Attrs(status=0),
+                    header=Attrs(stamp=Attrs(to_sec=lambda: 5.)),
+                    latitude=58., longitude=11.)
+        vehicle = Attrs(raw_gps_obj=gps, position_utm=(0., 0.), depth=0.)
+        estimator.tick(vehicle, lambda lat, lon: None)
+        self.assertIsNone(estimator.last_fix)
+        estimator.tick(vehicle, lambda lat, lon: (1., 1.))
+        self.assertEqual(estimator.last_fix, (5., 1., 1.))
+
+    def test_tick_ignores_no_fix(self):
+        estimator = DriftEstimator()
+        gps = Attrs(status=Attrs(status=-1),
+                    header=Attrs(stamp=Attrs(to_sec=lambda: 5.)),
+                    latitude=58., longitude=11.)
+        vehicle = Attrs(raw_gps_obj=gps, position_utm=(0., 0.), depth=0.)
+
+        def fail(lat, lon):
+            raise AssertionError("converted a non-fix")
+
+        self.assertFalse(estimator.tick(vehicle, fail))
+        self.assertIsNone(estimator.last_fix)
+
+
+if __name__ == '__main__':
+    unittest.main()
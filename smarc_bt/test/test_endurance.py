@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from endurance import EnduranceModel
+from log_analysis import load_log
+
+
+class FakePlan(object):
+    plan_id = 'plan'
+    current_wp_index = 0
+    waypoints = []
+
+
+def log_data(distance, start_percent, end_percent, duration=100., steps=11):
+    """
+    a straight line along x with the battery going down evenly
+    """
+    nav, battery, times = [], [], []
+    for i in range(steps):
+        f = float(i) / (steps-1)
+        nav.append([f*distance, 0., 0., 0., 0., 0.])
+        battery.append([start_percent + f*(end_percent - start_percent), 16., 1.])
+        times.append(f*duration)
+    return {'navigation_trace': nav, 'battery_trace': battery, 'time_trace': times}
+
+
+class TestEnduranceModel(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_learn_from_log_data(self):
+        model = EnduranceModel(battery_capacity_wh=1000, default_wh_per_meter=0.1)
+        # 10% of 1000Wh for 500m
+        self.assertTrue(model.learn_from_log_data(log_data(500, 0.9, 0.8)))
+        self.assertAlmostEqual(model.wh_per_meter(), 0.2)
+        self.assertAlmostEqual(model.wh_per_meter(5.), 0.2)
+
+    def test_skips_unusable_logs(self):
+        model = EnduranceModel(battery_capacity_wh=1000, default_wh_per_meter=0.1)
+        # too short
+        self.assertFalse(model.learn_from_log_data(log_data(10, 0.9, 0.8)))
+        # charged on the way
+        self.assertFalse(model.learn_from_log_data(log_data(500, 0.8, 0.9)))
+        # no battery
+        data = log_data(500, 0.9, 0.8)
+        data['battery_trace'] = [None] * len(data['time_trace'])
+        self.assertFalse(model.learn_from_log_data(data))
+        self.assertEqual(model.wh_per_meter(), 0.1)
+
+    def test_learns_only_the_latest_logs(self):
+        for i in range(5):
+            with open(os.path.join(self.folder, "2021-05-0{}-10-00_plan.json".format(i+1)), 'w') as f:
+                # the last two logs use twice as much
+                json.dump(log_data(500, 0.9, 0.8 if i < 3 else 0.7), f)
+        model = EnduranceModel(battery_capacity_wh=1000, default_wh_per_meter=0.1)
+        self.assertEqual(model.learn_from_folder(self.folder, max_logs=2), 2)
+        self.assertAlmostEqual(model.wh_per_meter(), 0.4)
+        # the log folder is only read from
+        self.assertEqual(len([f for f in os.listdir(self.folder) if f.endswith('.npz')]), 0)
+
+    def test_reads_existing_caches(self):
+        path = os.path.join(self.folder, "2021-05-01-10-00_plan.json")
+        with open(path, 'w') as f:
+            json.dump(log_data(500, 0.9, 0.8), f)
+        # made by log_analysis, off the vehicle
+        load_log(path)
+        with open(path, 'w') as f:
+            f.write("not json")
+        os.utime(os.path.join(self.folder, "2021-05-01-10-00_plan.npz"), None)
+        model = EnduranceModel(battery_capacity_wh=1000, default_wh_per_meter=0.1)
+        self.assertEqual(model.learn_from_folder(self.folder), 1)
+
+    def test_precomputed_required_energy(self):
+        model = EnduranceModel(battery_capacity_wh=1000, default_wh_per_meter=0.1)
+        plan = FakePlan()
+        report = model.feasibility_report(plan, None, required=12.)
+        self.assertEqual(report['required_wh'], 12.)
+        self.assertTrue(report['feasible'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from envelope import fit_line, Limit, EnvelopeChecker
+
+
+class FakeVehicle(object):
+    def __init__(self, depth):
+        self.depth = depth
+        self.altitude_readings = []
+
+
+class TestFitLine(unittest.TestCase):
+    def test_line(self):
+        a, b = fit_line([0, 1, 2, 3], [1, 3, 5, 7], 0.5)
+        self.assertAlmostEqual(a, 7)
+        self.assertAlmostEqual(b, 2)
+
+    def test_outlier_is_dropped(self):
+        values = list(range(10))
+        values[5] = 15
+        a, b = fit_line(list(range(10)), values, 3)
+        self.assertAlmostEqual(a, 9)
+        self.assertAlmostEqual(b, 1)
+
+    def test_too_few(self):
+        self.assertIsNone(fit_line([0, 1], [0, 1], 0.5))
+
+
+class TestLimit(unittest.TestCase):
+    def make_limit(self):
+        return Limit('depth', True, window=20, max_age=100, max_residual=0.5)
+
+    def test_predicted_then_violated(self):
+        limit = self.make_limit()
+        states = []
+        for t in range(10):
+            limit.add(t, t*0.5)
+            states.append(limit.update(5, horizon=3, hysteresis=1, now=t))
+        self.assertEqual(states[3], Limit.OK)
+        self.assertEqual(states[8], Limit.PREDICTED)
+        limit.add(10, 5.5)
+        self.assertEqual(limit.update(5, horizon=3, hysteresis=1, now=10), Limit.VIOLATED)
+
+    def test_hysteresis(self):
+        limit = self.make_limit()
+        for t in range(5):
+            limit.add(t, 6)
+        self.assertEqual(limit.update(5, 3, 3, 5), Limit.OK)
+        self.assertEqual(limit.update(5, 3, 3, 5), Limit.OK)
+        self.assertEqual(limit.update(5, 3, 3, 5), Limit.VIOLATED)
+
+
+class TestEnvelopeChecker(unittest.TestCase):
+    def test_predicted_is_not_violated(self):
+        checker = EnvelopeChecker(horizon=5, hysteresis=1, max_age=100)
+        vehicle = FakeVehicle(None)
+        now = time.time()
+        vehicle.altitude_readings = [(now - 6 + t, 10 - t) for t in range(1, 7)]
+        checker.tick(vehicle, 20, 2)
+        self.assertFalse(checker.ok)
+        self.assertTrue(checker.predicted)
+        self.assertFalse(checker.violated)
+
+    def test_altitude_dropout_is_a_violation(self):
+        checker = EnvelopeChecker(hysteresis=2, max_age=0.01, dropout_depth=1)
+        vehicle = FakeVehicle(5)
+        vehicle.altitude_readings = [(1e12 + t, 10) for t in range(5)]
+        checker.tick(vehicle, 20, 2)
+        self.assertTrue(checker.ok)
+
+        # the readings age out and no new ones come
+        vehicle.altitude_readings = []
+        checker._last_altitude_time = 0
+        checker.altitude.readings.clear()
+        checker.tick(vehicle, 20, 2)
+        self.assertTrue(checker.ok)
+        checker.tick(vehicle, 20, 2)
+        self.assertTrue(checker.violated)
+        self.assertTrue(checker.altitude.dropout)
+
+    def test_dropout_near_the_surface_is_fine(self):
+        checker = EnvelopeChecker(hysteresis=1, max_age=100, dropout_depth=1)
+        vehicle = FakeVehicle(5)
+        vehicle.altitude_readings = [(1e12 + t, 10) for t in range(5)]
+        checker.tick(vehicle, 20, 2)
+        checker.altitude.readings.clear()
+        vehicle.depth = 0.2
+        checker.tick(vehicle, 20, 2)
+        self.assertTrue(checker.ok)
+        # and it is not remembered for the next dive
+        vehicle.depth = 5
+        checker.tick(vehicle, 20, 2)
+        self.assertTrue(checker.ok)
+
+    def test_no_altitude_ever_is_fine(self):
+        checker = EnvelopeChecker(hysteresis=1, dropout_depth=1)
+        vehicle = FakeVehicle(5)
+        for i in range(3):
+            checker.tick(vehicle, 20, 2)
+        self.assertTrue(checker.ok)
+
+
+if __name__ == '__main__':
+    unittest.main()
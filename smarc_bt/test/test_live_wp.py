@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from live_wp import LiveWaypointCoalescer
+
+
+class Attrs(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeWaypoint(object):
+    """
+    the parts of mission_plan.Waypoint that the coalescer uses
+    """
+    def __init__(self, x, y, frame_id='utm'):
+        position = Attrs(x=x, y=y)
+        header = Attrs(frame_id=frame_id)
+        self.wp = Attrs(pose=Attrs(header=header, pose=Attrs(position=position)))
+
+    @property
+    def x(self):
+        return self.wp.pose.pose.position.x
+
+    @property
+    def y(self):
+        return self.wp.pose.pose.position.y
+
+
+def moving(coalescer, num, speed=1., dt=0.1):
+    """
+    adds num waypoints moving along x at speed, returns the last
+    """
+    for i in range(num):
+        wp = FakeWaypoint(i*dt*speed, 0)
+        coalescer.add(wp, t=i*dt)
+    return wp
+
+
+class TestLiveWaypointCoalescer(unittest.TestCase):
+    def test_no_smoothing_is_the_raw_position(self):
+        coalescer = LiveWaypointCoalescer(alpha=1, beta=0)
+        wp = moving(coalescer, 10)
+        predicted = coalescer.predicted(wp, t=0.9)
+        self.assertAlmostEqual(predicted.x, wp.x)
+        self.assertIsNot(predicted, wp)
+        self.assertIsNot(predicted.wp, wp.wp)
+
+    def test_moving_waypoint_is_led(self):
+        coalescer = LiveWaypointCoalescer(min_interval=1.)
+        wp = moving(coalescer, 50)
+        self.assertAlmostEqual(coalescer.velocity[0], 1., places=1)
+        predicted = coalescer.predicted(wp, t=4.9)
+        self.assertAlmostEqual(predicted.x, wp.x + 1., places=1)
+
+    def test_lead_is_capped(self):
+        coalescer = LiveWaypointCoalescer(min_interval=1., lead_margin=0.5, max_gap=10.)
+        wp = moving(coalescer, 50)
+        predicted = coalescer.predicted(wp, t=4.9 + 3.)
+        self.assertLess(predicted.x, wp.x + 1.5 + 0.1)
+
+    def test_old_waypoint_is_not_predicted(self):
+        coalescer = LiveWaypointCoalescer(max_gap=2.)
+        wp = moving(coalescer, 50)
+        self.assertIs(coalescer.predicted(wp, t=4.9 + 3.), wp)
+
+    def test_other_waypoint_is_not_predicted(self):
+        coalescer = LiveWaypointCoalescer()
+        moving(coalescer, 10)
+        other = FakeWaypoint(5, 5)
+        self.assertIs(coalescer.predicted(other, t=1.), other)
+
+    def test_gap_and_frame_change_reset(self):
+        coalescer = LiveWaypointCoalescer(max_gap=2.)
+        moving(coalescer, 10)
+        coalescer.add(FakeWaypoint(100, 0), t=10.)
+        self.assertEqual(coalescer.position, (100, 0))
+        self.assertEqual(coalescer.velocity, (0., 0.))
+        coalescer.add(FakeWaypoint(200, 0, 'latlon'), t=10.5)
+        self.assertEqual(coalescer.position, (200, 0))
+        self.assertEqual(coalescer.num_updates, 1)
+
+    def test_send_interval(self):
+        coalescer = LiveWaypointCoalescer(min_interval=1.)
+        self.assertTrue(coalescer.can_send(t=10.))
+        coalescer.sent(t=10.)
+        self.assertFalse(coalescer.can_send(t=10.5))
+        self.assertTrue(coalescer.can_send(t=11.))
+
+
+if __name__ == '__main__':
+    unittest.main()
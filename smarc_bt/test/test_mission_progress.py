@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from mission_progress import MissionProgress
+
+
+class Attrs(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakePlan(object):
+    """
+    the parts of mission_plan.MissionPlan that the progress uses
+    """
+    def __init__(self, xys):
+        self.waypoints = [Attrs(x=x, y=y) for x, y in xys]
+        self.current_wp_index = 0
+        self.num_patches = 0
+
+    def is_complete(self):
+        return self.current_wp_index >= len(self.waypoints)
+
+
+class TestMissionProgress(unittest.TestCase):
+    def setUp(self):
+        # start at the origin, 10m to the first wp, then 10m more
+        self.plan = FakePlan([(10., 0.), (10., 10.)])
+        self.progress = MissionProgress(speed_smoothing=1.)
+
+    def test_first_leg_starts_at_the_vehicle(self):
+        self.progress.update(self.plan, (0., 0.), now=0.)
+        self.assertAlmostEqual(self.progress.total_distance, 20.)
+        self.assertAlmostEqual(self.progress.progress, 0.)
+        self.progress.update(self.plan, (5., 3.), now=5.)
+        self.assertAlmostEqual(self.progress.travelled_distance, 5.)
+        self.assertAlmostEqual(self.progress.remaining_distance, 15.)
+        self.assertAlmostEqual(self.progress.progress, 25.)
+
+    def test_second_leg(self):
+        self.progress.update(self.plan, (0., 0.), now=0.)
+        self.plan.current_wp_index = 1
+        self.progress.update(self.plan, (10., 5.), now=1.)
+        self.assertAlmostEqual(self.progress.travelled_distance, 15.)
+        self.assertAlmostEqual(self.progress.progress, 75.)
+
+    def test_projection_is_clamped_to_the_leg(self):
+        self.progress.update(self.plan, (0., 0.), now=0.)
+        self.progress.update(self.plan, (-5., 0.), now=1.)
+        self.assertAlmostEqual(self.progress.travelled_distance, 0.)
+        self.progress.update(self.plan, (15., 0.), now=2.)
+        self.assertAlmostEqual(self.progress.travelled_distance, 10.)
+
+    def test_complete(self):
+        self.progress.update(self.plan, (0., 0.), now=0.)
+        self.plan.current_wp_index = 2
+        self.progress.update(self.plan, None, now=1.)
+        self.assertEqual(self.progress.progress, 100.)
+        self.assertEqual(self.progress.remaining_distance, 0.)
+        self.assertEqual(self.progress.eta, 0.)
+
+    def test_eta_from_positions(self):
+        self.progress.update(self.plan, (0., 0.), now=0.)
+        self.assertIsNone(self.progress.eta)
+        self.progress.update(self.plan, (2., 0.), now=2.)
+        self.assertAlmostEqual(self.progress.speed, 1.)
+        self.assertAlmostEqual(self.progress.eta, 18.)
+
+    def test_eta_from_dvl(self):
+        self.progress.update(self.plan, (0., 0.), now=0.)
+        self.progress.update(self.plan, (2., 0.), dvl_velocity=Attrs(x=0., y=2.), dvl_time=1.9, now=2.)
+        self.assertAlmostEqual(self.progress.speed, 2.)
+        self.assertAlmostEqual(self.progress.eta, 9.)
+
+    def test_old_dvl_is_ignored(self):
+        self.progress.update(self.plan, (0., 0.), now=0.)
+        self.progress.update(self.plan, (2., 0.), dvl_velocity=Attrs(x=0., y=2.), dvl_time=-5., now=2.)
+        self.assertAlmostEqual(self.progress.speed, 1.)
+
+    def test_no_eta_when_stopped(self):
+        self.progress.update(self.plan, (0., 0.), now=0.)
+        self.progress.update(self.plan, (0., 0.), now=1.)
+        self.assertIsNone(self.progress.eta)
+
+    def test_patched_plan_resets(self):
+        self.progress.update(self.plan, (0., 0.), now=0.)
+        self.plan.waypoints.append(Attrs(x=0., y=10.))
+        self.plan.num_patches += 1
+        self.progress.update(self.plan, (0., 0.), now=1.)
+        self.assertAlmostEqual(self.progress.total_distance, 30.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from plan_optimizer import distance_matrix, route_length, optimize_order, optimize_waypoints
+
+
+class FakeWaypoint(object):
+    def __init__(self, x, y, ordered=False):
+        self.x = x
+        self.y = y
+        self.ordered = ordered
+
+
+class TestOptimizeOrder(unittest.TestCase):
+    def test_zigzag_is_untangled(self):
+        # along a line, but visited back and forth
+        points = np.array([(0, 0), (3, 0), (1, 0), (4, 0), (2, 0), (5, 0)], dtype=float)
+        route = optimize_order(points)
+        self.assertEqual(route, [0, 2, 4, 1, 3, 5])
+        dist = distance_matrix(points)
+        self.assertAlmostEqual(route_length(dist, route), 5)
+
+    def test_ends_stay(self):
+        rng = np.random.RandomState(0)
+        points = rng.uniform(0, 100, (30, 2))
+        route = optimize_order(points)
+        self.assertEqual(route[0], 0)
+        self.assertEqual(route[-1], 29)
+        self.assertEqual(sorted(route), list(range(30)))
+        dist = distance_matrix(points)
+        self.assertLessEqual(route_length(dist, route), route_length(dist, range(30)))
+
+    def test_short_routes_are_kept(self):
+        points = np.array([(0, 0), (5, 0), (1, 0)], dtype=float)
+        self.assertEqual(optimize_order(points), [0, 1, 2])
+
+
+class TestOptimizeWaypoints(unittest.TestCase):
+    def test_ordered_waypoints_stay(self):
+        coords = [(0, 0), (3, 0), (1, 0), (2, 0), (10, 0), (13, 0), (11, 0), (12, 0), (20, 0)]
+        waypoints = [FakeWaypoint(x, y) for x, y in coords]
+        waypoints[4].ordered = True
+        new_wps, before, after = optimize_waypoints(waypoints)
+        self.assertIs(new_wps[4], waypoints[4])
+        self.assertEqual([wp.x for wp in new_wps], [0, 1, 2, 3, 10, 11, 12, 13, 20])
+        self.assertAlmostEqual(after, 20)
+        self.assertGreater(before, after)
+
+    def test_few_waypoints_are_not_touched(self):
+        waypoints = [FakeWaypoint(0, 0), FakeWaypoint(1, 0)]
+        self.assertEqual(optimize_waypoints(waypoints), (waypoints, None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
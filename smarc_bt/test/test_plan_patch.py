@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from plan_patch import diff_plans, increasing_subsequence, patch_summary
+
+
+class FakeGoal(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeWaypoint(object):
+    """
+    the parts of mission_plan.Waypoint that the diff looks at
+    """
+    def __init__(self, name, x, tolerance=1):
+        self.wp = FakeGoal(name)
+        self.x = x
+        self.tolerance = tolerance
+
+    def to_dict(self):
+        return {'name':self.wp.name, 'x':self.x, 'goal_tolerance':self.tolerance}
+
+
+def waypoints(*names_and_xs):
+    return [FakeWaypoint(n, x) for n, x in names_and_xs]
+
+
+class TestIncreasingSubsequence(unittest.TestCase):
+    def test_subsequence(self):
+        self.assertEqual(increasing_subsequence([0, 3, 1, 2]), set([0, 1, 2]))
+        self.assertEqual(increasing_subsequence([]), set())
+
+
+class TestDiffPlans(unittest.TestCase):
+    def test_same_plan_is_unchanged(self):
+        old = waypoints(('a', 0), ('b', 1), ('c', 2))
+        new = waypoints(('a', 0), ('b', 1), ('c', 2))
+        patched, patch = diff_plans(old, new, 1)
+        for p, o in zip(patched, old):
+            self.assertIs(p, o)
+        self.assertEqual(patch['new_index'], 1)
+        self.assertFalse(patch['rest_changed'])
+
+    def test_tolerance_is_not_a_change(self):
+        old = waypoints(('a', 0), ('b', 1))
+        new = [FakeWaypoint('a', 0, 5), FakeWaypoint('b', 1, 5)]
+        _, patch = diff_plans(old, new, 0)
+        self.assertEqual(patch['changed'], [])
+
+    def test_edited_visited_waypoint_is_done_again(self):
+        old = waypoints(('a', 0), ('b', 1), ('c', 2))
+        new = waypoints(('a', 0), ('b', 10), ('c', 2))
+        patched, patch = diff_plans(old, new, 2)
+        self.assertEqual(patch['changed'], ['b'])
+        self.assertEqual(patch['new_index'], 1)
+        self.assertIs(patched[1], new[1])
+        self.assertTrue(patch['rest_changed'])
+
+    def test_insert_delete_move(self):
+        old = waypoints(('a', 0), ('b', 1), ('c', 2), ('d', 3))
+        new = waypoints(('a', 0), ('d', 3), ('b', 1), ('e', 4))
+        _, patch = diff_plans(old, new, 1)
+        self.assertEqual(patch['inserted'], ['e'])
+        self.assertEqual(patch['deleted'], ['c'])
+        self.assertEqual(patch['moved'], ['d'])
+        self.assertEqual(patch['new_index'], 1)
+
+    def test_missing_or_repeated_names(self):
+        old = waypoints(('a', 0), ('b', 1))
+        self.assertIsNone(diff_plans(old, waypoints(('a', 0), ('a', 1)), 0))
+        self.assertIsNone(diff_plans(old, waypoints(('a', 0), ('', 1)), 0))
+
+    def test_summary(self):
+        old = waypoints(('a', 0), ('b', 1))
+        new = waypoints(('a', 0), ('b', 1), ('c', 2))
+        _, patch = diff_plans(old, new, 1)
+        self.assertEqual(patch_summary(patch), "+1 -0 moved:0 changed:0, wp 1->1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from poi_registry import POIRegistry
+
+
+class TestPOIRegistry(unittest.TestCase):
+    def test_close_detections_merge(self):
+        registry = POIRegistry(2)
+        poi, is_new = registry.add(0, 0, 0, 'utm', 0)
+        self.assertTrue(is_new)
+        same, is_new = registry.add(1, 1, 0, 'utm', 1)
+        self.assertFalse(is_new)
+        self.assertIs(same, poi)
+        self.assertEqual(poi.hits, 2)
+        self.assertAlmostEqual(poi.x, 0.5)
+        self.assertEqual(len(registry), 1)
+
+    def test_far_detection_is_new(self):
+        registry = POIRegistry(2)
+        registry.add(0, 0, 0, 'utm', 0)
+        poi, is_new = registry.add(5, 0, 0, 'utm', 1)
+        self.assertTrue(is_new)
+        self.assertEqual(poi.poi_id, 1)
+        self.assertEqual(len(registry), 2)
+
+    def test_merge_across_cells(self):
+        registry = POIRegistry(1)
+        registry.add(0.95, 0, 0, 'utm', 0)
+        _, is_new = registry.add(1.05, 0, 0, 'utm', 1)
+        self.assertFalse(is_new)
+
+    def test_merge_radius_must_be_positive(self):
+        self.assertRaises(AssertionError, POIRegistry, 0)
+        self.assertRaises(AssertionError, POIRegistry, -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+try:
+    import sensor_freshness
+    from sensor_freshness import SourceStats, SensorFreshness
+except ImportError:
+    sensor_freshness = None
+
+
+class FakeStamp(object):
+    def __init__(self, secs):
+        self.secs = secs
+
+    def to_sec(self):
+        return self.secs
+
+
+@unittest.skipIf(sensor_freshness is None, "rospy is not available")
+class TestSourceStats(unittest.TestCase):
+    def test_gaps_and_delays(self):
+        source = SourceStats('dvl')
+        source.record(10., stamp=9.5)
+        source.record(11., stamp=10.9)
+        source.record(13., stamp=12.8)
+        self.assertEqual(list(source.gaps), [1., 2.])
+        self.assertEqual([round(d, 4) for d in source.delays], [0.5, 0.1, 0.2])
+        stats = source.stats(now=14.)
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['age'], 1.)
+        self.assertEqual(stats['gap_mean'], 1.5)
+        self.assertEqual(stats['gap_max'], 2.)
+        self.assertEqual(stats['delay_max'], 0.5)
+
+    def test_zero_stamp_is_no_stamp(self):
+        source = SourceStats('gps')
+        source.record(10., stamp=0.)
+        source.record(11.)
+        self.assertEqual(len(source.delays), 0)
+        self.assertEqual(source.count, 2)
+        stats = source.stats(now=11.)
+        self.assertIsNone(stats['delay_mean'])
+        self.assertIsNone(stats['delay_max'])
+
+    def test_window(self):
+        source = SourceStats('imu', window=3)
+        for i in range(10):
+            source.record(float(i))
+        self.assertEqual(len(source.gaps), 3)
+
+    def test_no_messages(self):
+        source = SourceStats('alt')
+        self.assertIsNone(source.age(now=5.))
+        stats = source.stats(now=5.)
+        self.assertEqual(stats['count'], 0)
+        self.assertIsNone(stats['age'])
+        self.assertIsNone(stats['gap_mean'])
+
+
+@unittest.skipIf(sensor_freshness is None, "rospy is not available")
+class TestSensorFreshness(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.
+        self._get_time = sensor_freshness.rospy.get_time
+        sensor_freshness.rospy.get_time = lambda: self.now
+
+    def tearDown(self):
+        sensor_freshness.rospy.get_time = self._get_time
+
+    def test_record_uses_stamp(self):
+        freshness = SensorFreshness()
+        freshness.record('dvl', FakeStamp(99.))
+        freshness.record('gps')
+        self.assertEqual(list(freshness.sources['dvl'].delays), [1.])
+        self.assertEqual(len(freshness.sources['gps'].delays), 0)
+
+    def test_stale(self):
+        freshness = SensorFreshness()
+        freshness.record('dvl')
+        freshness.record('gps')
+        self.now = 103.
+        freshness.record('gps')
+        self.now = 104.
+        self.assertEqual(freshness.age('dvl'), 4.)
+        self.assertIsNone(freshness.age('alt'))
+        stale = freshness.stale({'dvl': 2., 'gps': 2.})
+        self.assertEqual(stale, [('dvl', 4.)])
+
+    def test_never_sent_is_stale(self):
+        freshness = SensorFreshness()
+        freshness.record('dvl')
+        stale = freshness.stale({'dvl': 2., 'alt': 2.})
+        self.assertEqual(stale, [('alt', None)])
+
+    def test_stats(self):
+        freshness = SensorFreshness()
+        freshness.record('dvl')
+        self.now = 101.
+        freshness.record('dvl')
+        self.now = 103.
+        stats = freshness.stats()
+        self.assertEqual(stats['dvl']['age'], 2.)
+        self.assertEqual(stats['dvl']['gap_max'], 1.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+try:
+    import service_client
+    from service_client import ServiceClient, ServiceCall, run_async, get_client
+except ImportError:
+    service_client = None
+
+
+def wait(call, timeout=2.):
+    start_time = time.time()
+    while not call.done() and time.time() - start_time < timeout:
+        time.sleep(0.01)
+    return call.state
+
+
+if service_client is not None:
+    class FakeClient(ServiceClient):
+        """
+        calls fn instead of a ros service
+        """
+        def __init__(self, service_name, fn, **kwargs):
+            super(FakeClient, self).__init__(service_name, None, **kwargs)
+            self.fn = fn
+
+        def _get_proxy(self):
+            return self.fn
+
+
+def fail(*args):
+    raise ValueError("no")
+
+
+@unittest.skipIf(service_client is None, "rospy is not available")
+class TestRunAsync(unittest.TestCase):
+    def test_result(self):
+        job = run_async(lambda a, b: a + b, 1, b=2)
+        start_time = time.time()
+        while not job.done() and time.time() - start_time < 2:
+            time.sleep(0.01)
+        self.assertEqual(job.get(), 3)
+        self.assertGreaterEqual(job.elapsed, 0)
+
+    def test_exception(self):
+        job = run_async(fail)
+        start_time = time.time()
+        while not job.done() and time.time() - start_time < 2:
+            time.sleep(0.01)
+        self.assertRaises(ValueError, job.get)
+
+
+@unittest.skipIf(service_client is None, "rospy is not available")
+class TestServiceClient(unittest.TestCase):
+    def test_call_async(self):
+        client = FakeClient('test_ok', lambda x: x * 2)
+        call = client.call_async(21)
+        self.assertEqual(wait(call), ServiceCall.SUCCEEDED)
+        self.assertEqual(call.result, 42)
+        self.assertEqual(client.successes, 1)
+
+    def test_failure(self):
+        client = FakeClient('test_fail', fail)
+        call = client.call_async()
+        self.assertEqual(wait(call), ServiceCall.FAILED)
+        self.assertIn("no", call.error)
+        self.assertEqual(client.failures, 1)
+
+    def test_timeout(self):
+        client = FakeClient('test_slow', lambda: time.sleep(0.5), timeout=0.05)
+        call = client.call_async()
+        self.assertEqual(wait(call), ServiceCall.TIMED_OUT)
+        self.assertEqual(client.timeouts, 1)
+
+    def test_circuit_opens_and_closes(self):
+        client = FakeClient('test_circuit', fail, max_failures=2, open_period=0.1)
+        for i in range(2):
+            wait(client.call_async())
+        self.assertEqual(client.circuit, ServiceClient.OPEN)
+        call = client.call_async()
+        self.assertEqual(call.state, ServiceCall.REJECTED)
+        self.assertEqual(client.rejected, 1)
+
+        # one trial call after the open period, that closes it if it works
+        time.sleep(0.15)
+        client.fn = lambda: 'back'
+        call = client.call_async()
+        self.assertEqual(client.circuit, ServiceClient.HALF_OPEN)
+        self.assertEqual(client.call_async().state, ServiceCall.REJECTED)
+        self.assertEqual(wait(call), ServiceCall.SUCCEEDED)
+        self.assertEqual(client.circuit, ServiceClient.CLOSED)
+
+    def test_blocking_call(self):
+        client = FakeClient('test_blocking', lambda: 'ok')
+        self.assertEqual(client.call(), 'ok')
+        client.fn = fail
+        self.assertRaises(ValueError, client.call)
+        self.assertEqual(client.stats()['failures'], 1)
+
+    def test_hung_service_holds_one_thread(self):
+        release = threading.Event()
+        client = FakeClient('test_hung', lambda: release.wait(), timeout=0.01,
+                            max_failures=100)
+        try:
+            call = client.call_async()
+            self.assertEqual(wait(call), ServiceCall.TIMED_OUT)
+            # the first call is still stuck, no more are made
+            for i in range(12):
+                self.assertEqual(client.call_async().state, ServiceCall.REJECTED)
+            self.assertRaises(Exception, client.call)
+
+            # and other work is not held up by it
+            job = run_async(lambda: 'plan read')
+            start_time = time.time()
+            while not job.done() and time.time() - start_time < 1:
+                time.sleep(0.01)
+            self.assertTrue(job.done())
+            self.assertEqual(job.get(), 'plan read')
+        finally:
+            release.set()
+
+        # once it returns the service can be called again
+        start_time = time.time()
+        while client._in_flight and time.time() - start_time < 1:
+            time.sleep(0.01)
+        client.fn = lambda: 'ok'
+        self.assertEqual(client.call(), 'ok')
+
+    def test_clients_are_shared(self):
+        client = FakeClient('test_shared', fail)
+        self.assertIs(get_client('test_shared', None), client)
+
+
+if __name__ == '__main__':
+    unittest.main()
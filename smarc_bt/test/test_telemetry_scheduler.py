@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from telemetry_scheduler import TelemetryChannel, TelemetryScheduler
+
+
+class FakeMsg(object):
+    def __init__(self, size):
+        self.size = size
+
+    def serialize(self, buff):
+        buff.write(b'x' * self.size)
+
+
+class FakePublisher(object):
+    def __init__(self):
+        self.published = []
+
+    def publish(self, msg):
+        self.published.append(msg)
+
+
+class TestTelemetryChannel(unittest.TestCase):
+    def setUp(self):
+        self.channel = TelemetryChannel('test', min_period=1., heartbeat_period=5., bandwidth_window=10.)
+
+    def test_first_message_is_sent(self):
+        self.assertTrue(self.channel.should_send('a', 0.))
+
+    def test_change_within_min_period_is_held(self):
+        self.channel.record('a', 10, 0.)
+        self.assertFalse(self.channel.should_send('b', 0.5))
+
+    def test_change_after_min_period_is_sent(self):
+        self.channel.record('a', 10, 0.)
+        self.assertTrue(self.channel.should_send('b', 1.))
+
+    def test_unchanged_key_waits_for_heartbeat(self):
+        self.channel.record('a', 10, 0.)
+        self.assertFalse(self.channel.should_send('a', 2.))
+        self.assertFalse(self.channel.should_send('a', 4.9))
+        self.assertTrue(self.channel.should_send('a', 5.))
+
+    def test_heartbeat_is_at_least_min_period(self):
+        channel = TelemetryChannel('test', min_period=3., heartbeat_period=1.)
+        channel.record('a', 10, 0.)
+        self.assertFalse(channel.should_send('a', 2.))
+        self.assertTrue(channel.should_send('a', 3.))
+
+    def test_bandwidth_window_is_trimmed(self):
+        self.channel.record('a', 100, 0.)
+        self.channel.record('b', 50, 6.)
+        self.assertAlmostEqual(self.channel.bandwidth(now=8.), 150 / 10.)
+        # the first message is older than the window now
+        self.assertAlmostEqual(self.channel.bandwidth(now=12.), 50 / 10.)
+        self.assertEqual(len(self.channel._window), 1)
+        self.assertAlmostEqual(self.channel.bandwidth(now=20.), 0.)
+        self.assertEqual(self.channel.sent_bytes, 150)
+
+
+class TestTelemetryScheduler(unittest.TestCase):
+    def test_publish_skips_unchanged(self):
+        scheduler = TelemetryScheduler()
+        scheduler.add_channel('test', min_period=0., heartbeat_period=100.)
+        pub = FakePublisher()
+        self.assertTrue(scheduler.publish('test', pub, FakeMsg(8), 'a'))
+        self.assertFalse(scheduler.publish('test', pub, FakeMsg(8), 'a'))
+        self.assertTrue(scheduler.publish('test', pub, FakeMsg(8), 'b'))
+        self.assertTrue(scheduler.publish('test', pub, FakeMsg(8), 'b', force=True))
+        self.assertEqual(len(pub.published), 3)
+        channel = scheduler._channels['test']
+        self.assertEqual(channel.skipped_count, 1)
+        self.assertEqual(channel.sent_bytes, 24)
+
+    def test_message_size(self):
+        self.assertEqual(TelemetryScheduler.message_size(FakeMsg(12)), 12)
+        self.assertEqual(TelemetryScheduler.message_size(object()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()